@@ -0,0 +1,114 @@
+"""
+Benchmark API payload serialization of mllp_hl7.py (cost per message).
+
+Compares the previous path (payload dict, json.dumps(indent=2) for the
+preview, then json= serialization again by requests) against
+encode_api_payload (one compact UTF-8 encoding reused for sending and
+preview), with and without gzip. Needs no database or API server.
+
+Usage:
+    python benchmarks/bench_api_payload.py --panels 5,25,300 --messages 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mllp_hl7 import HL7ParserGUI
+from bench_save_stage import make_results
+
+
+class PayloadStage:
+    """The payload methods of HL7ParserGUI without the GUI"""
+    API_PAYLOAD_ENCODER = HL7ParserGUI.API_PAYLOAD_ENCODER
+    API_GZIP_MIN_BYTES = HL7ParserGUI.API_GZIP_MIN_BYTES
+    build_api_payload = HL7ParserGUI.build_api_payload
+    abnormal_status = staticmethod(HL7ParserGUI.abnormal_status)
+    encode_api_payload = HL7ParserGUI.encode_api_payload
+    compress_api_body = HL7ParserGUI.compress_api_body
+
+    def __init__(self, use_gzip):
+        self.api_config = {'gzip': use_gzip}
+
+
+def build_previous(patient, results, data_format):
+    """The previous implementation: per-result strip() normalisation into a dict"""
+    payload = {
+        "timestamp": datetime.now().isoformat(),
+        "source": "HL7_Parser_LIMS",
+        "data_format": data_format,
+        "patient": {
+            "patient_id": patient.get("patient_id", ""),
+            "sample_time": patient.get("sample_time", "")
+        }
+    }
+    payload["patient"]["total_results"] = len(results)
+    payload["laboratory_results"] = []
+    for result in results:
+        value = result.get('value', '-')
+        units = result.get('units', '-')
+        ref_range = result.get('reference_range', '-')
+        abnormal_flag = result.get('abnormal_flag', '-')
+        value = value if value and value.strip() else '-'
+        units = units if units and units.strip() else '-'
+        ref_range = ref_range if ref_range and ref_range.strip() else '-'
+        abnormal_flag = abnormal_flag if abnormal_flag and abnormal_flag.strip() else '-'
+        if abnormal_flag == '-':
+            status = 'normal'
+        elif abnormal_flag.upper() in ['NORMAL', 'N', 'normal', 'n', '']:
+            status = 'normal'
+        else:
+            status = 'abnormal'
+        payload["laboratory_results"].append({
+            "test_name": result.get('test_name', ''),
+            "value": value,
+            "units": units,
+            "reference_range": ref_range,
+            "abnormal_flag": abnormal_flag if abnormal_flag != '-' else None,
+            "status": status
+        })
+    return payload
+
+
+def previous_path(patient, results):
+    payload = build_previous(patient, results, 'HL7')
+    json.dumps(payload, indent=2, ensure_ascii=False)   # preview
+    return json.dumps(payload).encode('utf-8')          # what requests sends with json=
+
+
+def run(strategy, messages):
+    started = time.perf_counter()
+    for _ in range(messages):
+        body = strategy()
+    return (time.perf_counter() - started) * 1e6 / messages, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--panels', default='5,25,300', help='Comma separated results-per-message sizes')
+    args = parser.parse_args()
+
+    patient = {'patient_id': 'P000123', 'sample_time': '20240101083000'}
+    compact, gzipped = PayloadStage(False), PayloadStage(True)
+
+    print(f"{'panel':>6} {'strategy':>12} {'us/msg':>10} {'bytes':>8}")
+    for panel_size in [int(p) for p in args.panels.split(',')]:
+        results = make_results(panel_size)
+        strategies = (
+            ('previous', lambda: previous_path(patient, results)),
+            ('compact', lambda: compact.encode_api_payload(patient, results, 'HL7')),
+            ('compact+gz', lambda: gzipped.compress_api_body(
+                gzipped.encode_api_payload(patient, results, 'HL7'), {})),
+        )
+        for name, strategy in strategies:
+            us, size = run(strategy, args.messages)
+            print(f"{panel_size:>6} {name:>12} {us:>10.1f} {size:>8}")
+
+
+if __name__ == '__main__':
+    main()
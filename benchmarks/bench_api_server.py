@@ -0,0 +1,179 @@
+"""
+Benchmark lab_server_api.py: Flask development server vs production mode.
+
+Starts the API once per mode (authentication off) against a local
+Postgres and drives a mix of health, stats, submit and paginated read
+requests from concurrent keep-alive clients. Reports requests per
+second and p50/p99 latency. Creates the patients / hematology_results
+tables if missing and writes to them, so point it at a scratch database.
+
+Usage:
+    python benchmarks/bench_api_server.py --database lab_bench --user postgres --concurrency 32 --duration 20
+"""
+import argparse
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import psycopg2
+import requests
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lab_server_api.py')
+
+
+def create_tables(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS patients (
+            patients_id SERIAL PRIMARY KEY,
+            first_name VARCHAR(100),
+            last_name VARCHAR(100),
+            dob DATE,
+            sex VARCHAR(10)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS hematology_results (
+            hematology_id SERIAL PRIMARY KEY,
+            patient_id INTEGER REFERENCES patients(patients_id),
+            test_name VARCHAR(100),
+            value VARCHAR(100),
+            units VARCHAR(50),
+            reference_range VARCHAR(100),
+            abnormal_flag VARCHAR(20)
+        )
+    """)
+    conn.commit()
+    cur.close()
+
+
+def make_submission(n):
+    return {
+        'patient': {'first_name': f'Bench{n % 500}', 'last_name': 'Patient',
+                    'date_of_birth': '19800101', 'sex': 'F'},
+        'laboratory_results': [{
+            'test_name': f'TEST{i:02d}', 'value': f'{i * 1.5:.1f}', 'units': '10^9/L',
+            'reference_range': '4.0-10.0', 'abnormal_flag': 'H' if i % 7 == 0 else None
+        } for i in range(25)]
+    }
+
+
+def start_server(mode, args):
+    command = [sys.executable, SERVER, '--mode', mode, '--host', '127.0.0.1', '--port', str(args.port),
+               '--workers', str(args.workers), '--threads', str(args.threads), '--no-auth',
+               '--db-host', args.host, '--database', args.database,
+               '--db-user', args.user, '--db-password', args.password]
+    # Own process group: the dev server's reloader child and gunicorn workers are stopped with it
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              start_new_session=(os.name != 'nt'))
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if requests.get(f'http://127.0.0.1:{args.port}/api/health', timeout=1).ok:
+                return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def stop_server(server):
+    # SIGTERM lets both servers finish in-flight requests
+    if os.name != 'nt':
+        os.killpg(server.pid, signal.SIGTERM)
+    else:
+        server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def client(base, duration, counter, latencies, errors, lock):
+    session = requests.Session()
+    requests_mix = itertools.cycle(('health', 'submit', 'read', 'stats'))
+    stop_at = time.perf_counter() + duration
+    local_latencies = []
+    local_errors = 0
+    while time.perf_counter() < stop_at:
+        kind = next(requests_mix)
+        n = next(counter)
+        started = time.perf_counter()
+        try:
+            if kind == 'health':
+                response = session.get(f'{base}/api/health', timeout=30)
+            elif kind == 'submit':
+                response = session.post(f'{base}/api/lab/results', json=make_submission(n), timeout=30)
+            elif kind == 'read':
+                response = session.get(f'{base}/api/lab/results/{n % 500 + 1}?limit=50', timeout=30)
+            else:
+                response = session.get(f'{base}/api/stats', timeout=30)
+            if response.status_code >= 500:
+                local_errors += 1
+        except requests.RequestException:
+            local_errors += 1
+        local_latencies.append((time.perf_counter() - started) * 1000)
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(mode, args):
+    server = start_server(mode, args)
+    try:
+        base = f'http://127.0.0.1:{args.port}'
+        counter = itertools.count()
+        latencies, errors, lock = [], [0], threading.Lock()
+        threads = [threading.Thread(target=client, args=(base, args.duration, counter, latencies, errors, lock))
+                   for _ in range(args.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_server(server)
+    return len(latencies) / elapsed, latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--database', required=True)
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', default='')
+    parser.add_argument('--port', type=int, default=5099, help='Port the API is started on')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per mode')
+    parser.add_argument('--modes', default='development,production')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(host=args.host, database=args.database, user=args.user, password=args.password)
+    create_tables(conn)
+    conn.close()
+
+    print(f"{args.concurrency} clients, {args.duration:.0f} s per mode, "
+          f"production = {args.workers} workers x {args.threads} threads")
+    print(f"{'mode':>12} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for mode in args.modes.split(','):
+        rps, latencies, errors = run(mode, args)
+        print(f"{mode:>12} {rps:>9.1f} {percentile(latencies, 50):>8.1f} "
+              f"{percentile(latencies, 99):>8.1f} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
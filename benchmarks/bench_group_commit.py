@@ -0,0 +1,151 @@
+"""
+Benchmark the group-commit database writer of mllp_hl7.py.
+
+Offers messages at a fixed rate and reports sustained throughput and
+p50/p99 save latency (queue wait + commit) for several batch_size /
+flush_ms settings. batch_size=1 is the old commit-per-message behaviour.
+Runs against TEMP tables, so nothing is left behind.
+
+Usage:
+    python benchmarks/bench_group_commit.py --database lims --user postgres --rate 200 --p99-target-ms 250
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mllp_hl7 import HL7ParserGUI
+from bench_save_stage import create_temp_tables, make_results
+
+
+class WriterHarness:
+    """The writer methods of HL7ParserGUI on top of a single direct connection"""
+    COPY_RESULTS_THRESHOLD = HL7ParserGUI.COPY_RESULTS_THRESHOLD
+    build_result_rows = HL7ParserGUI.build_result_rows
+    insert_test_record = HL7ParserGUI.insert_test_record
+    copy_test_results = HL7ParserGUI.copy_test_results
+    results_partitioned = False
+    db_writer_loop = HL7ParserGUI.db_writer_loop
+    write_save_batch = HL7ParserGUI.write_save_batch
+    execute_save_jobs = HL7ParserGUI.execute_save_jobs
+    forget_pending_hash = HL7ParserGUI.forget_pending_hash
+
+    def __init__(self, conn, batch_size, flush_ms):
+        self.conn = conn
+        self.db_writer_config = {'batch_size': batch_size, 'flush_ms': flush_ms}
+        self.db_write_queue = queue.Queue()
+        self.db_writer_running = True
+        self.db_dedup_available = False
+        self.save_spool = self
+        self.latencies = []
+        self.failures = 0
+
+    def get_db_connection(self):
+        return self.conn
+
+    def release_db_connection(self, conn, close=False):
+        pass
+
+    def has_pending(self, job):
+        # Stands in for the save spool: nothing is ever spooled here
+        return False
+
+    def spool_save_job(self, job, error):
+        self.report_save_outcome(job, None, error, 1)
+
+    def get_device_id(self, cur, device_key):
+        return 1
+
+    def cache_device_id(self, device_key, device_id):
+        pass
+
+    def report_save_outcome(self, job, record_id, error, batch_size):
+        self.latencies.append((time.perf_counter() - job['enqueued_at']) * 1000)
+        if error is not None:
+            self.failures += 1
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(conn, batch_size, flush_ms, rate, duration, panel_size):
+    harness = WriterHarness(conn, batch_size, flush_ms)
+    rows = harness.build_result_rows(make_results(panel_size))
+    writer = threading.Thread(target=harness.db_writer_loop, daemon=True)
+    writer.start()
+
+    started = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - started < duration:
+        target = started + sent / rate
+        delay = target - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        harness.db_write_queue.put({
+            'device_key': ('socket', 'bench', 'Bench', '', ''),
+            'device_type': 'socket',
+            'device_identifier': 'bench',
+            'patient_id': f'P{sent}',
+            'sample_time': datetime.now(),
+            'data_format': 'HL7',
+            'total_results': len(rows),
+            'result_rows': rows,
+            'enqueued_at': time.perf_counter(),
+            'future': Future()
+        })
+        sent += 1
+
+    harness.db_writer_running = False
+    writer.join()
+    elapsed = time.perf_counter() - started
+    return sent / elapsed, harness.latencies, harness.failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    parser.add_argument('--database', required=True)
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', default='')
+    parser.add_argument('--rate', type=float, default=200, help='Offered messages per second')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per setting')
+    parser.add_argument('--panel', type=int, default=25, help='Results per message')
+    parser.add_argument('--p99-target-ms', type=float, default=250)
+    parser.add_argument('--settings', default='1:0,10:50,50:200,200:500',
+                        help='Comma separated batch_size:flush_ms pairs')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(host=args.host, port=args.port, database=args.database,
+                            user=args.user, password=args.password)
+    cur = conn.cursor()
+    create_temp_tables(cur)
+    conn.commit()
+    cur.close()
+
+    print(f"offered {args.rate:.0f} msg/s, {args.panel} results/msg, p99 target {args.p99_target_ms:.0f} ms")
+    print(f"{'batch':>6} {'flush_ms':>9} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7} {'target':>7}")
+    for setting in args.settings.split(','):
+        batch_size, flush_ms = (int(v) for v in setting.split(':'))
+        throughput, latencies, failures = run(conn, batch_size, flush_ms, args.rate, args.duration, args.panel)
+        p99 = percentile(latencies, 99)
+        print(f"{batch_size:>6} {flush_ms:>9} {throughput:>9.1f} {percentile(latencies, 50):>8.1f} "
+              f"{p99:>8.1f} {failures:>7} {'ok' if p99 <= args.p99_target_ms else 'MISS':>7}")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
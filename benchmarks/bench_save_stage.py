@@ -0,0 +1,129 @@
+"""
+Benchmark the database save stage of mllp_hl7.py (results written per second).
+
+Compares the old one-INSERT-per-result loop against insert_test_record
+(single multi-row statement, COPY for large panels). Runs against TEMP
+copies of test_records / test_results, so nothing is left behind.
+
+Usage:
+    python benchmarks/bench_save_stage.py --host localhost --database lims --user postgres --password secret
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mllp_hl7 import HL7ParserGUI
+
+
+class SaveStage:
+    """The save methods of HL7ParserGUI without the GUI"""
+    COPY_RESULTS_THRESHOLD = HL7ParserGUI.COPY_RESULTS_THRESHOLD
+    build_result_rows = HL7ParserGUI.build_result_rows
+    insert_test_record = HL7ParserGUI.insert_test_record
+    copy_test_results = HL7ParserGUI.copy_test_results
+    results_partitioned = False
+
+
+def make_results(count):
+    return [{
+        'test_name': f'TEST{i:03d}',
+        'value': f'{i * 1.5:.1f}',
+        'units': '10^9/L',
+        'reference_range': '4.0-10.0',
+        'abnormal_flag': 'H' if i % 7 == 0 else ''
+    } for i in range(count)]
+
+
+def create_temp_tables(cur):
+    cur.execute("""
+        CREATE TEMP TABLE test_records (
+            record_id SERIAL PRIMARY KEY,
+            device_id INTEGER,
+            patient_id VARCHAR(100),
+            sample_time TIMESTAMP,
+            data_format VARCHAR(50),
+            total_results INTEGER
+        )
+    """)
+    cur.execute("""
+        CREATE TEMP TABLE test_results (
+            result_id SERIAL PRIMARY KEY,
+            record_id INTEGER REFERENCES test_records(record_id),
+            test_name VARCHAR(100),
+            test_value VARCHAR(100),
+            test_units VARCHAR(50),
+            reference_range VARCHAR(100),
+            abnormal_flag VARCHAR(20)
+        )
+    """)
+
+
+def save_per_row(cur, rows):
+    """The previous implementation: one round trip per result"""
+    cur.execute("""
+        INSERT INTO test_records
+        (device_id, patient_id, sample_time, data_format, total_results)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING record_id
+    """, (1, 'BENCH', datetime.now(), 'HL7', len(rows)))
+    record_id = cur.fetchone()[0]
+    for row in rows:
+        cur.execute("""
+            INSERT INTO test_results
+            (record_id, test_name, test_value, test_units,
+            reference_range, abnormal_flag)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (record_id,) + row)
+
+
+def save_batched(cur, rows, stage=SaveStage()):
+    stage.insert_test_record(cur, 1, 'BENCH', datetime.now(), 'HL7', len(rows), rows)
+
+
+def run(conn, strategy, panel_size, messages):
+    rows = SaveStage().build_result_rows(make_results(panel_size))
+    cur = conn.cursor()
+    started = time.perf_counter()
+    for _ in range(messages):
+        strategy(cur, rows)
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    cur.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5432)
+    parser.add_argument('--database', required=True)
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', default='')
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--panels', default='25,300', help='Comma separated results-per-message sizes')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(host=args.host, port=args.port, database=args.database,
+                            user=args.user, password=args.password)
+    cur = conn.cursor()
+    create_temp_tables(cur)
+    conn.commit()
+    cur.close()
+
+    print(f"{'panel':>6} {'strategy':>12} {'msg/s':>10} {'results/s':>12} {'ms/msg':>8}")
+    for panel_size in [int(p) for p in args.panels.split(',')]:
+        for name, strategy in (('per-row', save_per_row), ('batched', save_batched)):
+            elapsed = run(conn, strategy, panel_size, args.messages)
+            print(f"{panel_size:>6} {name:>12} {args.messages / elapsed:>10.1f} "
+                  f"{args.messages * panel_size / elapsed:>12.1f} {elapsed * 1000 / args.messages:>8.2f}")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2 import pool as pg_pool
+from psycopg2 import extensions as pg_extensions
 import json
+import os
+import sys
+import signal
+import argparse
+import gzip
 import logging
+import threading
+import time
+import atexit
 from functools import wraps
+from collections import OrderedDict
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for cross-origin requests
@@ -22,7 +34,19 @@ API_CONFIG = {
     'REQUIRE_AUTH': True,  # Set to False to disable authentication
     'HOST': '0.0.0.0',
     'PORT': 5050,
-    'DEBUG': True
+    'DEBUG': True,
+    'MAX_BATCH_SIZE': 1000,  # Submissions per /api/lab/results/batch request
+    'PATIENT_CACHE_SIZE': 10000,  # Recent patient keys remembered in-process
+    'RESULTS_PAGE_SIZE': 500,     # Default page of GET /api/lab/results/<id>
+    'MAX_RESULTS_PAGE_SIZE': 5000,
+    'STREAM_FETCH_SIZE': 1000,    # Rows per round trip of streamed (NDJSON) results
+    'STATS_CACHE_TTL': 5,         # Seconds the /api/stats recent-patients list is reused
+    'IDEMPOTENCY_TTL_DAYS': 7,    # Replays of a submission are recognised this long
+    'SERVER_MODE': 'development',  # 'production' = multi-worker server, debug off (--mode)
+    'WORKERS': min(2 * (os.cpu_count() or 1) + 1, 8),  # Production worker processes
+    'THREADS': 4,                 # Threads per worker
+    'REQUEST_TIMEOUT': 30,        # Seconds before a stuck worker / idle channel is dropped
+    'GRACEFUL_TIMEOUT': 30        # Seconds gunicorn workers get to finish in-flight requests on shutdown
 }
 
 # Database Configuration
@@ -33,6 +57,16 @@ DB_CONFIG = {
     'password': '-',
 }
 
+# Connection Pool Configuration
+DB_POOL_CONFIG = {
+    'MIN_CONNECTIONS': 2,
+    'MAX_CONNECTIONS': 20,       # Per process; production mode lowers it to fit TOTAL_CONNECTIONS
+    'TOTAL_CONNECTIONS': 80,     # All worker processes together: Postgres max_connections (100) minus headroom
+    'CHECKOUT_TIMEOUT': 10,      # Seconds to wait for a free connection
+    'MAX_AGE': 1800,             # Recycle connections older than this (seconds)
+    'VALIDATE_AFTER_IDLE': 30    # Ping connections idle longer than this (seconds)
+}
+
 # API Key Authentication Decorator
 def require_api_key(f):
     @wraps(f)
@@ -71,86 +105,596 @@ def require_api_key(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Database Connection Pool
+class ConnectionPool:
+    """Thread-safe psycopg2 pool that blocks when exhausted, validates idle and recycles old connections"""
+
+    def __init__(self, config, pool_config):
+        self.config = pool_config
+        self.pool = pg_pool.ThreadedConnectionPool(
+            pool_config['MIN_CONNECTIONS'], pool_config['MAX_CONNECTIONS'], **config
+        )
+        self.slots = threading.BoundedSemaphore(pool_config['MAX_CONNECTIONS'])
+        self.lock = threading.Lock()
+        self.created = {}     # id(conn) -> time the connection was opened
+        self.last_used = {}   # id(conn) -> time the connection was returned
+        self.in_use = 0
+
+    def getconn(self):
+        if not self.slots.acquire(timeout=self.config['CHECKOUT_TIMEOUT']):
+            raise pg_pool.PoolError("Timed out waiting for a database connection")
+        try:
+            for _ in range(self.config['MAX_CONNECTIONS'] + 1):
+                conn = self.pool.getconn()
+                now = time.monotonic()
+                with self.lock:
+                    created = self.created.setdefault(id(conn), now)
+                    last_used = self.last_used.get(id(conn), now)
+                
+                if conn.closed or now - created > self.config['MAX_AGE']:
+                    self.discard(conn)
+                    continue
+                if now - last_used > self.config['VALIDATE_AFTER_IDLE']:
+                    try:
+                        cur = conn.cursor()
+                        cur.execute("SELECT 1")
+                        cur.close()
+                        conn.rollback()
+                    except Exception as e:
+                        logger.warning(f"Discarding broken pooled connection: {str(e)}")
+                        self.discard(conn)
+                        continue
+                
+                with self.lock:
+                    self.in_use += 1
+                return conn
+            raise pg_pool.PoolError("No usable database connection")
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            broken = bool(conn.closed)
+            if not broken and conn.get_transaction_status() != pg_extensions.TRANSACTION_STATUS_IDLE:
+                # Never hand out a connection with an open or failed transaction
+                conn.rollback()
+        except Exception:
+            broken = True
+        
+        try:
+            if broken:
+                self.discard(conn)
+            else:
+                with self.lock:
+                    self.last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn)
+        finally:
+            with self.lock:
+                self.in_use -= 1
+            self.slots.release()
+
+    def discard(self, conn):
+        """Close a connection and forget it; the pool opens a replacement on demand"""
+        with self.lock:
+            self.created.pop(id(conn), None)
+            self.last_used.pop(id(conn), None)
+        self.pool.putconn(conn, close=True)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_use': self.in_use,
+                'open': len(self.created),
+                'max': self.config['MAX_CONNECTIONS']
+            }
+
+    def close(self):
+        self.pool.closeall()
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    """Process-wide connection pool, created on first use"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ConnectionPool(DB_CONFIG, DB_POOL_CONFIG)
+            atexit.register(_db_pool.close)
+        return _db_pool
+
+class PatientCache:
+    """Thread-safe LRU of patient natural key -> patients_id"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            patient_id = self.entries.get(key)
+            if patient_id is not None:
+                self.entries.move_to_end(key)
+            return patient_id
+
+    def put_many(self, mapping):
+        with self.lock:
+            for key, patient_id in mapping.items():
+                self.entries[key] = patient_id
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def discard_id(self, patient_id):
+        with self.lock:
+            for key in [k for k, v in self.entries.items() if v == patient_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+patient_cache = PatientCache(API_CONFIG['PATIENT_CACHE_SIZE'])
+
+class TTLCache:
+    """Single value recomputed at most once per ttl seconds"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.value = None
+        self.expires = 0
+        self.lock = threading.Lock()
+
+    def get(self, loader):
+        with self.lock:
+            if time.monotonic() >= self.expires:
+                self.value = loader()
+                self.expires = time.monotonic() + self.ttl
+            return self.value
+
+    def clear(self):
+        with self.lock:
+            self.expires = 0
+
+recent_patients_cache = TTLCache(API_CONFIG['STATS_CACHE_TTL'])
+
 # Database Helper Functions
 def get_db_connection():
-    """Create database connection"""
+    """Pooled database connection of the current request (returned on teardown)"""
+    if 'db_conn' not in g:
+        try:
+            g.db_conn = get_db_pool().getconn()
+        except Exception as e:
+            logger.error(f"Database connection error: {str(e)}")
+            raise
+    return g.db_conn
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_db_pool().putconn(conn)
+
+def parse_dob(patient):
+    """Convert DOB from YYYYMMDD to date object (None when missing or invalid)"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
+        dob_str = patient.get('date_of_birth', '')
+        if dob_str:
+            return datetime.strptime(dob_str, "%Y%m%d").date()
     except Exception as e:
-        logger.error(f"Database connection error: {str(e)}")
-        raise
+        logger.warning(f"Invalid DOB format: {e}")
+    return None
 
-def save_to_database(data):
-    """Save laboratory results to database"""
-    conn = None
+# Fields stored as text: strings or null (results may also send numeric values)
+PATIENT_TEXT_FIELDS = ('first_name', 'last_name', 'date_of_birth', 'sex', 'mrn')
+RESULT_TEXT_FIELDS = ('test_name', 'units', 'reference_range', 'abnormal_flag')
+
+def validate_submission(data):
+    """Error message for an invalid submission, None when it can be stored"""
+    if not isinstance(data, dict):
+        return 'Submission must be a JSON object'
+    if 'patient' not in data:
+        return 'Patient data is required'
+    if not isinstance(data['patient'], dict):
+        return 'Patient data must be an object'
+    for field in PATIENT_TEXT_FIELDS:
+        if not isinstance(data['patient'].get(field), (str, type(None))):
+            return f'patient.{field} must be a string'
+    if 'laboratory_results' not in data:
+        return 'Laboratory results are required'
+    if not isinstance(data['laboratory_results'], list):
+        return 'Laboratory results must be an array'
+    for index, result in enumerate(data['laboratory_results']):
+        if not isinstance(result, dict):
+            return f'laboratory_results[{index}] must be an object'
+        for field in RESULT_TEXT_FIELDS:
+            if not isinstance(result.get(field), (str, type(None))):
+                return f'laboratory_results[{index}].{field} must be a string'
+        value = result.get('value')
+        if isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))):
+            return f'laboratory_results[{index}].value must be a string or number'
+    return None
+
+def read_json_body():
+    """Parsed request body; NDJSON becomes a list and gzip Content-Encoding is accepted"""
+    raw = request.get_data()
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        raw = gzip.decompress(raw)
+    if request.mimetype == 'application/x-ndjson':
+        return [json.loads(line) for line in raw.splitlines() if line.strip()]
+    return json.loads(raw)
+
+def ensure_api_schema():
+    """
+    Columns, indexes, tables and row counters this API relies on.
+    Run once at startup (or with --migrate) on its own connection, never from a
+    request: the index builds and counter seeding can take a while on big tables.
+    """
+    conn = psycopg2.connect(**DB_CONFIG)
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
-        
-        # Extract patient data
-        patient = data.get('patient', {})
-        
-        # Convert DOB from YYYYMMDD to date object
-        dob = None
-        try:
-            dob_str = patient.get('date_of_birth', '')
-            if dob_str:
-                dob = datetime.strptime(dob_str, "%Y%m%d").date()
-        except Exception as e:
-            logger.warning(f"Invalid DOB format: {e}")
-        
-        # Insert or update patient
+        # CONCURRENTLY keeps large tables writable while an index is built
+        conn.autocommit = True
+        # Natural key of the patient upsert
+        cur.execute("ALTER TABLE patients ADD COLUMN IF NOT EXISTS patient_key TEXT")
+        cur.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS patients_patient_key_key "
+                    "ON patients (patient_key)")
+        backfill_patient_keys(cur)
+        # Keyset pagination of a patient's results
+        cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS hematology_results_patient_id_idx "
+                    "ON hematology_results (patient_id, hematology_id)")
+        # Replayed submissions (client retries) are recognised by their idempotency_key
         cur.execute("""
+            CREATE TABLE IF NOT EXISTS api_idempotency_keys (
+                idempotency_key TEXT PRIMARY KEY,
+                patient_id INTEGER,
+                results_count INTEGER,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS api_idempotency_keys_created_at_idx "
+                    "ON api_idempotency_keys (created_at)")
+        conn.autocommit = False
+        ensure_row_counters(cur, ('patients', 'hematology_results'))
+        cur.close()
+    finally:
+        conn.close()
+
+# Row counters are sharded so concurrent writers do not queue on one counter row
+COUNTER_SHARDS = 16
+
+def ensure_row_counters(cur, tables):
+    """Trigger-maintained row counts in api_counters, seeded once with COUNT(*)"""
+    # One installer at a time across server processes
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('api_counters'))")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS api_counters (
+            name TEXT NOT NULL,
+            shard INTEGER NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, shard)
+        )
+    """)
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION api_count_rows() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            delta BIGINT;
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                DELETE FROM api_counters WHERE name = TG_TABLE_NAME;
+                RETURN NULL;
+            ELSIF TG_OP = 'INSERT' THEN
+                SELECT count(*) INTO delta FROM new_rows;
+            ELSE
+                SELECT -count(*) INTO delta FROM old_rows;
+            END IF;
+            IF delta <> 0 THEN
+                INSERT INTO api_counters (name, shard, value)
+                VALUES (TG_TABLE_NAME, pg_backend_pid() % {COUNTER_SHARDS}, delta)
+                ON CONFLICT (name, shard) DO UPDATE SET value = api_counters.value + EXCLUDED.value;
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    """)
+    
+    for table in tables:
+        cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s", (f"{table}_count_insert",))
+        if cur.fetchone():
+            continue
+        # Writers wait while the table is counted, so the seed and the triggers agree
+        cur.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+        # Statement-level triggers with transition tables: one counter update per statement
+        cur.execute(f"""
+            CREATE TRIGGER {table}_count_insert AFTER INSERT ON {table}
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION api_count_rows()
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER {table}_count_delete AFTER DELETE ON {table}
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION api_count_rows()
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER {table}_count_truncate AFTER TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION api_count_rows()
+        """)
+        cur.execute("DELETE FROM api_counters WHERE name = %s", (table,))
+        cur.execute(f"INSERT INTO api_counters (name, shard, value) SELECT %s, 0, COUNT(*) FROM {table}", (table,))
+        logger.info(f"Row counter triggers installed on {table}")
+    cur.connection.commit()
+
+def get_row_counts(cur):
+    """{table: row count} from api_counters (a handful of rows, whatever the table sizes)"""
+    cur.execute("SELECT name, SUM(value) FROM api_counters GROUP BY name")
+    return {name: int(value) for name, value in cur.fetchall()}
+
+# Values instruments and the parser send when a field is unknown
+PLACEHOLDER_VALUES = {'', '-', 'unknown'}
+
+def key_part(value):
+    """Normalized natural-key component; '' for missing or placeholder values"""
+    value = str(value or '').strip()
+    return '' if value.lower() in PLACEHOLDER_VALUES else value
+
+def patient_key(patient, dob):
+    """
+    Natural key of a patient: an explicit MRN when sent, else first + last name + DOB (+ sex).
+    Anything less is not an identity and is never merged; send an MRN where two
+    patients can share name, DOB and sex.
+    """
+    mrn = key_part(patient.get('mrn'))
+    if mrn:
+        return f"mrn:{mrn}"
+    parts = [
+        key_part(patient.get('first_name')).lower(),
+        key_part(patient.get('last_name')).lower(),
+        dob.isoformat() if dob else '',
+        key_part(patient.get('sex')).upper()
+    ]
+    if not all(parts[:3]):
+        return None
+    return "name:" + "|".join(parts)
+
+# patient_key() in SQL, for rows stored before the key existed
+PATIENT_KEY_SQL = """
+    'name:' || lower(trim(first_name)) || '|' || lower(trim(last_name)) || '|' || to_char(dob, 'YYYY-MM-DD') || '|' ||
+    CASE WHEN lower(trim(COALESCE(sex, ''))) IN ('', '-', 'unknown') THEN '' ELSE upper(trim(sex)) END
+"""
+
+def backfill_patient_keys(cur):
+    """Key old patients so the upsert finds them; of existing duplicates only the oldest row is keyed"""
+    placeholders = tuple(PLACEHOLDER_VALUES)
+    cur.execute(f"""
+        UPDATE patients AS p
+        SET patient_key = k.patient_key
+        FROM (
+            SELECT DISTINCT ON (patient_key) patients_id, patient_key
+            FROM (
+                SELECT patients_id, {PATIENT_KEY_SQL} AS patient_key
+                FROM patients
+                WHERE patient_key IS NULL AND dob IS NOT NULL
+                  AND lower(trim(COALESCE(first_name, ''))) NOT IN %s
+                  AND lower(trim(COALESCE(last_name, ''))) NOT IN %s
+            ) AS candidates
+            ORDER BY patient_key, patients_id
+        ) AS k
+        WHERE p.patients_id = k.patients_id
+          AND NOT EXISTS (SELECT 1 FROM patients t WHERE t.patient_key = k.patient_key)
+    """, (placeholders, placeholders))
+    if cur.rowcount:
+        logger.info(f"Backfilled patient_key on {cur.rowcount} existing patients")
+
+def resolve_patient_ids(cur, patient_rows, keys):
+    """patients_id per submission, upserting unknown keys; also returns the new key -> id pairs
+    
+    Cached ids are verified in one round trip; stale entries are re-resolved.
+    """
+    ids = {}
+    for key in keys:
+        if key and key not in ids:
+            cached = patient_cache.get(key)
+            if cached is not None:
+                ids[key] = cached
+    
+    if ids:
+        # The cache is per process: another worker or client may have deleted a cached patient.
+        # FOR KEY SHARE also keeps the verified rows from being deleted until this transaction ends.
+        cur.execute("SELECT patients_id FROM patients WHERE patients_id = ANY(%s) FOR KEY SHARE",
+                    (list(set(ids.values())),))
+        alive = {row[0] for row in cur.fetchall()}
+        stale = [key for key, patient_id in ids.items() if patient_id not in alive]
+        if stale:
+            patient_cache.discard(stale)
+            for key in stale:
+                del ids[key]
+    
+    missing = {}
+    for row, key in zip(patient_rows, keys):
+        if key and key not in ids and key not in missing:
+            missing[key] = row
+    
+    if missing:
+        # DO NOTHING (not DO UPDATE) so repeat patients leave no dead row versions
+        ids.update(execute_values(cur, """
+            INSERT INTO patients (first_name, last_name, dob, sex, patient_key)
+            VALUES %s
+            ON CONFLICT (patient_key) DO NOTHING
+            RETURNING patient_key, patients_id
+        """, [row + (key,) for key, row in missing.items()], page_size=len(missing), fetch=True))
+        existing = [key for key in missing if key not in ids]
+        if existing:
+            cur.execute("SELECT patient_key, patients_id FROM patients WHERE patient_key = ANY(%s)", (existing,))
+            ids.update(cur.fetchall())
+    
+    anonymous = [row for row, key in zip(patient_rows, keys) if not key]
+    anonymous_ids = iter([])
+    if anonymous:
+        # A single INSERT (page_size covers every row) returns the ids in VALUES order
+        anonymous_ids = iter([row[0] for row in execute_values(cur, """
             INSERT INTO patients (first_name, last_name, dob, sex)
-            VALUES (%s, %s, %s, %s)
+            VALUES %s
             RETURNING patients_id
-        """, (
+        """, anonymous, page_size=len(anonymous), fetch=True)])
+    
+    patient_ids = [ids[key] if key else next(anonymous_ids) for key in keys]
+    return patient_ids, {key: ids[key] for key in missing}
+
+def write_submissions(cur, submissions):
+    """Insert patients and results of submissions; returns per-submission results and new patient keys"""
+    patient_rows = []
+    keys = []
+    for data in submissions:
+        patient = data.get('patient', {})
+        dob = parse_dob(patient)
+        patient_rows.append((
             patient.get('first_name'),
             patient.get('last_name'),
             dob,
             patient.get('sex')
         ))
-        
-        patient_id = cur.fetchone()[0]
-        
-        # Insert laboratory results
-        results = data.get('laboratory_results', [])
-        inserted_count = 0
-        
-        for result in results:
-            cur.execute("""
-                INSERT INTO hematology_results 
-                (patient_id, test_name, value, units, reference_range, abnormal_flag)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                patient_id,
-                result.get('test_name'),
-                result.get('value'),
-                result.get('units'),
-                result.get('reference_range'),
-                result.get('abnormal_flag')
-            ))
-            inserted_count += 1
+        keys.append(patient_key(patient, dob))
+    
+    patient_ids, new_keys = resolve_patient_ids(cur, patient_rows, keys)
+    
+    result_rows = [
+        (
+            patient_id,
+            result.get('test_name'),
+            result.get('value'),
+            result.get('units'),
+            result.get('reference_range'),
+            result.get('abnormal_flag')
+        )
+        for patient_id, data in zip(patient_ids, submissions)
+        for result in data.get('laboratory_results', [])
+    ]
+    if result_rows:
+        execute_values(cur, """
+            INSERT INTO hematology_results
+            (patient_id, test_name, value, units, reference_range, abnormal_flag)
+            VALUES %s
+        """, result_rows, page_size=1000)
+    
+    saved = [
+        {'patient_id': patient_id, 'results_count': len(data.get('laboratory_results', [])), 'duplicate': False}
+        for patient_id, data in zip(patient_ids, submissions)
+    ]
+    return saved, new_keys
+
+def claim_idempotency_keys(cur, keys):
+    """Claim unseen keys in this transaction; returns (claimed keys, {replayed key: stored result})"""
+    wanted = list(dict.fromkeys(k for k in keys if k))
+    if not wanted:
+        return set(), {}
+    # A concurrent request holding the same key makes this wait, then see the conflict
+    claimed = {row[0] for row in execute_values(cur, """
+        INSERT INTO api_idempotency_keys (idempotency_key)
+        VALUES %s
+        ON CONFLICT (idempotency_key) DO NOTHING
+        RETURNING idempotency_key
+    """, [(k,) for k in wanted], page_size=len(wanted), fetch=True)}
+    replayed = [k for k in wanted if k not in claimed]
+    stored = {}
+    if replayed:
+        cur.execute("""
+            SELECT idempotency_key, patient_id, results_count
+            FROM api_idempotency_keys
+            WHERE idempotency_key = ANY(%s)
+        """, (replayed,))
+        stored = {key: {'patient_id': patient_id, 'results_count': results_count, 'duplicate': True}
+                  for key, patient_id, results_count in cur.fetchall()}
+    return claimed, stored
+
+def purge_idempotency_keys(cur):
+    """Forget keys older than IDEMPOTENCY_TTL_DAYS (at most once an hour per process)"""
+    global _last_idempotency_purge
+    if time.monotonic() - _last_idempotency_purge < 3600:
+        return
+    _last_idempotency_purge = time.monotonic()
+    cur.execute("DELETE FROM api_idempotency_keys WHERE created_at < now() - make_interval(days => %s)",
+                (API_CONFIG['IDEMPOTENCY_TTL_DAYS'],))
+
+_last_idempotency_purge = 0.0
+
+def save_batch_to_database(submissions):
+    """
+    Save validated submissions in one transaction with multi-row inserts.
+    Submissions whose idempotency_key was already stored are not written again;
+    their result carries the stored ids and duplicate=True.
+    """
+    if not submissions:
+        return []
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        purge_idempotency_keys(cur)
+        
+        keys = [str(data['idempotency_key']) if data.get('idempotency_key') else None for data in submissions]
+        claimed, stored = claim_idempotency_keys(cur, keys)
+        
+        # First occurrence of every claimed key (and every keyless submission) is written
+        first_index = {}
+        to_write = []
+        for index, key in enumerate(keys):
+            if key is None or (key in claimed and key not in first_index):
+                to_write.append(index)
+                if key is not None:
+                    first_index[key] = index
+        
+        saved, new_keys = write_submissions(cur, [submissions[i] for i in to_write])
+        results = dict(zip(to_write, saved))
+        
+        claimed_rows = [(keys[i], results[i]['patient_id'], results[i]['results_count'])
+                        for i in to_write if keys[i] is not None]
+        if claimed_rows:
+            execute_values(cur, """
+                UPDATE api_idempotency_keys AS k
+                SET patient_id = v.patient_id, results_count = v.results_count
+                FROM (VALUES %s) AS v (idempotency_key, patient_id, results_count)
+                WHERE k.idempotency_key = v.idempotency_key
+            """, claimed_rows, page_size=1000)
         
         conn.commit()
         cur.close()
-        
-        logger.info(f"Saved patient {patient_id} with {inserted_count} test results")
-        
-        return {
-            'patient_id': patient_id,
-            'results_count': inserted_count
-        }
+        # Only committed ids are remembered
+        patient_cache.put_many(new_keys)
+        
+        output = []
+        for index, key in enumerate(keys):
+            if index in results:
+                output.append(results[index])
+            elif key in first_index:
+                # Repeated within this request
+                output.append(dict(results[first_index[key]], duplicate=True))
+            else:
+                output.append(stored.get(key, {'patient_id': None, 'results_count': 0, 'duplicate': True}))
+        return output
         
     except Exception as e:
         if conn:
             conn.rollback()
         logger.error(f"Database save error: {str(e)}")
         raise
-    finally:
-        if conn:
-            conn.close()
+
+def save_to_database(data):
+    """Save laboratory results to database"""
+    saved = save_batch_to_database([data])[0]
+    if saved['duplicate']:
+        logger.info(f"Replayed submission {data.get('idempotency_key')} ignored (patient {saved['patient_id']})")
+    else:
+        logger.info(f"Saved patient {saved['patient_id']} with {saved['results_count']} test results")
+    return saved
 
 # API Routes
 
@@ -164,6 +708,7 @@ def index():
         'timestamp': datetime.now().isoformat(),
         'endpoints': {
             '/api/lab/results': 'POST - Submit laboratory results',
+            '/api/lab/results/batch': 'POST - Submit many results (JSON array or NDJSON)',
             '/api/health': 'GET - Health check',
             '/api/stats': 'GET - API statistics'
         }
@@ -178,7 +723,6 @@ def health_check():
         cur = conn.cursor()
         cur.execute("SELECT 1")
         cur.close()
-        conn.close()
         
         db_status = 'connected'
     except Exception as e:
@@ -188,6 +732,7 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'database': db_status,
+        'pool': get_db_pool().stats() if _db_pool is not None else None,
         'authentication': 'enabled' if API_CONFIG['REQUIRE_AUTH'] else 'disabled'
     })
 
@@ -203,25 +748,14 @@ def receive_lab_results():
                 'message': 'Content-Type must be application/json'
             }), 400
         
-        data = request.get_json()
+        data = read_json_body()
         
         # Validate required fields
-        if 'patient' not in data:
+        error = validate_submission(data)
+        if error:
             return jsonify({
                 'status': 'error',
-                'message': 'Patient data is required'
-            }), 400
-        
-        if 'laboratory_results' not in data:
-            return jsonify({
-                'status': 'error',
-                'message': 'Laboratory results are required'
-            }), 400
-        
-        if not isinstance(data['laboratory_results'], list):
-            return jsonify({
-                'status': 'error',
-                'message': 'Laboratory results must be an array'
+                'message': error
             }), 400
         
         # Log received data
@@ -229,19 +763,25 @@ def receive_lab_results():
         logger.info(f"Patient: {data['patient'].get('first_name')} {data['patient'].get('last_name')}")
         logger.info(f"Results count: {len(data['laboratory_results'])}")
         
+        # A retried request is recognised by its key (body field or Idempotency-Key header)
+        if not data.get('idempotency_key') and request.headers.get('Idempotency-Key'):
+            data['idempotency_key'] = request.headers['Idempotency-Key']
+        
         # Save to database
         result = save_to_database(data)
         
         # Return success response
         return jsonify({
             'status': 'success',
-            'message': 'Laboratory results received and stored successfully',
+            'message': ('Laboratory results were already received' if result['duplicate']
+                        else 'Laboratory results received and stored successfully'),
             'data': {
                 'patient_id': result['patient_id'],
                 'results_count': result['results_count'],
+                'duplicate': result['duplicate'],
                 'timestamp': datetime.now().isoformat()
             }
-        }), 201
+        }), 200 if result['duplicate'] else 201
         
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
@@ -250,6 +790,86 @@ def receive_lab_results():
             'message': f'Failed to process laboratory results: {str(e)}'
         }), 500
 
+@app.route('/api/lab/results/batch', methods=['POST'])
+@require_api_key
+def receive_lab_results_batch():
+    """Receive many submissions (JSON array or NDJSON) and store them in one transaction"""
+    try:
+        if request.mimetype not in ('application/json', 'application/x-ndjson'):
+            return jsonify({
+                'status': 'error',
+                'message': 'Content-Type must be application/json or application/x-ndjson'
+            }), 400
+        
+        try:
+            submissions = read_json_body()
+        except (ValueError, OSError) as e:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid request body: {str(e)}'
+            }), 400
+        
+        if not isinstance(submissions, list) or not submissions:
+            return jsonify({
+                'status': 'error',
+                'message': 'Request body must be a non-empty array of submissions'
+            }), 400
+        
+        if len(submissions) > API_CONFIG['MAX_BATCH_SIZE']:
+            return jsonify({
+                'status': 'error',
+                'message': f"Batch too large: {len(submissions)} submissions (max {API_CONFIG['MAX_BATCH_SIZE']})"
+            }), 413
+        
+        # Validate everything first; only valid submissions are written
+        items = []
+        valid = []
+        for index, data in enumerate(submissions):
+            item = {'index': index}
+            if isinstance(data, dict) and data.get('idempotency_key'):
+                item['idempotency_key'] = data['idempotency_key']
+            error = validate_submission(data)
+            if error:
+                item.update({'status': 'error', 'message': error})
+            else:
+                valid.append(index)
+            items.append(item)
+        
+        logger.info(f"Received batch of {len(submissions)} submissions from {request.remote_addr} "
+                    f"({len(valid)} valid)")
+        
+        saved = save_batch_to_database([submissions[i] for i in valid])
+        for index, result in zip(valid, saved):
+            duplicate = result.pop('duplicate')
+            items[index].update({'status': 'duplicate' if duplicate else 'created', **result})
+        
+        if len(valid) == len(submissions):
+            status, status_code = 'success', 201
+        elif valid:
+            status, status_code = 'partial', 207
+        else:
+            status, status_code = 'error', 400
+        
+        return jsonify({
+            'status': status,
+            'message': f'{len(valid)} of {len(submissions)} submissions stored',
+            'data': {
+                'received': len(submissions),
+                'stored': len(valid),
+                'duplicates': sum(1 for item in items if item.get('status') == 'duplicate'),
+                'failed': len(submissions) - len(valid),
+                'items': items,
+                'timestamp': datetime.now().isoformat()
+            }
+        }), status_code
+        
+    except Exception as e:
+        logger.error(f"Error processing batch: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to process laboratory results batch: {str(e)}'
+        }), 500
+
 @app.route('/api/lab/results', methods=['PUT'])
 @require_api_key
 def update_lab_results():
@@ -273,8 +893,27 @@ def update_lab_results():
 @app.route('/api/lab/results/<int:patient_id>', methods=['GET'])
 @require_api_key
 def get_patient_results(patient_id):
-    """Get laboratory results for a specific patient"""
+    """
+    Get laboratory results for a specific patient, newest first
+    Keyset pagination: ?limit=N&after_id=<result_id of the last row seen>
+    ?format=ndjson streams every row (or up to limit) through a server-side cursor
+    """
     try:
+        stream = (request.args.get('format') == 'ndjson'
+                  or request.accept_mimetypes.best == 'application/x-ndjson')
+        try:
+            after_id = request.args.get('after_id', type=int)
+            limit = request.args.get('limit', type=int)
+            if limit is None and not stream:
+                limit = API_CONFIG['RESULTS_PAGE_SIZE']
+            if limit is not None and not 1 <= limit <= API_CONFIG['MAX_RESULTS_PAGE_SIZE']:
+                raise ValueError(f"limit must be between 1 and {API_CONFIG['MAX_RESULTS_PAGE_SIZE']}")
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
         conn = get_db_connection()
         cur = conn.cursor()
         
@@ -286,6 +925,7 @@ def get_patient_results(patient_id):
         """, (patient_id,))
         
         patient_row = cur.fetchone()
+        cur.close()
         
         if not patient_row:
             return jsonify({
@@ -301,34 +941,39 @@ def get_patient_results(patient_id):
             'sex': patient_row[4]
         }
         
-        # Get test results
-        cur.execute("""
-            SELECT test_name, value, units, reference_range, abnormal_flag
+        # Get test results (keyset on hematology_id, served by (patient_id, hematology_id))
+        query = """
+            SELECT hematology_id, test_name, value, units, reference_range, abnormal_flag
             FROM hematology_results
-            WHERE patient_id = %s
+            WHERE patient_id = %s AND (%s IS NULL OR hematology_id < %s)
             ORDER BY hematology_id DESC
-        """, (patient_id,))
+        """
+        params = [patient_id, after_id, after_id]
         
-        results = []
-        for row in cur.fetchall():
-            results.append({
-                'test_name': row[0],
-                'value': row[1],
-                'units': row[2],
-                'reference_range': row[3],
-                'abnormal_flag': row[4],
-                'status': 'abnormal' if row[4] else 'normal'
-            })
+        if stream:
+            if limit is not None:
+                query += " LIMIT %s"
+                params.append(limit)
+            return Response(stream_with_context(stream_patient_results(conn, patient, query, params)),
+                            mimetype='application/x-ndjson')
         
+        # One extra row tells whether another page exists
+        cur = conn.cursor()
+        cur.execute(query + " LIMIT %s", params + [limit + 1])
+        rows = cur.fetchall()
         cur.close()
-        conn.close()
+        
+        has_more = len(rows) > limit
+        results = [result_row_to_dict(row) for row in rows[:limit]]
         
         return jsonify({
             'status': 'success',
             'data': {
                 'patient': patient,
                 'laboratory_results': results,
-                'results_count': len(results)
+                'results_count': len(results),
+                'has_more': has_more,
+                'next_after_id': results[-1]['result_id'] if has_more else None
             }
         }), 200
         
@@ -339,6 +984,30 @@ def get_patient_results(patient_id):
             'message': str(e)
         }), 500
 
+def result_row_to_dict(row):
+    return {
+        'result_id': row[0],
+        'test_name': row[1],
+        'value': row[2],
+        'units': row[3],
+        'reference_range': row[4],
+        'abnormal_flag': row[5],
+        'status': 'abnormal' if row[5] else 'normal'
+    }
+
+def stream_patient_results(conn, patient, query, params):
+    """NDJSON lines: the patient, then one result per line, read in chunks from a named cursor"""
+    yield json.dumps({'patient': patient}, default=str) + '\n'
+    cur = conn.cursor(name=f"patient_results_{patient['patient_id']}")
+    cur.itersize = API_CONFIG['STREAM_FETCH_SIZE']
+    try:
+        cur.execute(query, params)
+        for row in cur:
+            yield json.dumps(result_row_to_dict(row), default=str) + '\n'
+    finally:
+        cur.close()
+        conn.rollback()
+
 @app.route('/api/stats', methods=['GET'])
 @require_api_key
 def get_statistics():
@@ -347,32 +1016,32 @@ def get_statistics():
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Count total patients
-        cur.execute("SELECT COUNT(*) FROM patients")
-        total_patients = cur.fetchone()[0]
-        
-        # Count total results
-        cur.execute("SELECT COUNT(*) FROM hematology_results")
-        total_results = cur.fetchone()[0]
+        # Trigger-maintained totals instead of COUNT(*) scans
+        counts = get_row_counts(cur)
+        total_patients = counts.get('patients', 0)
+        total_results = counts.get('hematology_results', 0)
         
         # Get recent patients (last 10)
-        cur.execute("""
-            SELECT patients_id, first_name, last_name, dob
-            FROM patients
-            ORDER BY patients_id DESC
-            LIMIT 10
-        """)
+        def load_recent_patients():
+            cur.execute("""
+                SELECT patients_id, first_name, last_name, dob
+                FROM patients
+                ORDER BY patients_id DESC
+                LIMIT 10
+            """)
+            
+            recent_patients = []
+            for row in cur.fetchall():
+                recent_patients.append({
+                    'patient_id': row[0],
+                    'name': f"{row[1]} {row[2]}",
+                    'dob': row[3].strftime('%Y-%m-%d') if row[3] else None
+                })
+            return recent_patients
         
-        recent_patients = []
-        for row in cur.fetchall():
-            recent_patients.append({
-                'patient_id': row[0],
-                'name': f"{row[1]} {row[2]}",
-                'dob': row[3].strftime('%Y-%m-%d') if row[3] else None
-            })
+        recent_patients = recent_patients_cache.get(load_recent_patients)
         
         cur.close()
-        conn.close()
         
         return jsonify({
             'status': 'success',
@@ -408,7 +1077,6 @@ def delete_patient_results(patient_id):
         
         if not patient:
             cur.close()
-            conn.close()
             return jsonify({
                 'status': 'error',
                 'message': f'Patient with ID {patient_id} not found'
@@ -423,7 +1091,6 @@ def delete_patient_results(patient_id):
         
         conn.commit()
         cur.close()
-        conn.close()
         
         logger.info(f"Deleted {results_count} results for patient {patient_id} ({patient[1]} {patient[2]})")
         
@@ -438,8 +1105,6 @@ def delete_patient_results(patient_id):
         }), 200
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         logger.error(f"Error deleting results: {str(e)}")
         return jsonify({
             'status': 'error',
@@ -463,7 +1128,6 @@ def delete_patient(patient_id):
         
         if not patient:
             cur.close()
-            conn.close()
             return jsonify({
                 'status': 'error',
                 'message': f'Patient with ID {patient_id} not found'
@@ -481,7 +1145,8 @@ def delete_patient(patient_id):
         
         conn.commit()
         cur.close()
-        conn.close()
+        patient_cache.discard_id(patient_id)
+        recent_patients_cache.clear()
         
         logger.info(f"Deleted patient {patient_id} ({patient[1]} {patient[2]}) and {results_count} results")
         
@@ -496,8 +1161,6 @@ def delete_patient(patient_id):
         }), 200
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         logger.error(f"Error deleting patient: {str(e)}")
         return jsonify({
             'status': 'error',
@@ -534,7 +1197,6 @@ def delete_all_results():
         
         conn.commit()
         cur.close()
-        conn.close()
         
         logger.warning(f"DELETED ALL {total_results} laboratory results!")
         
@@ -548,8 +1210,6 @@ def delete_all_results():
         }), 200
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         logger.error(f"Error deleting all results: {str(e)}")
         return jsonify({
             'status': 'error',
@@ -592,7 +1252,8 @@ def delete_all_patients():
         
         conn.commit()
         cur.close()
-        conn.close()
+        patient_cache.clear()
+        recent_patients_cache.clear()
         
         logger.warning(f"DELETED ALL DATA: {total_patients} patients and {total_results} results!")
         
@@ -607,8 +1268,6 @@ def delete_all_patients():
         }), 200
         
     except Exception as e:
-        if conn:
-            conn.rollback()
         logger.error(f"Error deleting all data: {str(e)}")
         return jsonify({
             'status': 'error',
@@ -631,10 +1290,120 @@ def internal_error(error):
         'message': 'Internal server error'
     }), 500
 
+def close_db_pool(*args):
+    """Close this process's pool (gunicorn worker_exit hook, signal handler)"""
+    global _db_pool
+    with _db_pool_lock:
+        pool, _db_pool = _db_pool, None
+    if pool is not None:
+        pool.close()
+
+def size_db_pool(processes, threads):
+    """Fit each process's pool to its request threads and all of them to TOTAL_CONNECTIONS"""
+    # A request holds at most one connection, so more than `threads` per process is never used
+    per_process = min(DB_POOL_CONFIG['MAX_CONNECTIONS'], threads,
+                      max(1, DB_POOL_CONFIG['TOTAL_CONNECTIONS'] // processes))
+    if per_process < threads:
+        logger.warning(f"{processes} x {threads} threads exceed TOTAL_CONNECTIONS="
+                       f"{DB_POOL_CONFIG['TOTAL_CONNECTIONS']}: {per_process} connections per process, "
+                       f"other requests wait up to {DB_POOL_CONFIG['CHECKOUT_TIMEOUT']}s for one")
+    DB_POOL_CONFIG['MAX_CONNECTIONS'] = per_process
+    DB_POOL_CONFIG['MIN_CONNECTIONS'] = min(DB_POOL_CONFIG['MIN_CONNECTIONS'], per_process)
+    logger.info(f"Database pool: {per_process} connections per process, {per_process * processes} at most")
+
+def run_production_server(workers, threads, timeout):
+    """
+    Serve with debug off: gunicorn worker processes x threads on Linux/macOS,
+    waitress threads on Windows.
+    
+    gunicorn drains on SIGTERM, giving in-flight requests GRACEFUL_TIMEOUT.
+    waitress stops at once: running requests get a few seconds but their
+    responses may be lost, so clients retry them (Idempotency-Key keeps a
+    retried submission from being stored twice).
+    """
+    app.debug = False
+    bind = f"{API_CONFIG['HOST']}:{API_CONFIG['PORT']}"
+    
+    if os.name != 'nt':
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            BaseApplication = None
+        
+        if BaseApplication is not None:
+            class GunicornServer(BaseApplication):
+                def __init__(self, options):
+                    self.options = options
+                    super().__init__()
+                
+                def load_config(self):
+                    for key, value in self.options.items():
+                        self.cfg.set(key, value)
+                
+                def load(self):
+                    return app
+            
+            logger.info(f"Production server (gunicorn): {workers} workers x {threads} threads on {bind}")
+            size_db_pool(workers, threads)
+            # The pool is created lazily, so every worker opens its own connections after fork
+            GunicornServer({
+                'bind': bind,
+                'workers': workers,
+                'threads': threads,
+                'worker_class': 'gthread',
+                'timeout': timeout,
+                'graceful_timeout': API_CONFIG['GRACEFUL_TIMEOUT'],
+                'keepalive': 5,
+                'worker_exit': lambda server, worker: close_db_pool()
+            }).run()
+            return
+    
+    try:
+        from waitress import serve
+    except ImportError:
+        logger.error("Production mode needs gunicorn (Linux/macOS) or waitress (Windows): "
+                     "pip install gunicorn waitress")
+        raise SystemExit(1)
+    
+    if workers > 1:
+        logger.warning("waitress serves from a single process; running workers x threads threads instead")
+    # SIGTERM exits like Ctrl+C, so atexit closes the pool
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Production server (waitress): {workers * threads} threads on {bind}")
+    size_db_pool(1, workers * threads)
+    serve(app, host=API_CONFIG['HOST'], port=API_CONFIG['PORT'],
+          threads=workers * threads, channel_timeout=timeout)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Laboratory Results API Server")
+    parser.add_argument('--mode', choices=['development', 'production'], default=API_CONFIG['SERVER_MODE'])
+    parser.add_argument('--host', default=API_CONFIG['HOST'])
+    parser.add_argument('--port', type=int, default=API_CONFIG['PORT'])
+    parser.add_argument('--workers', type=int, default=API_CONFIG['WORKERS'], help='Worker processes (production)')
+    parser.add_argument('--threads', type=int, default=API_CONFIG['THREADS'], help='Threads per worker (production)')
+    parser.add_argument('--timeout', type=int, default=API_CONFIG['REQUEST_TIMEOUT'],
+                        help='Seconds before a stuck request/worker is aborted (production)')
+    parser.add_argument('--db-host', default=DB_CONFIG['host'])
+    parser.add_argument('--database', default=DB_CONFIG['database'])
+    parser.add_argument('--db-user', default=DB_CONFIG['user'])
+    parser.add_argument('--db-password', default=DB_CONFIG['password'])
+    parser.add_argument('--no-auth', action='store_true', help='Disable API key authentication')
+    parser.add_argument('--migrate', action='store_true',
+                        help='Set up the schema (indexes, idempotency table, row counters) and exit')
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    args = parse_arguments()
+    API_CONFIG.update({'HOST': args.host, 'PORT': args.port})
+    DB_CONFIG.update({'host': args.db_host, 'database': args.database,
+                      'user': args.db_user, 'password': args.db_password})
+    if args.no_auth:
+        API_CONFIG['REQUIRE_AUTH'] = False
+    
     logger.info("="*60)
     logger.info("Laboratory Results API Server")
     logger.info("="*60)
+    logger.info(f"Mode: {args.mode}")
     logger.info(f"Host: {API_CONFIG['HOST']}")
     logger.info(f"Port: {API_CONFIG['PORT']}")
     logger.info(f"Authentication: {'Enabled' if API_CONFIG['REQUIRE_AUTH'] else 'Disabled'}")
@@ -645,13 +1414,28 @@ if __name__ == '__main__':
     logger.info("  GET  /                      - API information")
     logger.info("  GET  /api/health            - Health check")
     logger.info("  POST /api/lab/results       - Submit lab results")
+    logger.info("  POST /api/lab/results/batch - Submit many lab results")
     logger.info("  PUT  /api/lab/results       - Update lab results")
-    logger.info("  GET  /api/lab/results/<id>  - Get patient results")
+    logger.info("  GET  /api/lab/results/<id>  - Get patient results (?limit, ?after_id, ?format=ndjson)")
     logger.info("  GET  /api/stats             - API statistics")
     logger.info("="*60)
     
-    app.run(
-        host=API_CONFIG['HOST'],
-        port=API_CONFIG['PORT'],
-        debug=API_CONFIG['DEBUG']
-    )
\ No newline at end of file
+    # Schema work happens here, before any worker serves, never inside a request
+    try:
+        ensure_api_schema()
+        logger.info("Database schema ready")
+    except Exception as e:
+        logger.error(f"Database schema setup failed: {str(e)}")
+        if args.migrate:
+            raise SystemExit(1)
+    if args.migrate:
+        raise SystemExit(0)
+    
+    if args.mode == 'production':
+        run_production_server(args.workers, args.threads, args.timeout)
+    else:
+        app.run(
+            host=API_CONFIG['HOST'],
+            port=API_CONFIG['PORT'],
+            debug=API_CONFIG['DEBUG']
+        )
@@ -1,15 +1,1442 @@
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox, filedialog
+from tkinter import ttk, scrolledtext, messagebox, filedialog, simpledialog
 import psycopg2
+from psycopg2 import pool as pg_pool
 from datetime import datetime
 import threading
 import os
 import socket
 import json
 import requests
+from requests.adapters import HTTPAdapter
 import serial
 import serial.tools.list_ports
 import time
+import gzip
+import base64
+import queue
+import io
+import sqlite3
+import hashlib
+import zlib
+import re
+import uuid
+import random
+import shutil
+import itertools
+import bisect
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+class TrafficJournal:
+    """Append-only gzip journal of the raw bytes received from each device"""
+
+    def __init__(self, directory="traffic_journal"):
+        self.directory = directory
+        self.enabled = False
+        self.devices = []              # Empty = capture every device
+        self.entries = queue.Queue(maxsize=20000)
+        self.dropped = 0
+        self.writer_thread = None
+        self.connection_counter = 0
+        self.counter_lock = threading.Lock()
+
+    def start(self):
+        """Start the background writer thread"""
+        if self.writer_thread and self.writer_thread.is_alive():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.writer_thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def stop(self):
+        """Flush pending entries and stop the writer thread"""
+        if self.writer_thread and self.writer_thread.is_alive():
+            try:
+                self.entries.put(None, timeout=1)
+            except queue.Full:
+                pass
+            self.writer_thread.join(timeout=5)
+        self.writer_thread = None
+
+    def is_captured(self, device_identifier):
+        return self.enabled and (not self.devices or device_identifier in self.devices)
+
+    def new_connection_id(self):
+        """Unique ID so replay can keep per-connection buffers apart"""
+        with self.counter_lock:
+            self.connection_counter += 1
+            return f"{int(time.time())}-{self.connection_counter}"
+
+    def record(self, event, device_type, device_identifier, connection_id, chunk=b""):
+        """Queue one journal entry (open / chunk / close) - never blocks; dropped (and counted) when full"""
+        if not self.is_captured(device_identifier):
+            return
+        try:
+            self.entries.put_nowait({
+                "ts": time.time(),
+                "event": event,
+                "device_type": device_type,
+                "device": device_identifier,
+                "conn": connection_id,
+                "size": len(chunk),
+                "data": base64.b64encode(chunk).decode('ascii')
+            })
+        except queue.Full:
+            self.dropped += 1
+
+    def journal_path(self, timestamp):
+        day = datetime.fromtimestamp(timestamp).strftime("%Y%m%d")
+        return os.path.join(self.directory, f"traffic_{day}.jsonl.gz")
+
+    def writer_loop(self):
+        """Write queued entries in batches, one gzip member per batch"""
+        running = True
+        while running:
+            entry = self.entries.get()
+            batch = []
+            if entry is None:
+                running = False
+            else:
+                batch.append(entry)
+            while True:
+                try:
+                    entry = self.entries.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    running = False
+                    break
+                batch.append(entry)
+
+            if not batch:
+                continue
+
+            # Group per daily file; closing each member keeps the file readable after a crash
+            by_file = {}
+            for entry in batch:
+                by_file.setdefault(self.journal_path(entry["ts"]), []).append(entry)
+            for path, entries in by_file.items():
+                try:
+                    with gzip.open(path, "ab") as f:
+                        f.write("".join(
+                            json.dumps(e, separators=(',', ':')) + "\n" for e in entries
+                        ).encode('utf-8'))
+                except Exception as e:
+                    print(f"Failed to write traffic journal {path}: {str(e)}")
+
+    @staticmethod
+    def read_entries(path, device_identifier=None):
+        """Yield journal entries in order, tolerating a truncated last gzip member"""
+        with gzip.open(path, "rb") as f:
+            while True:
+                try:
+                    line = f.readline()
+                except (EOFError, gzip.BadGzipFile):
+                    break
+                if not line:
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if device_identifier and entry.get("device") != device_identifier:
+                    continue
+                entry["data"] = base64.b64decode(entry.get("data", ""))
+                yield entry
+
+class EventLog:
+    """Structured JSONL event log, written by a background thread with size/time rotation"""
+
+    def __init__(self, directory="logs", max_bytes=20 * 1024 * 1024, rotate_hours=24, backup_count=30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rotate_hours = rotate_hours
+        self.backup_count = backup_count
+        self.enabled = False
+        self.events = queue.Queue(maxsize=100000)
+        self.dropped = 0
+        self.writer_thread = None
+        self.file = None
+        self.opened_at = 0
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, "events.jsonl")
+
+    def start(self):
+        if self.writer_thread and self.writer_thread.is_alive():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.writer_thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def stop(self):
+        """Write pending events and stop the writer thread"""
+        if self.writer_thread and self.writer_thread.is_alive():
+            try:
+                self.events.put(None, timeout=1)
+            except queue.Full:
+                pass
+            self.writer_thread.join(timeout=5)
+        self.writer_thread = None
+
+    def record(self, stage, device=None, message_id=None, duration_ms=None, outcome=None, **fields):
+        """Queue one event - never blocks; events are dropped (and counted) if the writer falls behind"""
+        if not self.enabled:
+            return
+        event = {
+            "ts": datetime.now().isoformat(timespec='milliseconds'),
+            "device": device,
+            "stage": stage,
+            "message_id": message_id,
+            "duration_ms": round(duration_ms, 3) if duration_ms is not None else None,
+            "outcome": outcome
+        }
+        event.update(fields)
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def open_file(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        # An existing file keeps its age across restarts
+        self.opened_at = os.path.getctime(self.path) if self.file.tell() else time.time()
+
+    def rotate(self):
+        """Close the current file, gzip it under a timestamped name and prune old archives"""
+        self.file.close()
+        self.file = None
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        rotated = os.path.join(self.directory, f"events-{stamp}.jsonl")
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        
+        archives = sorted(f for f in os.listdir(self.directory)
+                          if f.startswith("events-") and f.endswith(".jsonl.gz"))
+        for name in archives[:max(0, len(archives) - self.backup_count)]:
+            os.remove(os.path.join(self.directory, name))
+
+    def writer_loop(self):
+        running = True
+        while running:
+            try:
+                event = self.events.get(timeout=1)
+            except queue.Empty:
+                event = False
+            batch = []
+            if event is None:
+                running = False
+            elif event:
+                batch.append(event)
+            while len(batch) < 5000:
+                try:
+                    event = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    running = False
+                    break
+                batch.append(event)
+            
+            try:
+                if self.file is None:
+                    if not batch:
+                        continue
+                    self.open_file()
+                if batch:
+                    self.file.write("".join(json.dumps(e, default=str, separators=(',', ':')) + "\n"
+                                            for e in batch))
+                    self.file.flush()
+                if (self.file.tell() >= self.max_bytes or
+                        time.time() - self.opened_at >= self.rotate_hours * 3600):
+                    self.rotate()
+            except Exception as e:
+                print(f"Failed to write event log {self.path}: {str(e)}")
+        
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class RollingHistogram:
+    """Latency histogram over a sliding window: log-spaced buckets in a ring of time slots"""
+    # 0.01 ms .. ~450 s in 25% steps; fixed memory regardless of message rate
+    BOUNDS = [0.01 * 1.25 ** i for i in range(80)]
+
+    def __init__(self, window_seconds=60, slot_seconds=5):
+        self.slot_seconds = slot_seconds
+        slot_count = max(1, int(window_seconds // slot_seconds))
+        self.slots = [[0] * (len(self.BOUNDS) + 1) for _ in range(slot_count)]
+        self.slot_errors = [0] * slot_count
+        self.slot_ids = [-1] * slot_count
+
+    def slot(self, now):
+        slot_id = int(now // self.slot_seconds)
+        index = slot_id % len(self.slots)
+        if self.slot_ids[index] != slot_id:
+            self.slots[index] = [0] * (len(self.BOUNDS) + 1)
+            self.slot_errors[index] = 0
+            self.slot_ids[index] = slot_id
+        return index
+
+    def add(self, value_ms, error=False, now=None):
+        index = self.slot(now or time.time())
+        if value_ms is not None:
+            self.slots[index][bisect.bisect_left(self.BOUNDS, value_ms)] += 1
+        if error:
+            self.slot_errors[index] += 1
+
+    def snapshot(self, now=None):
+        """(count, errors, p50, p95, p99) over the window; percentiles are bucket upper bounds"""
+        oldest = int((now or time.time()) // self.slot_seconds) - len(self.slots) + 1
+        merged = [0] * (len(self.BOUNDS) + 1)
+        errors = 0
+        for index, slot_id in enumerate(self.slot_ids):
+            if slot_id >= oldest:
+                merged = [a + b for a, b in zip(merged, self.slots[index])]
+                errors += self.slot_errors[index]
+        count = sum(merged)
+        
+        def percentile(pct):
+            if not count:
+                return None
+            target = count * pct / 100
+            running = 0
+            for i, bucket in enumerate(merged):
+                running += bucket
+                if running >= target:
+                    return self.BOUNDS[min(i, len(self.BOUNDS) - 1)]
+        
+        return count, errors, percentile(50), percentile(95), percentile(99)
+
+class RollingCounter:
+    """Messages and bytes per second over a sliding window (one slot per second)"""
+
+    def __init__(self, window_seconds=10):
+        self.window_seconds = window_seconds
+        self.slots = [[-1, 0, 0] for _ in range(window_seconds)]   # [second, messages, bytes]
+        self.total_messages = 0
+
+    def add(self, messages=1, size=0, now=None):
+        second = int(now or time.time())
+        slot = self.slots[second % self.window_seconds]
+        if slot[0] != second:
+            slot[:] = [second, 0, 0]
+        slot[1] += messages
+        slot[2] += size
+        self.total_messages += messages
+
+    def rates(self, now=None):
+        oldest = int(now or time.time()) - self.window_seconds + 1
+        messages = sum(s[1] for s in self.slots if s[0] >= oldest)
+        size = sum(s[2] for s in self.slots if s[0] >= oldest)
+        return messages / self.window_seconds, size / self.window_seconds
+
+class PipelineMetrics:
+    """Per-stage latency histograms and per-device rates fed by pipeline events"""
+    STAGES = ('frame', 'detect', 'parse', 'db_save', 'ack')
+    ERROR_OUTCOMES = ('error', 'failed', 'spooled', 'dead_letter')
+
+    def __init__(self, window_seconds=60):
+        self.window_seconds = window_seconds
+        self.stages = {stage: RollingHistogram(window_seconds) for stage in self.STAGES}
+        self.devices = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, device, duration_ms, outcome, size=None):
+        now = time.time()
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = RollingHistogram(self.window_seconds)
+            histogram.add(duration_ms, outcome in self.ERROR_OUTCOMES, now)
+            if stage == 'frame' and device:
+                counter = self.devices.get(device)
+                if counter is None:
+                    counter = self.devices[device] = RollingCounter()
+                counter.add(1, size or 0, now)
+
+    def stage_snapshot(self):
+        with self.lock:
+            return {stage: histogram.snapshot() for stage, histogram in self.stages.items()}
+
+    def device_snapshot(self):
+        with self.lock:
+            return {device: counter.rates() + (counter.total_messages,)
+                    for device, counter in self.devices.items()}
+
+class RecentMessageFilter:
+    """Time-windowed Bloom filter of message hashes (two rotating generations)"""
+
+    def __init__(self, window_seconds=86400, capacity=200000, hash_count=10):
+        # ~0.1% false positives at capacity; 14.4 bits per item
+        self.bit_count = capacity * 15
+        self.hash_count = hash_count
+        self.window_seconds = window_seconds
+        self.current = bytearray(self.bit_count // 8 + 1)
+        self.previous = bytearray(self.bit_count // 8 + 1)
+        self.rotated_at = time.time()
+        self.lock = threading.Lock()
+
+    def positions(self, digest):
+        # Double hashing from the SHA-256 digest - no extra hashing needed
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.bit_count for i in range(self.hash_count)]
+
+    def rotate_if_due(self):
+        # Caller holds self.lock; each generation covers half the window
+        if time.time() - self.rotated_at >= self.window_seconds / 2:
+            self.previous = self.current
+            self.current = bytearray(len(self.previous))
+            self.rotated_at = time.time()
+
+    def might_contain(self, digest):
+        positions = self.positions(digest)
+        with self.lock:
+            self.rotate_if_due()
+            for bits in (self.current, self.previous):
+                if all(bits[p >> 3] & (1 << (p & 7)) for p in positions):
+                    return True
+        return False
+
+    def add(self, digest):
+        positions = self.positions(digest)
+        with self.lock:
+            self.rotate_if_due()
+            for p in positions:
+                self.current[p >> 3] |= 1 << (p & 7)
+
+class RawMessageCodec:
+    """zlib compression of raw messages, with an optional dictionary per data format"""
+    CODEC = 'zlib'
+
+    def __init__(self, level=6, sample_count=200, dictionary_size=16384):
+        self.level = level
+        self.sample_count = sample_count
+        self.dictionary_size = dictionary_size
+        self.active = {}        # data_format -> (dict_id, dictionary)
+        self.known = {}         # dict_id -> dictionary (for decompression)
+        self.samples = {}       # data_format -> [raw bytes] collected for training
+        self.training = set()   # data formats whose dictionary is being trained and stored
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """Forget dictionaries (they belong to one database)"""
+        with self.lock:
+            self.active.clear()
+            self.known.clear()
+            self.samples.clear()
+            self.training.clear()
+
+    def register(self, data_format, dict_id, dictionary):
+        with self.lock:
+            self.known[dict_id] = dictionary
+            if data_format is not None:
+                self.active[data_format] = (dict_id, dictionary)
+
+    def add_sample(self, data_format, raw):
+        """Collect a training sample; returns the samples once enough are collected"""
+        with self.lock:
+            if data_format in self.active or data_format in self.training:
+                return None
+            samples = self.samples.setdefault(data_format, [])
+            samples.append(raw)
+            if len(samples) < self.sample_count:
+                return None
+            del self.samples[data_format]
+            self.training.add(data_format)
+            return samples
+
+    def training_done(self, data_format):
+        with self.lock:
+            self.training.discard(data_format)
+
+    def train(self, samples):
+        """Build a zlib preset dictionary from the fields most common across samples
+        
+        Fields are weighted by (occurrences x length) and the most valuable ones
+        go last, where zlib finds them at the shortest distance.
+        """
+        counts = Counter()
+        for raw in samples:
+            for line in raw.replace(b'\r\n', b'\r').replace(b'\n', b'\r').split(b'\r'):
+                for field in line.split(b'|'):
+                    if len(field) >= 3:
+                        counts[field + b'|'] += 1
+        ranked = sorted(
+            (item for item in counts.items() if item[1] > 1),
+            key=lambda item: item[1] * len(item[0])
+        )
+        dictionary = b''
+        for field, count in reversed(ranked):
+            if len(dictionary) + len(field) > self.dictionary_size:
+                continue
+            dictionary = field + dictionary
+        return dictionary
+
+    def compress(self, data_format, raw):
+        """Returns (dict_id, payload); dict_id is None without a dictionary"""
+        with self.lock:
+            dict_id, dictionary = self.active.get(data_format, (None, None))
+        if dictionary:
+            compressor = zlib.compressobj(self.level, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(self.level)
+        return dict_id, compressor.compress(raw) + compressor.flush()
+
+    def decompress(self, payload, dictionary=None):
+        if dictionary:
+            decompressor = zlib.decompressobj(zdict=dictionary)
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
+
+class DuplicateMessage(Exception):
+    """The message hash is already stored - the message was saved before"""
+
+class CircuitOpenError(Exception):
+    """Raised instead of touching the database while the circuit is open"""
+
+class CircuitBreaker:
+    """Fail fast after repeated database failures, probe again after a cool-down"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, on_state_change=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def transition(self, new_state, reason=""):
+        # Caller holds self.lock
+        old_state = self.state
+        self.state = new_state
+        if new_state == self.OPEN:
+            self.opened_at = time.time()
+        if new_state != self.HALF_OPEN:
+            self.probe_in_flight = False
+        if self.on_state_change and old_state != new_state:
+            self.on_state_change(old_state, new_state, reason)
+
+    def allow(self):
+        """True if a call may go through (in half-open state only one probe at a time)"""
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    return False
+                self.transition(self.HALF_OPEN, f"{self.reset_timeout}s cool-down elapsed, probing")
+            if self.state == self.HALF_OPEN:
+                if self.probe_in_flight:
+                    return False
+                self.probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                self.transition(self.CLOSED, "probe succeeded")
+
+    def record_failure(self, error=None):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self.transition(self.OPEN, f"probe failed: {error}")
+            elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+                self.transition(self.OPEN, f"{self.failures} consecutive failures, last: {error}")
+
+    def cancel_probe(self):
+        """Release the half-open probe slot without judging the database"""
+        with self.lock:
+            self.probe_in_flight = False
+
+class DatabasePool:
+    """Shared, thread-safe PostgreSQL connection pool with health checks"""
+
+    def __init__(self, minconn=1, maxconn=10, health_check_interval=30, checkout_timeout=15,
+                 connect_timeout=5):
+        self.connect_timeout = connect_timeout
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self.db_config = None
+        self.pool = None
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.lock = threading.Lock()
+        self.checked_out = {}   # id(conn) -> (pool, slots) it was taken from
+        self.last_used = {}     # id(conn) -> last release time
+
+    def configure(self, db_config, minconn=None, maxconn=None, health_check_interval=None):
+        """Rebuild the pool only when the connection settings actually change"""
+        minconn = self.minconn if minconn is None else max(0, int(minconn))
+        maxconn = self.maxconn if maxconn is None else max(1, int(maxconn))
+        minconn = min(minconn, maxconn)
+        if health_check_interval is not None:
+            self.health_check_interval = health_check_interval
+        
+        with self.lock:
+            if (self.db_config == db_config and self.minconn == minconn
+                    and self.maxconn == maxconn):
+                return False
+            old_pool = self.pool
+            self.db_config = dict(db_config)
+            self.minconn = minconn
+            self.maxconn = maxconn
+            self.pool = None
+            self.slots = threading.BoundedSemaphore(maxconn)
+            self.last_used = {}
+        
+        if old_pool is not None:
+            try:
+                old_pool.closeall()
+            except Exception:
+                pass
+        return True
+
+    def get_connection(self):
+        """Check out a validated connection, waiting while the pool is exhausted"""
+        with self.lock:
+            slots = self.slots
+        if not slots.acquire(timeout=self.checkout_timeout):
+            raise pg_pool.PoolError(
+                f"Timed out after {self.checkout_timeout}s waiting for a database connection"
+            )
+        
+        try:
+            with self.lock:
+                if self.pool is None:
+                    if not self.db_config:
+                        raise pg_pool.PoolError("Database is not configured")
+                    connect_kwargs = dict(self.db_config)
+                    # Never let a dead server hang a thread for the full TCP timeout
+                    connect_kwargs.setdefault('connect_timeout', self.connect_timeout)
+                    self.pool = pg_pool.ThreadedConnectionPool(
+                        self.minconn, self.maxconn, **connect_kwargs
+                    )
+                current_pool = self.pool
+            
+            conn = current_pool.getconn()
+            if not self.is_healthy(conn):
+                # Reconnect on failure: drop the dead connection and open a fresh one
+                current_pool.putconn(conn, close=True)
+                self.last_used.pop(id(conn), None)
+                conn = current_pool.getconn()
+            
+            self.checked_out[id(conn)] = (current_pool, slots)
+            return conn
+        
+        except Exception:
+            slots.release()
+            raise
+
+    def is_healthy(self, conn):
+        """Cheap check for recently used connections, SELECT 1 for idle ones"""
+        if conn.closed:
+            return False
+        idle_since = self.last_used.get(id(conn))
+        if idle_since is not None and time.time() - idle_since < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def release(self, conn, close=False):
+        """Return a connection to the pool it came from"""
+        owner_pool, slots = self.checked_out.pop(id(conn), (None, None))
+        try:
+            if owner_pool is None or owner_pool.closed:
+                conn.close()
+            else:
+                close = close or bool(conn.closed)
+                owner_pool.putconn(conn, close=close)
+                if close:
+                    self.last_used.pop(id(conn), None)
+                else:
+                    self.last_used[id(conn)] = time.time()
+        except Exception:
+            pass
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def close(self):
+        with self.lock:
+            old_pool = self.pool
+            self.pool = None
+            self.db_config = None
+        if old_pool is not None:
+            try:
+                old_pool.closeall()
+            except Exception:
+                pass
+
+class SaveSpool:
+    """Durable SQLite spool for saves the database rejected or could not reach"""
+
+    def __init__(self, path="db_spool.sqlite3"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                spool_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                job TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                status TEXT NOT NULL DEFAULT 'pending'
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS spool_status_idx ON spool (status, spool_id)")
+        
+        # device -> pending rows, so the hot path never queries SQLite
+        self.pending_devices = Counter(dict(self.conn.execute(
+            "SELECT device, COUNT(*) FROM spool WHERE status = 'pending' GROUP BY device"
+        ).fetchall()))
+        self.dead_count = self.conn.execute(
+            "SELECT COUNT(*) FROM spool WHERE status = 'dead'"
+        ).fetchone()[0]
+
+    @staticmethod
+    def device_of(job):
+        return f"{job['device_type']}:{job['device_identifier']}"
+
+    def has_pending(self, job):
+        with self.lock:
+            return self.pending_devices[self.device_of(job)] > 0
+
+    def depth(self):
+        with self.lock:
+            return sum(self.pending_devices.values())
+
+    def add(self, job, error=None):
+        """Persist one save job (everything except its Future)"""
+        record = {k: v for k, v in job.items() if k not in ('future', 'enqueued_at')}
+        record['sample_time'] = job['sample_time'].isoformat()
+        device = self.device_of(job)
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO spool (device, created_at, job, last_error) VALUES (?, ?, ?, ?)",
+                (device, time.time(), json.dumps(record, default=str), str(error) if error else None)
+            )
+            self.pending_devices[device] += 1
+
+    def fetch(self, limit):
+        """Oldest pending jobs first, rebuilt into writer jobs"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT spool_id, job, attempts FROM spool WHERE status = 'pending' "
+                "ORDER BY spool_id LIMIT ?", (limit,)
+            ).fetchall()
+        
+        jobs = []
+        for spool_id, job_json, attempts in rows:
+            job = json.loads(job_json)
+            job['device_key'] = tuple(job['device_key'])
+            job['result_rows'] = [tuple(r) for r in job['result_rows']]
+            job['sample_time'] = datetime.fromisoformat(job['sample_time'])
+            job['spool_id'] = spool_id
+            job['attempts'] = attempts
+            job['enqueued_at'] = time.perf_counter()
+            job['future'] = Future()
+            jobs.append(job)
+        return jobs
+
+    def remove(self, job):
+        with self.lock:
+            self.conn.execute("DELETE FROM spool WHERE spool_id = ?", (job['spool_id'],))
+            self.pending_devices[self.device_of(job)] -= 1
+
+    def record_failure(self, job, error, max_attempts):
+        """Count a failed replay; park the job as dead after max_attempts"""
+        attempts = job['attempts'] + 1
+        dead = attempts >= max_attempts
+        with self.lock:
+            self.conn.execute(
+                "UPDATE spool SET attempts = ?, last_error = ?, status = ? WHERE spool_id = ?",
+                (attempts, str(error), 'dead' if dead else 'pending', job['spool_id'])
+            )
+            if dead:
+                self.pending_devices[self.device_of(job)] -= 1
+                self.dead_count += 1
+        return dead
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class ApiOutbox:
+    """Durable SQLite outbox of API payloads, delivered in batches with backoff"""
+
+    def __init__(self, path="api_outbox.sqlite3"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.wakeups = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                target TEXT NOT NULL,
+                idempotency_key TEXT NOT NULL,
+                device TEXT,
+                message_id TEXT,
+                created_at REAL NOT NULL,
+                payload BLOB NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                status TEXT NOT NULL DEFAULT 'pending'
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS outbox_due_idx ON outbox (status, target, next_attempt_at)")
+        # Batches that were in flight when the application stopped are sent again
+        self.conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+
+    def add(self, target, payload, device=None, message_id=None):
+        """Store one serialized payload (compact JSON bytes); returns its idempotency key"""
+        key = uuid.uuid4().hex
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO outbox (target, idempotency_key, device, message_id, created_at, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (target, key, device, message_id, time.time(), payload)
+            )
+        self.wakeup(target).set()
+        return key
+
+    def wakeup(self, target):
+        """Event set whenever items are added for a target"""
+        with self.lock:
+            return self.wakeups.setdefault(target, threading.Event())
+
+    def wait(self, target, timeout):
+        event = self.wakeup(target)
+        event.wait(timeout)
+        event.clear()
+
+    def claim(self, target, limit):
+        """Oldest due items of a target, marked as in flight"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_id, idempotency_key, device, message_id, created_at, payload, attempts FROM outbox "
+                "WHERE status = 'pending' AND target = ? AND next_attempt_at <= ? "
+                "ORDER BY item_id LIMIT ?", (target, time.time(), limit)
+            ).fetchall()
+            if rows:
+                self.conn.executemany("UPDATE outbox SET status = 'sending' WHERE item_id = ?",
+                                      [(row[0],) for row in rows])
+        keys = ('item_id', 'idempotency_key', 'device', 'message_id', 'created_at', 'payload', 'attempts')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def complete(self, items):
+        with self.lock:
+            self.conn.executemany("DELETE FROM outbox WHERE item_id = ?", [(i['item_id'],) for i in items])
+
+    def fail(self, items, error, max_attempts, backoff_base, backoff_max, retryable=True):
+        """Schedule a retry with exponential backoff (and jitter), or dead-letter; returns dead items"""
+        dead = []
+        with self.lock:
+            for item in items:
+                attempts = item['attempts'] + 1
+                if not retryable or attempts >= max_attempts:
+                    status, next_attempt_at = 'dead', 0
+                    dead.append(item)
+                else:
+                    delay = min(backoff_max, backoff_base * 2 ** (attempts - 1))
+                    status, next_attempt_at = 'pending', time.time() + delay * random.uniform(0.8, 1.2)
+                self.conn.execute(
+                    "UPDATE outbox SET attempts = ?, last_error = ?, status = ?, next_attempt_at = ? WHERE item_id = ?",
+                    (attempts, str(error)[:500], status, next_attempt_at, item['item_id'])
+                )
+        return dead
+
+    def requeue_dead(self, target=None):
+        """Give dead-lettered items a fresh set of attempts"""
+        with self.lock:
+            cur = self.conn.execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = 0 "
+                "WHERE status = 'dead' AND (? IS NULL OR target = ?)", (target, target)
+            )
+            events = list(self.wakeups.values())
+        for event in events:
+            event.set()
+        return cur.rowcount
+
+    def stats(self):
+        """{target: (pending, oldest_created_at, dead)}"""
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT target,
+                       SUM(CASE WHEN status != 'dead' THEN 1 ELSE 0 END),
+                       MIN(CASE WHEN status != 'dead' THEN created_at END),
+                       SUM(CASE WHEN status = 'dead' THEN 1 ELSE 0 END)
+                FROM outbox GROUP BY target
+            """).fetchall()
+        return {target: (pending or 0, oldest, dead or 0) for target, pending, oldest, dead in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class SchemaManager:
+    """Versioned schema migrations plus monthly sample_time partitions"""
+    PARTITIONED_TABLES = ('test_records', 'test_results')
+    PARTITION_PATTERN = re.compile(r'_y(\d{4})m(\d{2})$')
+    MIGRATION_LOCK_ID = 7275001   # advisory lock key shared by all parser instances
+    INDEX_STATEMENT = re.compile(r'CREATE INDEX IF NOT EXISTS (\w+) ON (\w+)')
+
+    # Indexes for the lookups the parser and reports run; also rebuilt after partitioning
+    LOOKUP_INDEXES = [
+        "CREATE INDEX IF NOT EXISTS test_records_patient_time_idx ON test_records (patient_id, sample_time DESC)",
+        "CREATE INDEX IF NOT EXISTS test_records_device_time_idx ON test_records (device_id, sample_time DESC)",
+        "CREATE INDEX IF NOT EXISTS test_records_sample_time_idx ON test_records (sample_time)",
+        """CREATE INDEX IF NOT EXISTS test_results_record_idx ON test_results (record_id)
+           INCLUDE (test_name, test_value, test_units, reference_range, abnormal_flag)""",
+    ]
+
+    # Versions made only of index builds: applied after all others, without a transaction,
+    # with CREATE INDEX CONCURRENTLY so receivers keep writing while they build
+    INDEX_MIGRATIONS = {2}
+
+    # (version, description, statements) - append only, never edit an applied version
+    MIGRATIONS = [
+        (1, "base tables and get_or_create_device", [
+            """
+            CREATE TABLE IF NOT EXISTS devices (
+                device_id SERIAL PRIMARY KEY,
+                device_label VARCHAR(200) NOT NULL,
+                device_type VARCHAR(20) NOT NULL,
+                device_identifier VARCHAR(100) NOT NULL,
+                serial_number VARCHAR(100),
+                device_category VARCHAR(100),
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT devices_type_identifier_key UNIQUE (device_type, device_identifier)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS customer (
+                customer_id SERIAL PRIMARY KEY,
+                customer_code VARCHAR(50) NOT NULL CONSTRAINT customer_customer_code_key UNIQUE,
+                customer_name VARCHAR(200) NOT NULL,
+                sales_code VARCHAR(50),
+                sales_name VARCHAR(200),
+                is_active BOOLEAN NOT NULL DEFAULT TRUE,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS test_records (
+                record_id SERIAL PRIMARY KEY,
+                device_id INTEGER REFERENCES devices(device_id),
+                patient_id VARCHAR(100),
+                sample_time TIMESTAMP NOT NULL,
+                data_format VARCHAR(50),
+                total_results INTEGER,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS test_results (
+                result_id SERIAL PRIMARY KEY,
+                record_id INTEGER NOT NULL REFERENCES test_records(record_id) ON DELETE CASCADE,
+                test_name VARCHAR(100),
+                test_value VARCHAR(100),
+                test_units VARCHAR(50),
+                reference_range VARCHAR(100),
+                abnormal_flag VARCHAR(20)
+            )
+            """,
+            # Sites that already have their own function keep it
+            """
+            DO $$
+            BEGIN
+                IF to_regprocedure('get_or_create_device(varchar, varchar, varchar, varchar, varchar)') IS NULL THEN
+                    EXECUTE $fn$
+                    CREATE FUNCTION get_or_create_device(
+                        p_label VARCHAR, p_type VARCHAR, p_identifier VARCHAR,
+                        p_serial VARCHAR, p_category VARCHAR
+                    ) RETURNS INTEGER LANGUAGE plpgsql AS $body$
+                    DECLARE
+                        v_id INTEGER;
+                    BEGIN
+                        SELECT device_id INTO v_id FROM devices
+                        WHERE device_type = p_type AND device_identifier = p_identifier;
+                        
+                        IF v_id IS NULL THEN
+                            INSERT INTO devices (device_label, device_type, device_identifier, serial_number, device_category)
+                            VALUES (p_label, p_type, p_identifier, NULLIF(p_serial, ''), NULLIF(p_category, ''))
+                            ON CONFLICT (device_type, device_identifier) DO NOTHING
+                            RETURNING device_id INTO v_id;
+                            IF v_id IS NULL THEN
+                                SELECT device_id INTO v_id FROM devices
+                                WHERE device_type = p_type AND device_identifier = p_identifier;
+                            END IF;
+                        ELSE
+                            UPDATE devices
+                            SET device_label = p_label, serial_number = NULLIF(p_serial, ''),
+                                device_category = NULLIF(p_category, ''), updated_at = CURRENT_TIMESTAMP
+                            WHERE device_id = v_id
+                              AND (device_label, serial_number, device_category)
+                                  IS DISTINCT FROM (p_label, NULLIF(p_serial, ''), NULLIF(p_category, ''));
+                        END IF;
+                        RETURN v_id;
+                    END
+                    $body$
+                    $fn$;
+                END IF;
+            END
+            $$
+            """,
+        ]),
+        (2, "lookup indexes for patient, device and time queries", LOOKUP_INDEXES + [
+            "CREATE INDEX IF NOT EXISTS customer_active_created_idx ON customer (created_at DESC) WHERE is_active",
+        ]),
+        (3, "message hashes for retransmission dedup", [
+            """
+            CREATE TABLE IF NOT EXISTS message_hashes (
+                message_hash CHAR(64) PRIMARY KEY,
+                received_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS message_hashes_received_at_idx ON message_hashes (received_at)",
+        ]),
+        (4, "compressed raw message storage", [
+            """
+            CREATE TABLE IF NOT EXISTS raw_dictionaries (
+                dict_id SERIAL PRIMARY KEY,
+                data_format VARCHAR(50) NOT NULL,
+                dictionary BYTEA NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS test_record_raw (
+                record_id INTEGER PRIMARY KEY,
+                codec VARCHAR(10) NOT NULL,
+                dict_id INTEGER REFERENCES raw_dictionaries(dict_id),
+                raw_size INTEGER NOT NULL,
+                payload BYTEA NOT NULL
+            )
+            """,
+            # Payloads are already compressed - keep TOAST from trying again
+            "ALTER TABLE test_record_raw ALTER COLUMN payload SET STORAGE EXTERNAL",
+        ]),
+    ]
+
+    # (name, query, params, table, index) - EXPLAIN must show an index scan of index on table
+    PLAN_CHECKS = [
+        ("device lookup",
+         "SELECT device_id FROM devices WHERE device_type = %s AND device_identifier = %s",
+         ('socket', '127.0.0.1'), 'devices', 'devices_type_identifier_key'),
+        ("customer by code",
+         "SELECT customer_id FROM customer WHERE customer_code = %s",
+         ('C001',), 'customer', 'customer_customer_code_key'),
+        ("active customer list",
+         "SELECT customer_id, customer_code FROM customer WHERE is_active = TRUE ORDER BY created_at DESC LIMIT 50",
+         (), 'customer', 'customer_active_created_idx'),
+        ("patient history",
+         "SELECT record_id, sample_time FROM test_records WHERE patient_id = %s ORDER BY sample_time DESC LIMIT 50",
+         ('P0001',), 'test_records', 'test_records_patient_time_idx'),
+        ("device recent records",
+         "SELECT record_id FROM test_records WHERE device_id = %s AND sample_time >= CURRENT_TIMESTAMP - INTERVAL '7 days'",
+         (1,), 'test_records', 'test_records_device_time_idx'),
+        ("results of a record",
+         "SELECT test_name, test_value, test_units, reference_range, abnormal_flag FROM test_results WHERE record_id = %s",
+         (1,), 'test_results', 'test_results_record_idx'),
+        ("message hash lookup",
+         "SELECT 1 FROM message_hashes WHERE message_hash = %s",
+         ('0' * 64,), 'message_hashes', 'message_hashes_pkey'),
+        ("raw message by record",
+         "SELECT payload FROM test_record_raw WHERE record_id = %s",
+         (1,), 'test_record_raw', 'test_record_raw_pkey'),
+    ]
+
+    def apply_migrations(self, conn):
+        """Apply pending schema migrations, one transaction each; returns the applied versions
+        
+        Index migrations run last so a failed build never holds back the tables
+        of later versions; they stay pending and are retried on the next connect.
+        """
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("SELECT version FROM schema_migrations")
+        done = {row[0] for row in cur.fetchall()}
+        conn.commit()
+        
+        applied = []
+        for version, description, statements in self.MIGRATIONS:
+            if version in done or version in self.INDEX_MIGRATIONS:
+                continue
+            # Another parser instance may be migrating the same database
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (self.MIGRATION_LOCK_ID,))
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cur.fetchone() is None:
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                            (version, description))
+                applied.append(version)
+            conn.commit()
+        cur.close()
+        
+        for version, description, statements in self.MIGRATIONS:
+            if version in self.INDEX_MIGRATIONS and version not in done:
+                if self.apply_index_migration(conn, version, description, statements):
+                    applied.append(version)
+        return applied
+
+    def apply_index_migration(self, conn, version, description, statements):
+        """Build the indexes of one migration concurrently; False if another instance did it"""
+        conn.autocommit = True
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT pg_advisory_lock(%s)", (self.MIGRATION_LOCK_ID,))
+            try:
+                cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                if cur.fetchone() is not None:
+                    return False
+                for statement in statements:
+                    self.build_index(cur, statement)
+                cur.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                            (version, description))
+                return True
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (self.MIGRATION_LOCK_ID,))
+        finally:
+            cur.close()
+            conn.autocommit = False
+
+    def build_index(self, cur, statement):
+        """CREATE INDEX CONCURRENTLY, replacing the invalid leftover of an interrupted build"""
+        name, table = self.INDEX_STATEMENT.search(statement).groups()
+        cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+        row = cur.fetchone()
+        if row is not None:
+            if row[0]:
+                return
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        if self.is_partitioned(cur, table):
+            # Partitioned parents cannot build concurrently (migrate_to_partitions creates these)
+            cur.execute(statement)
+        else:
+            cur.execute(statement.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1))
+
+    def schema_version(self, cur):
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return cur.fetchone()[0]
+
+    def pending_versions(self, cur):
+        cur.execute("SELECT version FROM schema_migrations")
+        done = {row[0] for row in cur.fetchall()}
+        return [version for version, _, _ in self.MIGRATIONS if version not in done]
+
+    def table_exists(self, cur, table):
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+        return cur.fetchone()[0]
+
+    def plan_index_scans(self, plan, found=None):
+        """Collect (relation, index) of every index scan node in an EXPLAIN JSON plan"""
+        if found is None:
+            found = []
+        if plan.get('Node Type') in ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan'):
+            found.append((plan.get('Relation Name'), plan.get('Index Name')))
+        for child in plan.get('Plans', []):
+            self.plan_index_scans(child, found)
+        return found
+
+    def check_query_plans(self, conn):
+        """EXPLAIN each known lookup and verify it can use its index
+        
+        Sequential scans are disabled for the check: on small tables the
+        planner rightly prefers them, and the question is whether the index
+        matches the query at all. Returns [(name, ok, detail)].
+        """
+        cur = conn.cursor()
+        results = []
+        for name, query, params, table, index in self.PLAN_CHECKS:
+            try:
+                # Partitions carry their own copy of the index under a derived name
+                cur.execute("""
+                    WITH RECURSIVE tree(oid) AS (
+                        SELECT to_regclass(%s)::oid
+                        UNION ALL
+                        SELECT i.inhrelid FROM pg_inherits i JOIN tree t ON i.inhparent = t.oid
+                    )
+                    SELECT c.relname FROM tree JOIN pg_class c ON c.oid = tree.oid
+                """, (index,))
+                accepted = {row[0] for row in cur.fetchall()} | {index}
+                cur.execute("SET LOCAL enable_seqscan = off")
+                cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = self.plan_index_scans(plan[0]['Plan'])
+                ok = any(i in accepted for r, i in scans)
+                detail = ', '.join(f"{i} on {r}" for r, i in scans) or "no index scan"
+                results.append((name, ok, detail))
+            except Exception as e:
+                results.append((name, False, str(e).strip()))
+            conn.rollback()
+        cur.close()
+        return results
+
+    @staticmethod
+    def month_start(value):
+        return datetime(value.year, value.month, 1)
+
+    @staticmethod
+    def add_months(month, count):
+        index = month.year * 12 + month.month - 1 + count
+        return datetime(index // 12, index % 12 + 1, 1)
+
+    @staticmethod
+    def partition_name(table, month):
+        return f"{table}_y{month:%Y}m{month:%m}"
+
+    def is_partitioned(self, cur, table):
+        cur.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+            (table,)
+        )
+        return cur.fetchone()[0]
+
+    def columns(self, cur, table):
+        cur.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+            ORDER BY ordinal_position
+        """, (table,))
+        return [row[0] for row in cur.fetchall()]
+
+    def partitions(self, cur, table):
+        """{month: partition name} of the monthly partitions attached to table"""
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, (table,))
+        months = {}
+        for (name,) in cur.fetchall():
+            match = self.PARTITION_PATTERN.search(name)
+            if match:
+                months[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+        return months
+
+    def create_month_partition(self, cur, table, month):
+        """Create and attach one month, moving matching rows out of the default partition"""
+        name = self.partition_name(table, month)
+        bounds = (month, self.add_months(month, 1))
+        cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {table}_default
+                WHERE sample_time >= %s AND sample_time < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, bounds)
+        cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+        return name
+
+    def ensure_partitions(self, conn, months_ahead=3, start=None, commit=True):
+        """Create missing monthly partitions from start (default: this month) to months_ahead"""
+        cur = conn.cursor()
+        created = []
+        first = self.month_start(start or datetime.now())
+        last = self.add_months(self.month_start(datetime.now()), months_ahead)
+        for table in self.PARTITIONED_TABLES:
+            existing = self.partitions(cur, table)
+            month = first
+            while month <= last:
+                if month not in existing:
+                    created.append(self.create_month_partition(cur, table, month))
+                month = self.add_months(month, 1)
+        if commit:
+            conn.commit()
+        cur.close()
+        return created
+
+    def apply_retention(self, conn, keep_months, drop=False):
+        """Detach (or drop) partitions older than keep_months full months
+        
+        Records and results only change the catalog (no row-by-row DELETE). Each
+        DETACH commits on its own, so the parent is locked only for that
+        statement. Results go first, then their records. When dropping, the raw
+        messages of the dropped records go too; detached (archived) partitions
+        keep theirs. Message hashes older than the cutoff are deleted in batches.
+        """
+        cutoff = self.add_months(self.month_start(datetime.now()), -keep_months)
+        cur = conn.cursor()
+        raw_table = self.table_exists(cur, 'test_record_raw')
+        conn.commit()
+        removed = []
+        for table in reversed(self.PARTITIONED_TABLES):
+            for month, name in sorted(self.partitions(cur, table).items()):
+                if month >= cutoff:
+                    continue
+                cur.execute("SET LOCAL lock_timeout = '5s'")
+                cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                conn.commit()
+                if drop:
+                    if table == 'test_records' and raw_table:
+                        self.delete_in_batches(conn, cur, f"""
+                            DELETE FROM test_record_raw WHERE record_id IN (
+                                SELECT r.record_id FROM test_record_raw r JOIN {name} p ON p.record_id = r.record_id
+                                LIMIT %s
+                            )
+                        """)
+                    cur.execute(f"DROP TABLE {name}")
+                    conn.commit()
+                removed.append(name)
+        if self.table_exists(cur, 'message_hashes'):
+            self.purge_message_hashes(conn, cutoff)
+        conn.commit()
+        cur.close()
+        return removed
+
+    def purge_message_hashes(self, conn, cutoff):
+        """Delete message hashes received before cutoff, in batches"""
+        cur = conn.cursor()
+        self.delete_in_batches(conn, cur, """
+            DELETE FROM message_hashes WHERE message_hash IN (
+                SELECT message_hash FROM message_hashes WHERE received_at < %s LIMIT %s
+            )
+        """, (cutoff,))
+        cur.close()
+
+    def delete_in_batches(self, conn, cur, statement, params=(), batch_size=5000):
+        """Repeat a DELETE ... LIMIT %s (the last parameter) until nothing is left, one commit per batch
+        
+        Short transactions keep row locks and WAL bursts small while receivers write.
+        """
+        deleted = 0
+        while True:
+            cur.execute(statement, tuple(params) + (batch_size,))
+            conn.commit()
+            deleted += cur.rowcount
+            if cur.rowcount < batch_size:
+                return deleted
+
+    def migrate_to_partitions(self, conn, months_ahead=3):
+        """Convert heap test_records / test_results into partitioned tables
+        
+        The old tables are kept as test_records_legacy / test_results_legacy
+        until they are dropped by hand. The results -> records foreign key is
+        not carried over (see below). Returns a summary string.
+        """
+        cur = conn.cursor()
+        if self.is_partitioned(cur, 'test_records'):
+            cur.close()
+            return "test_records is already partitioned"
+        
+        cur.execute("SET LOCAL lock_timeout = '10s'")
+        cur.execute("LOCK TABLE test_records, test_results IN ACCESS EXCLUSIVE MODE")
+        cur.execute("SELECT COUNT(*) FROM test_records WHERE sample_time IS NULL")
+        missing = cur.fetchone()[0]
+        if missing:
+            raise ValueError(f"{missing} test_records rows have no sample_time - set it before partitioning")
+        
+        record_columns = self.columns(cur, 'test_records')
+        result_columns = self.columns(cur, 'test_results')
+        results_have_sample_time = 'sample_time' in result_columns
+        result_columns = [c for c in result_columns if c != 'sample_time']
+        cur.execute("SELECT pg_get_serial_sequence('test_records', 'record_id'), "
+                    "pg_get_serial_sequence('test_results', 'result_id')")
+        sequences = dict(zip(('test_records', 'test_results'), cur.fetchone()))
+        
+        cur.execute("ALTER TABLE test_results RENAME TO test_results_legacy")
+        cur.execute("ALTER TABLE test_records RENAME TO test_records_legacy")
+        # Index names are schema-wide: free them for the new tables
+        cur.execute("""
+            SELECT indexname FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename IN ('test_records_legacy', 'test_results_legacy')
+        """)
+        for (index,) in cur.fetchall():
+            cur.execute(f"ALTER INDEX {index} RENAME TO {index[:55]}_legacy")
+        cur.execute("""
+            CREATE TABLE test_records (LIKE test_records_legacy INCLUDING DEFAULTS INCLUDING IDENTITY)
+            PARTITION BY RANGE (sample_time)
+        """)
+        cur.execute("ALTER TABLE test_records ALTER COLUMN sample_time SET NOT NULL")
+        extra_column = "" if results_have_sample_time else ", sample_time TIMESTAMP NOT NULL"
+        cur.execute(f"""
+            CREATE TABLE test_results (LIKE test_results_legacy INCLUDING DEFAULTS INCLUDING IDENTITY{extra_column})
+            PARTITION BY RANGE (sample_time)
+        """)
+        cur.execute("ALTER TABLE test_results ALTER COLUMN sample_time SET NOT NULL")
+        for table in self.PARTITIONED_TABLES:
+            cur.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        
+        cur.execute("SELECT MIN(sample_time) FROM test_records_legacy")
+        oldest = cur.fetchone()[0] or datetime.now()
+        self.ensure_partitions(conn, months_ahead, start=oldest, commit=False)
+        
+        cur.execute(f"""
+            INSERT INTO test_records ({', '.join(record_columns)})
+            SELECT {', '.join(record_columns)} FROM test_records_legacy
+        """)
+        moved_records = cur.rowcount
+        cur.execute(f"""
+            INSERT INTO test_results ({', '.join(result_columns)}, sample_time)
+            SELECT {', '.join('r.' + c for c in result_columns)}, t.sample_time
+            FROM test_results_legacy r
+            JOIN test_records_legacy t ON t.record_id = r.record_id
+        """)
+        moved_results = cur.rowcount
+        
+        # Keys must include the partition key; record_id lookups use their own index
+        cur.execute("ALTER TABLE test_records ADD PRIMARY KEY (record_id, sample_time)")
+        cur.execute("ALTER TABLE test_results ADD PRIMARY KEY (result_id, sample_time)")
+        for statement in self.LOOKUP_INDEXES:
+            cur.execute(statement)
+        # The test_results -> test_records foreign key is not recreated: create_month_partition
+        # moves rows out of the default partitions, which would fail it (or, ON DELETE CASCADE,
+        # delete the month's results). Records and results are written in one transaction instead.
+        
+        # Keep the id sequences alive (and ahead) once the legacy tables are dropped
+        for table, key in (('test_records', 'record_id'), ('test_results', 'result_id')):
+            cur.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, key))
+            identity_sequence = cur.fetchone()[0]
+            if identity_sequence:
+                # IDENTITY columns get a fresh sequence of their own: move it past the copied ids
+                cur.execute(f"SELECT setval(%s, COALESCE((SELECT MAX({key}) FROM {table}), 0) + 1, false)",
+                            (identity_sequence,))
+            elif sequences[table]:
+                # SERIAL: LIKE copies the nextval() default but not the ownership
+                cur.execute(f"ALTER SEQUENCE {sequences[table]} OWNED BY {table}.{key}")
+        conn.commit()
+        cur.close()
+        return (f"Partitioned {moved_records} records and {moved_results} results; "
+                f"old tables kept as test_records_legacy / test_results_legacy")
 
 class HL7ParserGUI:
 # 1. ===SETTING INISIALISASI===
@@ -40,6 +1467,94 @@ class HL7ParserGUI:
             'password': '',
         }
         
+        # Shared connection pool for every database path
+        self.db_pool_config = {
+            'minconn': 1,
+            'maxconn': 10,
+            'health_check_interval': 30
+        }
+        self.db_pool = DatabasePool(**self.db_pool_config)
+        
+        # Circuit breaker around every database access
+        self.circuit_breaker_config = {
+            'failure_threshold': 5,
+            'reset_timeout': 30
+        }
+        self.db_breaker = CircuitBreaker(
+            on_state_change=self.on_db_breaker_state_change,
+            **self.circuit_breaker_config
+        )
+        
+        # Results tab: render only the newest message per refresh, plus a latest-N list
+        self.results_display_config = {
+            'refresh_ms': 250,
+            'latest_count': 50
+        }
+        self.pending_results_display = None
+        self.pending_latest_messages = deque(maxlen=1000)
+        self.latest_message_details = {}
+        
+        # UI log sink: any thread appends, the Tk loop inserts in bulk every flush_ms
+        self.ui_log_config = {
+            'flush_ms': 100,
+            'max_lines': 5000
+        }
+        self.ui_log_buffer = deque(maxlen=20000)
+        
+        # Group-commit writer: flush every batch_size messages or flush_ms, whichever first
+        self.db_writer_config = {
+            'batch_size': 50,
+            'flush_ms': 200
+        }
+        self.db_write_queue = queue.Queue()
+        self.db_writer_thread = None
+        self.db_writer_running = False
+        self.db_writer_lock = threading.Lock()
+        
+        # Local spool for saves that could not reach the database
+        self.spool_config = {
+            'path': 'db_spool.sqlite3',
+            'drain_batch_size': 100,
+            'drain_interval': 5,
+            'max_attempts': 10
+        }
+        self.spool_drainer_running = False
+        self.spool_drain_history = deque(maxlen=600)
+        
+        # Retransmission dedup: in-memory window backed by message_hashes in the DB
+        self.dedup_config = {
+            'enabled': True,
+            'window_hours': 24,
+            'db_retention_days': 30
+        }
+        self.message_filter = RecentMessageFilter(self.dedup_config['window_hours'] * 3600)
+        self.pending_message_hashes = set()
+        self.pending_hashes_lock = threading.Lock()
+        self.duplicate_counts = Counter()
+        self.db_support_ready = False
+        self.db_support_lock = threading.Lock()   # Held by the one schema setup thread
+        self.db_dedup_available = True
+        self.last_db_maintenance = 0
+        
+        # Monthly partitions of test_records / test_results (see SchemaManager)
+        self.partition_config = {
+            'months_ahead': 3,
+            'retention_months': 0,      # 0 = keep everything
+            'retention_mode': 'detach'  # or 'drop'
+        }
+        self.schema_manager = SchemaManager()
+        
+        # Raw message archive (compressed, one row per test record)
+        self.raw_storage_config = {
+            'enabled': True,
+            'level': 6,
+            'dictionary': True,
+            'dictionary_samples': 200,
+            'dictionary_size': 16384
+        }
+        self.raw_codec = RawMessageCodec()
+        self.db_raw_available = True
+        
         # Socket server configuration
         self.socket_config = {
             'host': '0.0.0.0',
@@ -61,11 +1576,57 @@ class HL7ParserGUI:
             'method': 'POST',
             'api_key': '',
             'timeout': 30,
-            'enabled': False
+            'enabled': False,
+            'auto_send': False,     # Deliver every parsed message automatically
+            'pool_size': 4,         # Keep-alive connections (and delivery workers)
+            'batch_size': 1,        # Payloads per request; 1 = the single-payload body
+            'batch_format': 'array',  # 'array' (JSON list) or 'ndjson'
+            'max_attempts': 10,
+            'backoff_base': 2,      # Seconds; doubles per attempt
+            'backoff_max': 300,
+            'outbox_path': 'api_outbox.sqlite3',
+            'gzip': False,          # gzip request bodies of API_GZIP_MIN_BYTES or more
+            'targets': []           # Additional endpoints: name, endpoint, method, api_key, timeout, filters
+        }
+        self.api_sessions = {}
+        self.api_session_lock = threading.Lock()
+        self.api_delivery_threads = {}
+        self.api_endpoint_stats = {}
+        self.api_delivery_history = deque(maxlen=600)
+
+        # Raw traffic journal (exact bytes per device, for replay)
+        self.journal_config = {
+            'enabled': False,
+            'directory': 'traffic_journal',
+            'devices': []
+        }
+        self.traffic_journal = TrafficJournal(self.journal_config['directory'])
+        
+        # Structured event log (one JSON line per pipeline stage of each message)
+        self.event_log_config = {
+            'enabled': True,
+            'directory': 'logs',
+            'max_mb': 20,
+            'rotate_hours': 24,
+            'backup_count': 30
         }
+        self.event_log = EventLog(self.event_log_config['directory'])
+        self.message_id_prefix = datetime.now().strftime("%Y%m%d%H%M%S")
+        self.message_id_counter = itertools.count(1)
+        
+        # Live dashboard: rolling histograms fed by the same pipeline events
+        self.dashboard_config = {
+            'refresh_ms': 1000,
+            'window_seconds': 60
+        }
+        self.pipeline_metrics = PipelineMetrics(self.dashboard_config['window_seconds'])
 
         self.device_labels = {"socket": {}, "serial": {}}
         self.device_labels_file = "device_labels.json"
+        
+        # (device_type, device_identifier, label, serial_number, category) -> device_id
+        self.device_id_cache = {}
+        self.device_id_cache_lock = threading.Lock()
         self.load_device_labels()
 
         # ===== NEW: AUTO-STARTUP CONFIGURATION =====
@@ -87,6 +1648,16 @@ class HL7ParserGUI:
                 
         # LOAD SAVED CONFIGURATION ON STARTUP
         config_loaded = self.load_app_configuration()
+        self.apply_journal_config()
+        self.apply_event_log_config()
+        
+        self.save_spool = SaveSpool(self.spool_config['path'])
+        self.api_outbox = ApiOutbox(self.api_config.get('outbox_path', 'api_outbox.sqlite3'))
+        self.spool_drainer_running = True
+        threading.Thread(target=self.spool_drainer_loop, daemon=True).start()
+        if self.db_config.get('host'):
+            # Migrate before the first message arrives; later checkouts only retry a failed setup
+            self.start_db_support_setup()
         
         self.adjust_ui_for_resolution()
         self.create_menu()
@@ -108,6 +1679,13 @@ class HL7ParserGUI:
         self.is_fullscreen = False
 
         self.root.after(1000, self.auto_reconnect_devices)
+        self.root.after(1000, self.update_spool_status)
+        self.root.after(self.ui_log_config['flush_ms'], self.flush_ui_logs)
+        self.root.after(self.results_display_config['refresh_ms'], self.flush_results_display)
+        self.root.after(self.dashboard_config['refresh_ms'], self.refresh_dashboard)
+        self.root.after(1000, self.update_api_delivery_status)
+        if self.api_config['enabled'] and self.api_config.get('auto_send'):
+            self.start_api_delivery()
 
     def load_device_labels(self):
         """Load label alat yang sudah disimpan dari file JSON"""
@@ -163,6 +1741,37 @@ class HL7ParserGUI:
                     self.db_config = config['database']
                     print("Database configuration loaded") 
                 
+                # Load Connection Pool Config
+                if 'db_pool' in config:
+                    self.db_pool_config.update(config['db_pool'])
+                if 'db_writer' in config:
+                    self.db_writer_config.update(config['db_writer'])
+                if 'spool' in config:
+                    self.spool_config.update(config['spool'])
+                if 'dedup' in config:
+                    self.dedup_config.update(config['dedup'])
+                    self.message_filter.window_seconds = self.dedup_config['window_hours'] * 3600
+                if 'raw_storage' in config:
+                    self.raw_storage_config.update(config['raw_storage'])
+                    self.raw_codec.level = int(self.raw_storage_config['level'])
+                    self.raw_codec.sample_count = int(self.raw_storage_config['dictionary_samples'])
+                    self.raw_codec.dictionary_size = int(self.raw_storage_config['dictionary_size'])
+                if 'partitions' in config:
+                    self.partition_config.update(config['partitions'])
+                if 'event_log' in config:
+                    self.event_log_config.update(config['event_log'])
+                if 'results_display' in config:
+                    self.results_display_config.update(config['results_display'])
+                if 'dashboard' in config:
+                    self.dashboard_config.update(config['dashboard'])
+                    self.pipeline_metrics = PipelineMetrics(int(self.dashboard_config['window_seconds']))
+                if 'ui_log' in config:
+                    self.ui_log_config.update(config['ui_log'])
+                if 'circuit_breaker' in config:
+                    self.circuit_breaker_config.update(config['circuit_breaker'])
+                    self.db_breaker.failure_threshold = self.circuit_breaker_config['failure_threshold']
+                    self.db_breaker.reset_timeout = self.circuit_breaker_config['reset_timeout']
+                
                 # Load Socket Config
                 if 'socket' in config:
                     self.socket_config = config['socket']
@@ -181,9 +1790,14 @@ class HL7ParserGUI:
                 
                 # Load API Config
                 if 'api' in config:
-                    self.api_config = config['api']
+                    self.api_config.update(config['api'])
                     print("API configuration loaded") 
                 
+                # Load Traffic Journal Config
+                if 'journal' in config:
+                    self.journal_config.update(config['journal'])
+                    print("Traffic journal configuration loaded") 
+                
                 # Load Auto-Startup Setting
                 if 'auto_startup_enabled' in config:
                     self.auto_startup_enabled = config['auto_startup_enabled']
@@ -208,11 +1822,23 @@ class HL7ParserGUI:
             
             config = {
                 'database': self.db_config,
+                'db_pool': self.db_pool_config,
+                'db_writer': self.db_writer_config,
+                'spool': self.spool_config,
+                'circuit_breaker': self.circuit_breaker_config,
+                'dedup': self.dedup_config,
+                'raw_storage': self.raw_storage_config,
+                'partitions': self.partition_config,
+                'ui_log': self.ui_log_config,
+                'results_display': self.results_display_config,
+                'dashboard': self.dashboard_config,
+                'event_log': self.event_log_config,
                 'socket': self.socket_config,
                 'socket_was_running': self.socket_running,
                 'serial_configs': self.serial_configs,
                 'last_connected_serials': connected_serials,
                 'api': self.api_config,
+                'journal': self.journal_config,
                 'auto_startup_enabled': self.auto_startup_enabled,
                 'last_saved': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
@@ -266,9 +1892,12 @@ class HL7ParserGUI:
             self.log_multi_serial("Testing database connection...")
             try:
                 def test_db():
+                    conn = None
                     try:
-                        conn = psycopg2.connect(**self.db_config)
-                        conn.close()
+                        conn = self.get_db_connection()
+                        cur = conn.cursor()
+                        cur.execute("SELECT 1")
+                        cur.close()
                         self.root.after(0, lambda: self.conn_status.configure(
                             text="✓ Connection successful (auto-tested)", 
                             fg='#27ae60'
@@ -280,6 +1909,9 @@ class HL7ParserGUI:
                             fg='#e74c3c'
                         ))
                         self.root.after(0, lambda: self.log_multi_serial(f"Database connection failed: {str(e)}"))
+                    finally:
+                        if conn:
+                            self.release_db_connection(conn)
                 
                 threading.Thread(target=test_db, daemon=True).start()
                 
@@ -346,6 +1978,8 @@ class HL7ParserGUI:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Open File", command=self.load_file, accelerator="Ctrl+O")
+        file_menu.add_command(label="Replay Traffic Journal...", command=self.replay_traffic_journal)
+        file_menu.add_command(label="View Raw Message...", command=self.view_raw_message)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.exit_application, accelerator="Alt+F4")
         
@@ -362,6 +1996,9 @@ class HL7ParserGUI:
         menubar.add_cascade(label="Database", menu=database_menu)
         database_menu.add_command(label="Test Connection", command=self.test_connection)
         database_menu.add_command(label="Database Settings", command=lambda: self.notebook.select(2))
+        database_menu.add_separator()
+        database_menu.add_command(label="Check Query Plans", command=self.check_query_plans)
+        database_menu.add_command(label="Partition Tables by Month...", command=self.partition_database_tables)
 
         settings_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Settings", menu=settings_menu)
@@ -374,6 +2011,20 @@ class HL7ParserGUI:
             command=self.toggle_auto_startup
         )
         
+        self.journal_enabled_var = tk.BooleanVar(value=self.journal_config['enabled'])
+        settings_menu.add_checkbutton(
+            label="Enable Traffic Journal",
+            variable=self.journal_enabled_var,
+            command=self.toggle_traffic_journal
+        )
+        
+        self.event_log_enabled_var = tk.BooleanVar(value=self.event_log_config['enabled'])
+        settings_menu.add_checkbutton(
+            label="Enable Event Log",
+            variable=self.event_log_enabled_var,
+            command=self.toggle_event_log
+        )
+        
         settings_menu.add_separator()
         settings_menu.add_command(label="Save Configuration Now", command=self.manual_save_config)
         settings_menu.add_command(label="Reset Configuration", command=self.reset_configuration)
@@ -432,7 +2083,9 @@ class HL7ParserGUI:
                 self.socket_config = {'host': '0.0.0.0', 'port': 8080, 'buffer_size': 65536}
                 self.serial_configs = {}
                 self.serial_running = {}
-                self.api_config = {'endpoint': '', 'method': 'POST', 'api_key': '', 'timeout': 30, 'enabled': False}
+                self.api_config.update({'endpoint': '', 'method': 'POST', 'api_key': '', 'timeout': 30,
+                                        'enabled': False, 'auto_send': False, 'pool_size': 4})
+                self.reset_api_session()
                 self.last_connected_serials = []
                 self.socket_was_running = False
                 
@@ -488,6 +2141,7 @@ class HL7ParserGUI:
         self.api_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.api_frame, text="API Integration")
         self.create_api_tab()
+        self.notebook.bind('<<NotebookTabChanged>>', self.render_json_preview, add='+')
 
         self.serial_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.serial_frame, text="Serial Ports")
@@ -501,6 +2155,10 @@ class HL7ParserGUI:
         self.notebook.add(self.customer_frame, text="Customer")
         self.create_customer_tab()
 
+        self.dashboard_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.dashboard_frame, text="Dashboard")
+        self.create_dashboard_tab()
+
     def adjust_ui_for_resolution(self):
         screen_width = self.root.winfo_screenwidth()
         screen_height = self.root.winfo_screenheight()
@@ -807,12 +2465,23 @@ class HL7ParserGUI:
         self.pass_entry.insert(0, self.db_config['password'])
         self.pass_entry.grid(row=3, column=1, pady=5, padx=5, sticky='ew')
         
+        ttk.Label(config_frame, text="Pool Size (min / max):").grid(row=4, column=0, sticky='w', pady=5, padx=5)
+        pool_frame = ttk.Frame(config_frame)
+        pool_frame.grid(row=4, column=1, pady=5, padx=5, sticky='w')
+        self.pool_min_entry = ttk.Entry(pool_frame, width=8)
+        self.pool_min_entry.insert(0, str(self.db_pool_config['minconn']))
+        self.pool_min_entry.pack(side=tk.LEFT)
+        ttk.Label(pool_frame, text=" / ").pack(side=tk.LEFT)
+        self.pool_max_entry = ttk.Entry(pool_frame, width=8)
+        self.pool_max_entry.insert(0, str(self.db_pool_config['maxconn']))
+        self.pool_max_entry.pack(side=tk.LEFT)
+        
         # Buttons
         button_frame = ttk.Frame(config_frame)
-        button_frame.grid(row=4, column=0, columnspan=2, pady=20, sticky='ew')
+        button_frame.grid(row=5, column=0, columnspan=2, pady=20, sticky='ew')
         
         # Configure button columns
-        for i in range(2):
+        for i in range(3):
             button_frame.grid_columnconfigure(i, weight=1)
         
         ttk.Button(
@@ -834,13 +2503,22 @@ class HL7ParserGUI:
             fg='#f39c12',
             font=("Arial", 10)
         )
-        self.conn_status.grid(row=5, column=0, columnspan=2, pady=10, sticky='ew')
+        self.conn_status.grid(row=6, column=0, columnspan=2, pady=10, sticky='ew')
+        
+        self.spool_status_label = tk.Label(
+            config_frame,
+            text="Local spool: 0 pending",
+            fg='#27ae60',
+            font=("Arial", 10)
+        )
+        self.spool_status_label.grid(row=7, column=0, columnspan=2, pady=5, sticky='ew')
 
     def create_results_tab(self):
         # Configure grid weights
         self.results_frame.grid_rowconfigure(0, weight=0)  # Patient info
         self.results_frame.grid_rowconfigure(1, weight=1)  # Results table (expandable)
-        self.results_frame.grid_rowconfigure(2, weight=0)  # Button frame (BARU)
+        self.results_frame.grid_rowconfigure(2, weight=0)  # Latest messages
+        self.results_frame.grid_rowconfigure(3, weight=0)  # Button frame (BARU)
         self.results_frame.grid_columnconfigure(0, weight=1)
         
         # Patient info frame
@@ -888,9 +2566,25 @@ class HL7ParserGUI:
         v_scrollbar.grid(row=0, column=1, sticky='ns')
         h_scrollbar.grid(row=1, column=0, sticky='ew')
         
+        # Latest messages - newest first, updated incrementally; select a row to show it above
+        latest_frame = ttk.LabelFrame(self.results_frame, text="Latest Messages", padding=10)
+        latest_frame.grid(row=2, column=0, padx=10, pady=5, sticky='ew')
+        latest_frame.grid_columnconfigure(0, weight=1)
+        
+        latest_columns = ('Time', 'Device', 'Patient ID', 'Format', 'Results')
+        self.latest_tree = ttk.Treeview(latest_frame, columns=latest_columns, show='headings', height=6)
+        for col in latest_columns:
+            self.latest_tree.heading(col, text=col)
+            self.latest_tree.column(col, width=220 if col == 'Device' else 110, minwidth=80)
+        latest_scrollbar = ttk.Scrollbar(latest_frame, orient=tk.VERTICAL, command=self.latest_tree.yview)
+        self.latest_tree.configure(yscrollcommand=latest_scrollbar.set)
+        self.latest_tree.grid(row=0, column=0, sticky='ew')
+        latest_scrollbar.grid(row=0, column=1, sticky='ns')
+        self.latest_tree.bind('<<TreeviewSelect>>', self.show_selected_latest_message)
+        
         # ===== BARU: BUTTON FRAME =====
         button_frame = ttk.Frame(self.results_frame)
-        button_frame.grid(row=2, column=0, padx=10, pady=10, sticky='ew')
+        button_frame.grid(row=3, column=0, padx=10, pady=10, sticky='ew')
         
         # Configure button columns for responsive layout
         for i in range(3):
@@ -904,6 +2598,12 @@ class HL7ParserGUI:
             style="Accent.TButton"
         ).grid(row=0, column=0, padx=5, sticky='ew')
         
+        ttk.Button(
+            button_frame,
+            text="Follow Latest",
+            command=self.follow_latest_messages
+        ).grid(row=0, column=1, padx=5, sticky='ew')
+        
     def create_api_tab(self):
         """Tab untuk koneksi API"""
         # Configure grid weights
@@ -951,7 +2651,21 @@ class HL7ParserGUI:
             config_frame,
             text="Enable API Integration",
             variable=self.api_enabled_var
-        ).grid(row=4, column=0, columnspan=2, padx=5, pady=10, sticky='w')
+        ).grid(row=4, column=0, padx=5, pady=10, sticky='w')
+        
+        self.api_auto_send_var = tk.BooleanVar(value=self.api_config.get('auto_send', False))
+        ttk.Checkbutton(
+            config_frame,
+            text="Auto-send every parsed message",
+            variable=self.api_auto_send_var
+        ).grid(row=4, column=1, padx=5, pady=10, sticky='w')
+        
+        self.api_gzip_var = tk.BooleanVar(value=self.api_config.get('gzip', False))
+        ttk.Checkbutton(
+            config_frame,
+            text="gzip request bodies",
+            variable=self.api_gzip_var
+        ).grid(row=4, column=2, padx=5, pady=10, sticky='w')
         
         # Control buttons
         button_frame = ttk.Frame(config_frame)
@@ -973,6 +2687,12 @@ class HL7ParserGUI:
             command=self.test_api_connection
         ).grid(row=0, column=1, padx=5, pady=2, sticky='ew')
         
+        ttk.Button(
+            button_frame,
+            text="Delivery Targets...",
+            command=self.show_api_targets
+        ).grid(row=0, column=2, padx=5, pady=2, sticky='ew')
+        
         # API Status
         self.api_status_label = tk.Label(
             config_frame,
@@ -982,6 +2702,15 @@ class HL7ParserGUI:
         )
         self.api_status_label.grid(row=6, column=0, columnspan=3, pady=5, sticky='ew')
         
+        # Automatic delivery statistics
+        self.api_delivery_label = tk.Label(
+            config_frame,
+            text="Auto delivery: idle",
+            fg='#7f8c8d',
+            font=("Arial", 9)
+        )
+        self.api_delivery_label.grid(row=7, column=0, columnspan=3, pady=2, sticky='ew')
+        
         # JSON Payload Preview frame - EXPANDABLE
         preview_frame = ttk.LabelFrame(self.api_frame, text="JSON Payload Preview", padding=10)
         preview_frame.grid(row=1, column=0, padx=10, pady=5, sticky='nsew')
@@ -1027,6 +2756,12 @@ class HL7ParserGUI:
             command=self.copy_json_to_clipboard
         ).grid(row=0, column=2, padx=5, pady=2, sticky='ew')
         
+        ttk.Button(
+            send_frame,
+            text="Retry Dead Letters",
+            command=self.retry_dead_letters
+        ).grid(row=1, column=2, padx=5, pady=2, sticky='ew')
+        
         # API Response Log frame - EXPANDABLE
         log_frame = ttk.LabelFrame(self.api_frame, text="API Response Log", padding=10)
         log_frame.grid(row=3, column=0, padx=10, pady=5, sticky='nsew')
@@ -1191,6 +2926,85 @@ class HL7ParserGUI:
         notebook.add(serial_tab, text="Serial Devices")
         self.create_serial_label_tab(serial_tab)
 
+    def create_dashboard_tab(self):
+        """Tab dashboard: throughput, stage latency and queue depths"""
+        self.dashboard_frame.grid_rowconfigure(1, weight=1)
+        self.dashboard_frame.grid_rowconfigure(2, weight=1)
+        self.dashboard_frame.grid_columnconfigure(0, weight=1)
+        self.dashboard_frame.grid_columnconfigure(1, weight=1)
+        
+        self.dashboard_info_label = tk.Label(
+            self.dashboard_frame,
+            text=f"Rolling window: stages {self.dashboard_config['window_seconds']}s, devices 10s",
+            font=("Arial", 9), fg='#7f8c8d'
+        )
+        self.dashboard_info_label.grid(row=0, column=0, columnspan=2, padx=10, pady=(10, 0), sticky='w')
+        
+        def make_tree(parent, columns, widths):
+            tree = ttk.Treeview(parent, columns=columns, show='headings', height=8)
+            for col, width in zip(columns, widths):
+                tree.heading(col, text=col)
+                tree.column(col, width=width, minwidth=60, anchor='w' if width > 150 else 'e')
+            tree.grid(row=0, column=0, sticky='nsew')
+            parent.grid_rowconfigure(0, weight=1)
+            parent.grid_columnconfigure(0, weight=1)
+            return tree
+        
+        devices_frame = ttk.LabelFrame(self.dashboard_frame, text="Devices", padding=10)
+        devices_frame.grid(row=1, column=0, padx=10, pady=5, sticky='nsew')
+        self.dashboard_devices_tree = make_tree(
+            devices_frame, ('Device', 'Msg/s', 'Bytes/s', 'Total Messages'), (220, 80, 90, 110))
+        
+        queues_frame = ttk.LabelFrame(self.dashboard_frame, text="Queues", padding=10)
+        queues_frame.grid(row=1, column=1, padx=10, pady=5, sticky='nsew')
+        self.dashboard_queues_tree = make_tree(queues_frame, ('Queue', 'Depth'), (220, 90))
+        
+        stages_frame = ttk.LabelFrame(self.dashboard_frame, text="Stage Latency", padding=10)
+        stages_frame.grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky='nsew')
+        self.dashboard_stages_tree = make_tree(
+            stages_frame, ('Stage', 'Count', 'Per Second', 'p50 ms', 'p95 ms', 'p99 ms', 'Error Rate'),
+            (160, 80, 90, 80, 80, 80, 90))
+
+    def refresh_dashboard(self):
+        """Redraw the dashboard from metric snapshots (cheap: fixed-size histograms)"""
+        def upsert(tree, iid, values):
+            if tree.exists(iid):
+                tree.item(iid, values=values)
+            else:
+                tree.insert('', tk.END, iid=iid, values=values)
+        
+        def fmt_ms(value):
+            return "-" if value is None else (f"{value:.2f}" if value < 10 else f"{value:.0f}")
+        
+        try:
+            window = int(self.dashboard_config.get('window_seconds', 60))
+            for stage, (count, errors, p50, p95, p99) in self.pipeline_metrics.stage_snapshot().items():
+                upsert(self.dashboard_stages_tree, stage, (
+                    stage, count, f"{count / window:.2f}", fmt_ms(p50), fmt_ms(p95), fmt_ms(p99),
+                    f"{errors / count * 100:.1f}%" if count else "-"
+                ))
+            
+            for device, (msg_rate, byte_rate, total) in sorted(self.pipeline_metrics.device_snapshot().items()):
+                upsert(self.dashboard_devices_tree, device, (device, f"{msg_rate:.2f}", f"{byte_rate:.0f}", total))
+            
+            queues = [
+                ("DB write queue", self.db_write_queue.qsize()),
+                ("Local spool (pending)", self.save_spool.depth()),
+                ("Local spool (dead)", self.save_spool.dead_count),
+                ("Event log queue", self.event_log.events.qsize()),
+                ("Event log dropped", self.event_log.dropped),
+                ("Traffic journal dropped", self.traffic_journal.dropped),
+                ("UI log buffer", len(self.ui_log_buffer)),
+                ("Results display backlog", len(self.pending_latest_messages)),
+                ("Active threads", threading.active_count()),
+            ]
+            for name, depth in queues:
+                upsert(self.dashboard_queues_tree, name, (name, depth))
+        except Exception:
+            pass
+        
+        self.root.after(int(self.dashboard_config.get('refresh_ms', 1000)), self.refresh_dashboard)
+
     def create_customer_tab(self):
         """Tab untuk Menu Customer"""
         self.customer_frame.grid_rowconfigure(0, weight=1)  # PanedWindow (expandable)
@@ -1373,9 +3187,10 @@ class HL7ParserGUI:
             return
         
         def save_to_db():
+            conn = None
             try:
                 self.update_config()
-                conn = psycopg2.connect(**self.db_config)
+                conn = self.get_db_connection()
                 cur = conn.cursor()
                 
                 # Check if customer exists
@@ -1406,7 +3221,6 @@ class HL7ParserGUI:
                 
                 conn.commit()
                 cur.close()
-                conn.close()
                 
                 self.root.after(0, lambda: messagebox.showinfo(
                     "Success", 
@@ -1430,6 +3244,9 @@ class HL7ParserGUI:
                     "Database Error",
                     f"Failed to save customer:\n{str(e)}"
                 ))
+            finally:
+                if conn:
+                    self.release_db_connection(conn)
         
         threading.Thread(target=save_to_db, daemon=True).start()
 
@@ -1465,9 +3282,10 @@ class HL7ParserGUI:
     def refresh_customer_list(self):
         """Refresh data customer dari database"""
         def fetch_customers():
+            conn = None
             try:
                 self.update_config()
-                conn = psycopg2.connect(**self.db_config)
+                conn = self.get_db_connection()
                 cur = conn.cursor()
                 
                 cur.execute("""
@@ -1480,7 +3298,6 @@ class HL7ParserGUI:
                 
                 customers = cur.fetchall()
                 cur.close()
-                conn.close()
                 
                 self.root.after(0, lambda: self.populate_customer_tree(customers))
                 
@@ -1489,6 +3306,9 @@ class HL7ParserGUI:
                     "Database Error",
                     f"Failed to load customers:\n{str(e)}"
                 ))
+            finally:
+                if conn:
+                    self.release_db_connection(conn)
         
         threading.Thread(target=fetch_customers, daemon=True).start()
 
@@ -1609,9 +3429,10 @@ class HL7ParserGUI:
             return
         
         def delete_from_db():
+            conn = None
             try:
                 self.update_config()
-                conn = psycopg2.connect(**self.db_config)
+                conn = self.get_db_connection()
                 cur = conn.cursor()
                 
                 # Soft delete
@@ -1623,7 +3444,6 @@ class HL7ParserGUI:
                 
                 conn.commit()
                 cur.close()
-                conn.close()
                 
                 self.root.after(0, lambda: messagebox.showinfo(
                     "Success",
@@ -1640,6 +3460,9 @@ class HL7ParserGUI:
                     "Database Error",
                     f"Failed to delete customer:\n{str(e)}"
                 ))
+            finally:
+                if conn:
+                    self.release_db_connection(conn)
         
         threading.Thread(target=delete_from_db, daemon=True).start()
 
@@ -3208,148 +5031,808 @@ class HL7ParserGUI:
             'user': self.user_entry.get(),
             'password': self.pass_entry.get(),
         }
+        try:
+            self.db_pool_config['minconn'] = int(self.pool_min_entry.get())
+            self.db_pool_config['maxconn'] = int(self.pool_max_entry.get())
+        except ValueError:
+            pass
         self.update_status("Database configuration updated")
 
         # Auto-save if enabled
         if self.auto_startup_enabled:
             self.save_app_configuration()
         
+    def get_db_connection(self):
+        """Check out a connection from the shared pool (guarded by the circuit breaker)"""
+        if not self.db_breaker.allow():
+            raise CircuitOpenError("Database circuit breaker is open - failing fast")
+        
+        rebuilt = self.db_pool.configure(
+            self.db_config,
+            minconn=self.db_pool_config['minconn'],
+            maxconn=self.db_pool_config['maxconn'],
+            health_check_interval=self.db_pool_config['health_check_interval']
+        )
+        if rebuilt:
+            # Different database: cached device IDs no longer apply
+            self.invalidate_device_cache()
+            self.raw_codec.reset()
+            self.db_support_ready = False
+        
+        try:
+            conn = self.db_pool.get_connection()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            self.db_breaker.record_failure(e)
+            raise
+        except Exception:
+            self.db_breaker.cancel_probe()
+            raise
+        
+        self.db_breaker.record_success()
+        if not self.db_support_ready:
+            self.start_db_support_setup()
+        return conn
+
+    def start_db_support_setup(self):
+        """Run ensure_db_support_tables on a background thread, at most one at a time
+        
+        Migrations (index builds included) can take long; savers never wait for
+        them and only read the capability flags it sets.
+        """
+        if not self.db_support_lock.acquire(blocking=False):
+            return
+        
+        def worker():
+            conn = None
+            try:
+                if self.db_support_ready:
+                    return
+                conn = self.get_db_connection()
+                self.ensure_db_support_tables(conn)
+            except Exception as e:
+                msg = f"⚠ Database schema setup failed: {str(e)}"
+                self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+            finally:
+                if conn:
+                    self.release_db_connection(conn)
+                self.db_support_lock.release()
+        
+        threading.Thread(target=worker, daemon=True).start()
+
+    def ensure_db_support_tables(self, conn):
+        """Bring the schema up to date and detect which optional tables are usable"""
+        try:
+            applied = self.schema_manager.apply_migrations(conn)
+            if applied:
+                msg = f"Database schema migrated: version(s) {', '.join(str(v) for v in applied)} applied"
+                self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+        except Exception as e:
+            conn.rollback()
+            msg = f"⚠ Database schema migration failed: {str(e)}"
+            self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+        
+        try:
+            cur = conn.cursor()
+            self.db_dedup_available = self.schema_manager.table_exists(cur, 'message_hashes')
+            self.db_raw_available = self.schema_manager.table_exists(cur, 'test_record_raw')
+            if self.db_raw_available:
+                # Resume with the newest dictionary of each format
+                cur.execute("""
+                    SELECT DISTINCT ON (data_format) data_format, dict_id, dictionary
+                    FROM raw_dictionaries
+                    ORDER BY data_format, dict_id DESC
+                """)
+                for data_format, dict_id, dictionary in cur.fetchall():
+                    self.raw_codec.register(data_format, dict_id, bytes(dictionary))
+            self.results_partitioned = self.schema_manager.is_partitioned(cur, 'test_results')
+            conn.commit()
+            cur.close()
+            if self.results_partitioned:
+                self.schema_manager.ensure_partitions(conn, int(self.partition_config.get('months_ahead', 3)))
+        except Exception as e:
+            conn.rollback()
+            msg = f"⚠ Cannot inspect database schema: {str(e)}"
+            self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+        
+        if not self.db_dedup_available:
+            self.root.after(0, lambda: self.log_multi_serial("⚠ message_hashes table missing, DB-side dedup disabled"))
+        if not self.db_raw_available:
+            self.root.after(0, lambda: self.log_multi_serial("⚠ test_record_raw table missing, raw storage disabled"))
+        self.db_support_ready = True
+
+    def check_query_plans(self):
+        """Run the EXPLAIN checks of the bundled schema and show the result"""
+        def worker():
+            conn = None
+            try:
+                self.update_config()
+                conn = self.get_db_connection()
+                cur = conn.cursor()
+                version = self.schema_manager.schema_version(cur)
+                pending = self.schema_manager.pending_versions(cur)
+                conn.commit()
+                cur.close()
+                results = self.schema_manager.check_query_plans(conn)
+            except Exception as e:
+                self.root.after(0, lambda msg=str(e): messagebox.showerror("Query Plan Check", f"Check failed: {msg}"))
+                return
+            finally:
+                if conn:
+                    self.release_db_connection(conn)
+            
+            lines = [f"Schema version: {version}"]
+            if pending:
+                lines.append(f"Pending migrations: {', '.join(str(v) for v in pending)}")
+            lines.append("")
+            for name, ok, detail in results:
+                lines.append(f"{'✓' if ok else '✗'} {name}: {detail}")
+            report = "\n".join(lines)
+            failed = sum(1 for _, ok, _ in results if not ok)
+            if failed:
+                self.root.after(0, lambda: messagebox.showwarning(
+                    "Query Plan Check", f"{failed} lookup(s) cannot use their index:\n\n{report}"))
+            else:
+                self.root.after(0, lambda: messagebox.showinfo("Query Plan Check", report))
+        
+        threading.Thread(target=worker, daemon=True).start()
+
+    def release_db_connection(self, conn, close=False):
+        """Return a connection to the shared pool"""
+        if conn.closed:
+            # The server went away while the connection was in use
+            self.db_breaker.record_failure("connection lost during use")
+        self.db_pool.release(conn, close=close)
+
+    def on_db_breaker_state_change(self, old_state, new_state, reason):
+        """Log circuit breaker transitions (called from any thread)"""
+        msg = f"DB circuit breaker: {old_state.upper()} → {new_state.upper()} ({reason})"
+        self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+
     def test_connection(self):
         """Test database connection"""
         def test_conn():
+            conn = None
             try:
                 self.update_config()
-                conn = psycopg2.connect(**self.db_config)
-                conn.close()
+                conn = self.get_db_connection()
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
                 self.conn_status.configure(text="✓ Connection successful", fg='#27ae60')
                 self.update_status("Database connection test successful")
             except Exception as e:
                 self.conn_status.configure(text=f"✗ Connection failed: {str(e)}", fg='#e74c3c')
                 self.update_status("Database connection test failed")
+            finally:
+                if conn:
+                    self.release_db_connection(conn)
         
         # Run in thread to prevent GUI freezing
         threading.Thread(target=test_conn, daemon=True).start()
         self.conn_status.configure(text="Testing connection...", fg='#f39c12')
 
     def save_to_database_with_context(self, patient, results, data_format, 
-                                        device_type, device_identifier, device_label):
-        """Save data ke database"""
-        def save_data():
+                                        device_type, device_identifier, device_label,
+                                        message_hash=None, raw_data=None, message_id=None):
+        """Queue data for the group-commit database writer, returns a Future"""
+        self.update_config()
+        
+        # FIX: Get device info from device_labels and extract strings
+        device_info = self.device_labels.get(device_type, {}).get(device_identifier, {})
+        if isinstance(device_info, dict):
+            # Extract label as string
+            actual_device_label = device_info.get("label", "")
+            serial_number = device_info.get("serial_number", "")
+            device_category = device_info.get("device_type", "")
+        else:
+            # Old format compatibility (device_info is already a string)
+            actual_device_label = device_info if device_info else ""
+            serial_number = ""
+            device_category = ""
+        
+        # Use default label if empty
+        if not actual_device_label:
+            actual_device_label = f"Unlabeled {device_type.capitalize()} ({device_identifier})"
+        
+        # Parse sample time
+        sample_time = patient.get('sample_time', '').strip()
+        if sample_time:
             try:
-                self.update_config()
-                conn = psycopg2.connect(**self.db_config)
-                cur = conn.cursor()
-                
-                # FIX: Get device info from device_labels and extract strings
-                device_info = self.device_labels[device_type].get(device_identifier, {})
-                if isinstance(device_info, dict):
-                    # Extract label as string
-                    actual_device_label = device_info.get("label", "")
-                    serial_number = device_info.get("serial_number", "")
-                    device_category = device_info.get("device_type", "")
-                else:
-                    # Old format compatibility (device_info is already a string)
-                    actual_device_label = device_info if device_info else ""
-                    serial_number = ""
-                    device_category = ""
-                
-                # Use default label if empty
-                if not actual_device_label:
-                    actual_device_label = f"Unlabeled {device_type.capitalize()} ({device_identifier})"
-                
-                # Get or create device with enhanced information
-                cur.execute("""
-                    SELECT get_or_create_device(
-                        %s::VARCHAR,      -- device_label
-                        %s::VARCHAR,      -- device_type (socket/serial)
-                        %s::VARCHAR,      -- device_identifier (IP/Port)
-                        %s::VARCHAR,      -- serial_number
-                        %s::VARCHAR       -- device_category (Hematology/Chemistry/etc)
-                    )
-                """, (actual_device_label, device_type, device_identifier, serial_number, device_category))
-                
-                device_id = cur.fetchone()[0]
-                
-                # Parse sample time
-                sample_time = patient.get('sample_time', '').strip()
-                if sample_time:
-                    try:
-                        sample_time_dt = datetime.strptime(sample_time, "%Y-%m-%d %H:%M:%S")
-                    except ValueError:
-                        try:
-                            sample_time_dt = datetime.strptime(sample_time, "%Y-%m-%d")
-                        except ValueError:
-                            sample_time_dt = datetime.now()
-                else:
+                sample_time_dt = datetime.strptime(sample_time, "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                try:
+                    sample_time_dt = datetime.strptime(sample_time, "%Y-%m-%d")
+                except ValueError:
                     sample_time_dt = datetime.now()
+        else:
+            sample_time_dt = datetime.now()
+        
+        total_results = len(results) if data_format in ["HL7", "CUSTOM_HL7", "URIT_8030"] else 0
+        result_rows = []
+        if data_format in ["HL7", "CUSTOM_HL7", "URIT_8030"] and len(results) > 0:
+            result_rows = self.build_result_rows(results)
+        
+        job = {
+            'device_key': (device_type, device_identifier, actual_device_label, serial_number, device_category),
+            'device_type': device_type,
+            'device_identifier': device_identifier,
+            'patient_id': patient.get('patient_id', 'Unknown'),
+            'sample_time': sample_time_dt,
+            'data_format': data_format,
+            'total_results': total_results,
+            'result_rows': result_rows,
+            'message_hash': message_hash,
+            'message_id': message_id,
+            'enqueued_at': time.perf_counter(),
+            'future': Future()
+        }
+        if raw_data and self.raw_storage_config.get('enabled', True):
+            job.update(self.compress_raw_message(data_format, raw_data))
+        
+        self.start_db_writer()
+        self.db_write_queue.put(job)
+        return job['future']
+
+    def compress_raw_message(self, data_format, raw_data):
+        """Compressed raw message fields for a save job (base64, so the spool can hold them)"""
+        raw = raw_data.encode('utf-8')
+        if self.raw_storage_config.get('dictionary', True):
+            samples = self.raw_codec.add_sample(data_format, raw)
+            if samples:
+                # Training and the INSERT stay off the receive path; until then messages compress without
+                threading.Thread(target=self.store_raw_dictionary, args=(data_format, samples), daemon=True).start()
+        
+        dict_id, payload = self.raw_codec.compress(data_format, raw)
+        return {
+            'raw_codec': RawMessageCodec.CODEC,
+            'raw_dict_id': dict_id,
+            'raw_size': len(raw),
+            'raw_payload': base64.b64encode(payload).decode('ascii')
+        }
+
+    def store_raw_dictionary(self, data_format, samples):
+        """Train and save a dictionary (background thread); it is only used once it is in the database"""
+        conn = None
+        try:
+            dictionary = self.raw_codec.train(samples)
+            if not dictionary:
+                return
+            conn = self.get_db_connection()
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO raw_dictionaries (data_format, dictionary) VALUES (%s, %s) RETURNING dict_id",
+                (data_format, psycopg2.Binary(dictionary))
+            )
+            dict_id = cur.fetchone()[0]
+            conn.commit()
+            cur.close()
+            self.raw_codec.register(data_format, dict_id, dictionary)
+            msg = f"Raw storage: trained {len(dictionary)} byte dictionary #{dict_id} for {data_format}"
+            self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            # Keep compressing without a dictionary; retrain after the next samples
+            msg = f"⚠ Raw storage: cannot save {data_format} dictionary: {str(e)}"
+            self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+        finally:
+            self.raw_codec.training_done(data_format)
+            if conn:
+                self.release_db_connection(conn)
+
+    def fetch_raw_message(self, record_id):
+        """Return the original raw message of a test record (None if not stored)"""
+        conn = None
+        try:
+            conn = self.get_db_connection()
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT r.codec, r.dict_id, r.payload, d.dictionary
+                FROM test_record_raw r
+                LEFT JOIN raw_dictionaries d ON d.dict_id = r.dict_id
+                WHERE r.record_id = %s
+            """, (record_id,))
+            row = cur.fetchone()
+            cur.close()
+        finally:
+            if conn:
+                self.release_db_connection(conn)
+        if row is None:
+            return None
+        
+        codec, dict_id, payload, dictionary = row
+        if codec != RawMessageCodec.CODEC:
+            raise ValueError(f"Unsupported raw codec: {codec}")
+        if dict_id is not None:
+            self.raw_codec.register(None, dict_id, bytes(dictionary))
+        return self.raw_codec.decompress(bytes(payload), bytes(dictionary) if dictionary else None).decode('utf-8')
+
+    def view_raw_message(self):
+        """Look up and show the stored raw message of a test record"""
+        record_id = simpledialog.askinteger("View Raw Message", "Test record ID:", parent=self.root, minvalue=1)
+        if record_id is None:
+            return
+        
+        def worker():
+            try:
+                raw = self.fetch_raw_message(record_id)
+            except Exception as e:
+                self.root.after(0, lambda msg=str(e): messagebox.showerror("Error", f"Failed to load raw message: {msg}"))
+                return
+            if raw is None:
+                self.root.after(0, lambda: messagebox.showinfo("View Raw Message", f"No raw message stored for record {record_id}"))
+            else:
+                self.root.after(0, lambda: self.show_raw_message(record_id, raw))
+        
+        threading.Thread(target=worker, daemon=True).start()
+
+    def show_raw_message(self, record_id, raw):
+        window = tk.Toplevel(self.root)
+        window.title(f"Raw Message - Record {record_id}")
+        window.geometry("800x500")
+        
+        text = scrolledtext.ScrolledText(window, font=('Consolas', 10), wrap=tk.NONE)
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+        text.insert(1.0, raw.replace('\r', '\n'))
+        text.configure(state=tk.DISABLED)
+        
+        def load_for_parsing():
+            self.hl7_text.configure(state=tk.NORMAL)
+            self.hl7_text.delete(1.0, tk.END)
+            self.hl7_text.insert(1.0, raw)
+            self.hl7_text.configure(state=tk.DISABLED)
+            self.parse_button.configure(state=tk.NORMAL)
+            self.update_status(f"Raw message of record {record_id} loaded")
+            window.destroy()
+        
+        tk.Button(window, text="Load into Parser", command=load_for_parsing,
+                  bg='#007bff', fg='white', font=('Arial', 9, 'bold')).pack(pady=(0, 10))
+
+    def start_db_writer(self):
+        """Start the group-commit writer thread if it is not running"""
+        with self.db_writer_lock:
+            if self.db_writer_thread and self.db_writer_thread.is_alive():
+                return
+            self.db_writer_running = True
+            self.db_writer_thread = threading.Thread(target=self.db_writer_loop, daemon=True)
+            self.db_writer_thread.start()
+
+    def stop_db_writer(self, timeout=10):
+        """Flush queued saves and stop the writer thread"""
+        self.db_writer_running = False
+        if self.db_writer_thread and self.db_writer_thread.is_alive():
+            self.db_writer_thread.join(timeout=timeout)
+
+    def db_writer_loop(self):
+        """Collect queued saves and commit them together (N messages or T ms)"""
+        while self.db_writer_running or not self.db_write_queue.empty():
+            try:
+                job = self.db_write_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            batch = [job]
+            batch_size = max(1, int(self.db_writer_config.get('batch_size', 50)))
+            deadline = time.perf_counter() + self.db_writer_config.get('flush_ms', 200) / 1000.0
+            while len(batch) < batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.db_write_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            self.write_save_batch(batch)
+
+    def execute_save_jobs(self, jobs, keep_device_order=False):
+        """Write jobs in one transaction; a savepoint per message isolates failures
+        
+        Raises if the batch as a whole could not be committed. With keep_device_order,
+        jobs after a failed job of the same device are left out (not attempted).
+        """
+        conn = None
+        outcomes = []
+        failed_devices = set()
+        try:
+            conn = self.get_db_connection()
+            cur = conn.cursor()
+            
+            for job in jobs:
+                device = (job['device_type'], job['device_identifier'])
+                if keep_device_order and device in failed_devices:
+                    continue
                 
-                # Insert test record
-                patient_id = patient.get('patient_id', 'Unknown')
-                total_results = len(results) if data_format in ["HL7", "CUSTOM_HL7", "URIT_8030"] else 0
-                
-                cur.execute("""
-                    INSERT INTO test_records 
-                    (device_id, patient_id, sample_time, data_format, total_results)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING record_id
-                """, (device_id, patient_id, sample_time_dt, data_format, total_results))
-                
-                record_id = cur.fetchone()[0]
-                
-                # Insert test results
-                if data_format in ["HL7", "CUSTOM_HL7", "URIT_8030"] and len(results) > 0:
-                    for r in results:
-                        # MODIFIED: Ensure '-' is saved for all value fields
-                        test_name = r.get('test_name', '')
-                        test_value = r.get('value', '-')
-                        test_units = r.get('units', '-')
-                        test_ref_range = r.get('reference_range', '-')
-                        abnormal_flag = r.get('abnormal_flag', '-')
-                        
-                        # Convert empty strings to '-'
-                        test_value = test_value if test_value and test_value.strip() else '-'
-                        test_units = test_units if test_units and test_units.strip() else '-'
-                        test_ref_range = test_ref_range if test_ref_range and test_ref_range.strip() else '-'
-                        abnormal_flag = abnormal_flag if abnormal_flag and abnormal_flag.strip() else '-'
-                        
+                cur.execute("SAVEPOINT save_job")
+                try:
+                    if job.get('message_hash') and self.db_dedup_available:
+                        # The primary key is the authoritative duplicate check
                         cur.execute("""
-                            INSERT INTO test_results
-                            (record_id, test_name, test_value, test_units, 
-                            reference_range, abnormal_flag)
-                            VALUES (%s, %s, %s, %s, %s, %s)
-                        """, (
-                            record_id,
-                            test_name,
-                            test_value,
-                            test_units,
-                            test_ref_range,
-                            abnormal_flag
-                        ))
-                
-                conn.commit()
-                cur.close()
-                conn.close()
-                
-                # Success message - FIX: Use actual_device_label (string) not device_label (could be dict)
-                success_msg = f"[{device_identifier}] Saved to DB | Record #{record_id} | Device: {actual_device_label}"
-                if serial_number:
-                    success_msg += f" | S/N: {serial_number}"
-                if device_category:
-                    success_msg += f" | Type: {device_category}"
-                if data_format in ["HL7", "CUSTOM_HL7", "URIT_8030"]:
-                    success_msg += f" | Tests: {len(results)}"
+                            INSERT INTO message_hashes (message_hash) VALUES (%s)
+                            ON CONFLICT DO NOTHING
+                            RETURNING message_hash
+                        """, (job['message_hash'],))
+                        if cur.fetchone() is None:
+                            raise DuplicateMessage(job['message_hash'])
+                    
+                    device_id = self.get_device_id(cur, job['device_key'])
+                    record_id = self.insert_test_record(
+                        cur, device_id, job['patient_id'], job['sample_time'], job['data_format'],
+                        job['total_results'], job['result_rows']
+                    )
+                    if job.get('raw_payload') and self.db_raw_available:
+                        cur.execute("""
+                            INSERT INTO test_record_raw (record_id, codec, dict_id, raw_size, payload)
+                            VALUES (%s, %s, %s, %s, %s)
+                        """, (record_id, job['raw_codec'], job['raw_dict_id'], job['raw_size'],
+                              psycopg2.Binary(base64.b64decode(job['raw_payload']))))
+                    cur.execute("RELEASE SAVEPOINT save_job")
+                    outcomes.append((job, device_id, record_id, None))
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    raise
+                except DuplicateMessage as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT save_job")
+                    outcomes.append((job, None, None, e))
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT save_job")
+                    outcomes.append((job, None, None, e))
+                    failed_devices.add(device)
+            
+            conn.commit()
+            cur.close()
+        finally:
+            if conn:
+                self.release_db_connection(conn)
+        
+        for job, device_id, record_id, error in outcomes:
+            if error is None:
+                # Only cache IDs whose device row is committed
+                self.cache_device_id(job['device_key'], device_id)
+        return outcomes
+
+    def write_save_batch(self, batch):
+        """Write a batch from the live queue, spooling whatever cannot be saved"""
+        direct = []
+        for job in batch:
+            # Keep per-device order: once a device has spooled saves, new ones queue behind them
+            if self.save_spool.has_pending(job):
+                self.spool_save_job(job, None)
+            else:
+                direct.append(job)
+        if not direct:
+            return
+        
+        try:
+            outcomes = self.execute_save_jobs(direct)
+        except Exception as e:
+            # Nothing in this batch was committed
+            outcomes = [(job, None, None, e) for job in direct]
+        
+        for job, device_id, record_id, error in outcomes:
+            if error is None:
+                self.report_save_outcome(job, record_id, None, len(direct))
+            elif isinstance(error, DuplicateMessage):
+                self.report_duplicate(job['device_type'], job['device_identifier'], "already in database")
+                self.record_event("db_save", job['device_identifier'], job.get('message_id'),
+                                  (time.perf_counter() - job['enqueued_at']) * 1000, "duplicate")
+                job['future'].set_result(None)
+            else:
+                self.spool_save_job(job, error)
+            if error is None or isinstance(error, DuplicateMessage):
+                self.forget_pending_hash(job)
+
+    def spool_save_job(self, job, error):
+        """Persist a save locally instead of losing it"""
+        device_identifier = job['device_identifier']
+        try:
+            self.save_spool.add(job, error)
+        except Exception as spool_error:
+            self.forget_pending_hash(job)
+            self.report_save_outcome(job, None, spool_error, 1)
+            return
+        
+        self.record_event("db_save", device_identifier, job.get('message_id'),
+                          (time.perf_counter() - job['enqueued_at']) * 1000, "spooled",
+                          error=str(error) if error else None)
+        if error is not None:
+            msg = f"❌ [{device_identifier}] Database save failed: {str(error)} - spooled locally for retry"
+        else:
+            msg = f"[{device_identifier}] Queued behind earlier spooled saves"
+        self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+        if job['device_type'] == 'socket':
+            self.root.after(0, lambda m=msg: self.log_socket_message(m))
+        job['future'].set_result(None)
+
+    def spool_drainer_loop(self):
+        """Replay spooled saves in batches once the database is reachable again"""
+        while self.spool_drainer_running:
+            drained = 0
+            if self.save_spool.depth() > 0 and self.db_config.get('host'):
+                jobs = self.save_spool.fetch(int(self.spool_config.get('drain_batch_size', 100)))
+                try:
+                    outcomes = self.execute_save_jobs(jobs, keep_device_order=True)
+                except Exception:
+                    outcomes = None   # Still unreachable - try again next round
                 
-                self.root.after(0, lambda msg=success_msg: self.log_multi_serial(msg))
-                self.root.after(0, lambda msg=success_msg: self.log_socket_message(msg))
+                for job, device_id, record_id, error in outcomes or []:
+                    if error is None or isinstance(error, DuplicateMessage):
+                        self.save_spool.remove(job)
+                        self.forget_pending_hash(job)
+                        self.record_event("spool_drain", job['device_identifier'], job.get('message_id'),
+                                          None, "saved" if error is None else "duplicate",
+                                          record_id=record_id, attempts=job.get('attempts'))
+                        drained += 1
+                    elif self.save_spool.record_failure(job, error, self.spool_config.get('max_attempts', 10)):
+                        # Parked for good: a retransmission must be able to save it again
+                        self.forget_pending_hash(job)
+                        self.record_event("spool_drain", job['device_identifier'], job.get('message_id'),
+                                          None, "dead_letter", attempts=job.get('attempts'), error=str(error))
+                        msg = (f"❌ [{job['device_identifier']}] Spooled save rejected "
+                               f"{self.spool_config.get('max_attempts', 10)} times - moved to dead letters: {str(error)}")
+                        self.root.after(0, lambda m=msg: self.log_multi_serial(m))
                 
-            except Exception as e:
-                import traceback
-                error_msg = f"❌ Database save failed: {str(e)}"
-                self.root.after(0, lambda msg=error_msg: self.log_multi_serial(msg))
-                print(traceback.format_exc())
+                if drained:
+                    self.spool_drain_history.append((time.time(), drained))
+                    msg = f"Spool drained {drained} saved message(s), {self.save_spool.depth()} pending"
+                    self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+            
+            if time.time() - self.last_db_maintenance > 3600:
+                self.run_db_maintenance()
+            
+            # Keep going while the backlog drains; otherwise poll
+            if not drained:
+                time.sleep(self.spool_config.get('drain_interval', 5))
+
+    def run_db_maintenance(self):
+        """Hourly housekeeping: purge old message hashes, roll partitions forward, apply retention"""
+        self.last_db_maintenance = time.time()
+        if not self.db_config.get('host'):
+            return
+        conn = None
+        try:
+            conn = self.get_db_connection()
+            if self.dedup_config.get('enabled') and self.db_dedup_available:
+                self.purge_message_hashes(conn)
+            if self.results_partitioned:
+                self.maintain_partitions(conn)
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            msg = f"⚠ Database maintenance failed: {str(e)}"
+            self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+        finally:
+            if conn:
+                self.release_db_connection(conn)
+
+    def purge_message_hashes(self, conn):
+        """Drop stored message hashes older than the DB retention period"""
+        cur = conn.cursor()
+        # The database clock stamped received_at
+        cur.execute("SELECT LOCALTIMESTAMP - %s * INTERVAL '1 day'", (self.dedup_config.get('db_retention_days', 30),))
+        cutoff = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+        self.schema_manager.purge_message_hashes(conn, cutoff)
+
+    def maintain_partitions(self, conn):
+        """Create upcoming monthly partitions and retire expired ones"""
+        created = self.schema_manager.ensure_partitions(conn, int(self.partition_config.get('months_ahead', 3)))
+        removed = []
+        keep_months = int(self.partition_config.get('retention_months', 0))
+        if keep_months > 0:
+            removed = self.schema_manager.apply_retention(
+                conn, keep_months, drop=self.partition_config.get('retention_mode') == 'drop'
+            )
+        if created or removed:
+            action = "dropped" if self.partition_config.get('retention_mode') == 'drop' else "detached"
+            msg = (f"Partitions: created {', '.join(created) or 'none'}; "
+                   f"{action} {', '.join(removed) or 'none'}")
+            self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+
+    def partition_database_tables(self):
+        """Convert test_records / test_results to monthly partitions (one-off migration)"""
+        if not messagebox.askyesno(
+            "Partition Tables",
+            "Convert test_records and test_results into monthly partitioned tables?\n\n"
+            "The tables are locked while existing rows are copied. The old tables are kept "
+            "as test_records_legacy / test_results_legacy and can be dropped after checking."
+        ):
+            return
         
-        # Run in background thread
-        threading.Thread(target=save_data, daemon=True).start()
+        def worker():
+            conn = None
+            try:
+                self.update_config()
+                conn = self.get_db_connection()
+                summary = self.schema_manager.migrate_to_partitions(
+                    conn, int(self.partition_config.get('months_ahead', 3))
+                )
+                self.results_partitioned = True
+                self.root.after(0, lambda: messagebox.showinfo("Partition Tables", summary))
+                self.root.after(0, lambda: self.log_multi_serial(summary))
+            except Exception as e:
+                if conn:
+                    conn.rollback()
+                self.root.after(0, lambda msg=str(e): messagebox.showerror("Partition Tables", f"Migration failed: {msg}"))
+            finally:
+                if conn:
+                    self.release_db_connection(conn)
+        
+        threading.Thread(target=worker, daemon=True).start()
+
+    def spool_drain_rate(self, window=60):
+        """Messages per second drained over the last window seconds"""
+        cutoff = time.time() - window
+        return sum(count for ts, count in list(self.spool_drain_history) if ts >= cutoff) / window
+
+    def update_spool_status(self):
+        """Refresh the spool depth / drain rate label"""
+        try:
+            depth = self.save_spool.depth()
+            text = f"Local spool: {depth} pending"
+            if self.save_spool.dead_count:
+                text += f" | {self.save_spool.dead_count} dead"
+            text += f" | Drain rate: {self.spool_drain_rate():.1f} msg/s"
+            if self.db_breaker.state != CircuitBreaker.CLOSED:
+                text += f" | DB circuit: {self.db_breaker.state.upper()}"
+            self.spool_status_label.configure(text=text, fg='#e67e22' if depth else '#27ae60')
+        except Exception:
+            pass
+        self.root.after(1000, self.update_spool_status)
+
+    def report_save_outcome(self, job, record_id, error, batch_size):
+        """Log the result of one queued save and resolve its Future"""
+        device_identifier = job['device_identifier']
+        latency_ms = (time.perf_counter() - job['enqueued_at']) * 1000
+        self.record_event("db_save", device_identifier, job.get('message_id'), latency_ms,
+                          "saved" if error is None else "failed", record_id=record_id,
+                          batch_size=batch_size, error=str(error) if error else None)
+        
+        if error is None:
+            _, _, device_label, serial_number, device_category = job['device_key']
+            success_msg = f"[{device_identifier}] Saved to DB | Record #{record_id} | Device: {device_label}"
+            if serial_number:
+                success_msg += f" | S/N: {serial_number}"
+            if device_category:
+                success_msg += f" | Type: {device_category}"
+            if job['data_format'] in ["HL7", "CUSTOM_HL7", "URIT_8030"]:
+                success_msg += f" | Tests: {len(job['result_rows'])}"
+            success_msg += f" | {latency_ms:.1f} ms (batch of {batch_size})"
+            
+            self.root.after(0, lambda msg=success_msg: self.log_multi_serial(msg))
+            self.root.after(0, lambda msg=success_msg: self.log_socket_message(msg))
+            job['future'].set_result(record_id)
+        else:
+            error_msg = f"❌ [{device_identifier}] Database save failed: {str(error)}"
+            self.root.after(0, lambda msg=error_msg: self.log_multi_serial(msg))
+            if job['device_type'] == 'socket':
+                self.root.after(0, lambda msg=error_msg: self.log_socket_message(msg))
+            job['future'].set_exception(error)
+
+    def get_device_id(self, cur, device_key):
+        """Resolve device_id from the cache, calling get_or_create_device only on a miss"""
+        with self.device_id_cache_lock:
+            device_id = self.device_id_cache.get(device_key)
+        if device_id is not None:
+            return device_id
+        
+        device_type, device_identifier, device_label, serial_number, device_category = device_key
+        cur.execute("""
+            SELECT get_or_create_device(
+                %s::VARCHAR,      -- device_label
+                %s::VARCHAR,      -- device_type (socket/serial)
+                %s::VARCHAR,      -- device_identifier (IP/Port)
+                %s::VARCHAR,      -- serial_number
+                %s::VARCHAR       -- device_category (Hematology/Chemistry/etc)
+            )
+        """, (device_label, device_type, device_identifier, serial_number, device_category))
+        return cur.fetchone()[0]
+
+    def cache_device_id(self, device_key, device_id):
+        with self.device_id_cache_lock:
+            self.device_id_cache[device_key] = device_id
+
+    def invalidate_device_cache(self, device_type=None, device_identifier=None):
+        """Drop cached device IDs for one device, or all of them"""
+        with self.device_id_cache_lock:
+            if device_type is None:
+                self.device_id_cache.clear()
+                return
+            for key in [k for k in self.device_id_cache
+                        if k[0] == device_type and (device_identifier is None or k[1] == device_identifier)]:
+                del self.device_id_cache[key]
+
+    # Panels larger than this are streamed with COPY instead of a multi-row INSERT
+    COPY_RESULTS_THRESHOLD = 200
+    # Partitioned test_results carries sample_time (the partition key) itself
+    results_partitioned = False
+
+    def build_result_rows(self, results):
+        """Normalise parsed results into (name, value, units, range, flag) rows"""
+        rows = []
+        for r in results:
+            # MODIFIED: Ensure '-' is saved for all value fields
+            test_name = r.get('test_name', '')
+            test_value = r.get('value', '-')
+            test_units = r.get('units', '-')
+            test_ref_range = r.get('reference_range', '-')
+            abnormal_flag = r.get('abnormal_flag', '-')
+            
+            # Convert empty strings to '-'
+            test_value = test_value if test_value and test_value.strip() else '-'
+            test_units = test_units if test_units and test_units.strip() else '-'
+            test_ref_range = test_ref_range if test_ref_range and test_ref_range.strip() else '-'
+            abnormal_flag = abnormal_flag if abnormal_flag and abnormal_flag.strip() else '-'
+            
+            rows.append((test_name, test_value, test_units, test_ref_range, abnormal_flag))
+        return rows
+
+    def insert_test_record(self, cur, device_id, patient_id, sample_time_dt, data_format,
+                           total_results, result_rows):
+        """Insert a test record and its results, returning record_id"""
+        record_params = (device_id, patient_id, sample_time_dt, data_format, total_results)
+        
+        if not result_rows or len(result_rows) >= self.COPY_RESULTS_THRESHOLD:
+            cur.execute("""
+                INSERT INTO test_records 
+                (device_id, patient_id, sample_time, data_format, total_results)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING record_id
+            """, record_params)
+            record_id = cur.fetchone()[0]
+            
+            if result_rows:
+                self.copy_test_results(cur, record_id, result_rows, sample_time_dt)
+            return record_id
+        
+        # Single statement: the CTE inserts the record, the VALUES list feeds every result row
+        values_sql = b",".join(
+            cur.mogrify("(%s, %s, %s, %s, %s)", row) for row in result_rows
+        )
+        target_extra, select_extra = (", sample_time", ", rec.sample_time") if self.results_partitioned else ("", "")
+        record_sql = cur.mogrify(f"""
+            WITH rec AS (
+                INSERT INTO test_records 
+                (device_id, patient_id, sample_time, data_format, total_results)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING record_id, sample_time
+            ), res AS (
+                INSERT INTO test_results
+                (record_id, test_name, test_value, test_units, reference_range, abnormal_flag{target_extra})
+                SELECT rec.record_id, v.test_name, v.test_value, v.test_units,
+                       v.reference_range, v.abnormal_flag{select_extra}
+                FROM rec, (VALUES """, record_params)
+        cur.execute(
+            record_sql + values_sql +
+            b""") AS v(test_name, test_value, test_units, reference_range, abnormal_flag)
+            )
+            SELECT record_id FROM rec"""
+        )
+        return cur.fetchone()[0]
+
+    def copy_test_results(self, cur, record_id, result_rows, sample_time_dt=None):
+        """Stream a large panel into test_results with COPY"""
+        def escape(value):
+            if value is None:
+                return '\\N'
+            return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+                    .replace('\n', '\\n').replace('\r', '\\r'))
+        
+        suffix = '\n'
+        columns = "record_id, test_name, test_value, test_units, reference_range, abnormal_flag"
+        if self.results_partitioned:
+            suffix = '\t' + escape(sample_time_dt.isoformat(sep=' ')) + '\n'
+            columns += ", sample_time"
+        
+        buffer = io.StringIO()
+        for row in result_rows:
+            buffer.write(str(record_id) + '\t' + '\t'.join(escape(v) for v in row) + suffix)
+        buffer.seek(0)
+        cur.copy_expert(f"""
+            COPY test_results
+            ({columns})
+            FROM STDIN
+        """, buffer)
 
     def save_to_database(self):
         """Save parsed data to database"""
@@ -3483,6 +5966,9 @@ class HL7ParserGUI:
         device_label = self.device_labels["socket"].get(client_ip, "Unlabeled Device")
         self.log_socket_message(f"Connection from {client_ip} ({device_label})")
         
+        connection_id = self.traffic_journal.new_connection_id()
+        self.traffic_journal.record("open", 'socket', client_ip, connection_id)
+        
         try:
             with client_socket:
                 # Send initial ACK
@@ -3499,12 +5985,17 @@ class HL7ParserGUI:
                 
                 data_buffer = ""
                 last_data_time = time.time()  # NEW: Track last data received
+                message_started = None
                 
                 while self.socket_running:
                     data = client_socket.recv(self.socket_config['buffer_size'])
                     if not data:
                         break
                     
+                    self.traffic_journal.record("chunk", 'socket', client_ip, connection_id, data)
+                    if not data_buffer:
+                        message_started = time.perf_counter()
+                    
                     received_data = data.decode('utf-8', errors='ignore')
                     data_buffer += received_data
                     last_data_time = time.time()  # Update timestamp
@@ -3527,6 +6018,12 @@ class HL7ParserGUI:
                     if is_complete or force_process:
                         complete_data = data_buffer.strip()
                         data_buffer = ""
+                        message_id = self.new_message_id()
+                        self.record_event(
+                            "frame", client_ip, message_id,
+                            (time.perf_counter() - message_started) * 1000 if message_started else None,
+                            "timeout" if force_process else "complete", bytes=len(complete_data)
+                        )
                         
                         if force_process:
                             self.root.after(0, lambda size=len(complete_data): 
@@ -3549,19 +6046,25 @@ class HL7ParserGUI:
                         threading.Thread(
                             target=self.process_and_save_with_context,
                             args=(complete_data, 'socket', client_ip),
+                            kwargs={'message_id': message_id},
                             daemon=True
                         ).start()
                         
                         # Send ACK
+                        ack_started = time.perf_counter()
                         try:
                             ack = "<ACK>\n"
                             client_socket.send(ack.encode('utf-8'))
+                            self.record_event("ack", client_ip, message_id,
+                                              (time.perf_counter() - ack_started) * 1000, "ok")
                             self.root.after(0, lambda: self.log_socket_message(
                                 f"ACK sent to {client_ip}"
                             ))
                         except Exception as e:
-                            self.root.after(0, lambda: self.log_socket_message(
-                                f"Failed to send ACK: {str(e)}"
+                            self.record_event("ack", client_ip, message_id,
+                                              (time.perf_counter() - ack_started) * 1000, "error", error=str(e))
+                            self.root.after(0, lambda msg=str(e): self.log_socket_message(
+                                f"Failed to send ACK: {msg}"
                             ))
                         
                         # Reset timer after processing
@@ -3572,6 +6075,7 @@ class HL7ParserGUI:
                 f"Client handling error for {client_ip}: {str(e)}"
             ))
         finally:
+            self.traffic_journal.record("close", 'socket', client_ip, connection_id)
             self.root.after(0, lambda: self.log_socket_message(
                 f"Connection closed for {client_ip}"
             ))
@@ -3597,14 +6101,9 @@ class HL7ParserGUI:
         self.log_socket_message("Socket server stopped")
     
     def log_socket_message(self, message):
-        """Add message to socket log"""
+        """Add message to socket log (safe from any thread)"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n"
-        
-        self.socket_log.configure(state=tk.NORMAL)
-        self.socket_log.insert(tk.END, log_entry)
-        self.socket_log.see(tk.END)
-        self.socket_log.configure(state=tk.DISABLED)
+        self.ui_log_buffer.append(('socket_log', f"[{timestamp}] {message}\n"))
     
     def display_received_data(self, data):
         """Display received HL7 data"""
@@ -3635,7 +6134,59 @@ class HL7ParserGUI:
             messagebox.showerror("Parse Error", f"Failed to parse socket data: {str(e)}")
             self.log_socket_message(f"Parse error: {str(e)}")
 
-    def process_and_save_with_context(self, raw_data, device_type, device_identifier):
+    def normalize_message(self, raw_data):
+        """Canonical form for hashing: no MLLP framing, unified line endings, no blank lines"""
+        text = raw_data.replace('\x0b', '').replace('\x1c', '')
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return '\n'.join(line.rstrip() for line in text.split('\n') if line.strip())
+
+    def message_digest(self, raw_data):
+        return hashlib.sha256(self.normalize_message(raw_data).encode('utf-8')).digest()
+
+    def is_duplicate_message(self, digest):
+        """Check (and remember) a message; True if it was already received"""
+        message_hash = digest.hex()
+        if self.message_filter.might_contain(digest):
+            with self.pending_hashes_lock:
+                if message_hash in self.pending_message_hashes:
+                    return True
+            # Filter hit may be a false positive - confirm against the database
+            conn = None
+            try:
+                conn = self.get_db_connection()
+                cur = conn.cursor()
+                cur.execute("SELECT 1 FROM message_hashes WHERE message_hash = %s", (message_hash,))
+                found = cur.fetchone() is not None
+                cur.close()
+                if found:
+                    return True
+            except Exception:
+                pass   # Undecided: the unique key still stops a second insert
+            finally:
+                if conn:
+                    self.release_db_connection(conn)
+        
+        self.message_filter.add(digest)
+        with self.pending_hashes_lock:
+            self.pending_message_hashes.add(message_hash)
+        return False
+
+    def forget_pending_hash(self, job):
+        if job.get('message_hash'):
+            with self.pending_hashes_lock:
+                self.pending_message_hashes.discard(job['message_hash'])
+
+    def report_duplicate(self, device_type, device_identifier, reason):
+        """Count and log an ignored retransmission"""
+        self.duplicate_counts[(device_type, device_identifier)] += 1
+        msg = (f"[{device_identifier}] Duplicate message ignored ({reason}) | "
+               f"duplicates from this device: {self.duplicate_counts[(device_type, device_identifier)]}")
+        self.root.after(0, lambda m=msg: self.log_multi_serial(m))
+        if device_type == 'socket':
+            self.root.after(0, lambda m=msg: self.log_socket_message(m))
+
+    def process_and_save_with_context(self, raw_data, device_type, device_identifier, save=True, message_id=None,
+                                      skip_dedup=False):
         """
         Process and save data with explicit device context
         This prevents race conditions when multiple devices send data simultaneously
@@ -3643,7 +6194,12 @@ class HL7ParserGUI:
             raw_data: Raw HL7/ASTM data string
             device_type: 'socket' or 'serial'
             device_identifier: IP address for socket, port name for serial
+            save: False to parse and display only (journal replay)
+            message_id: ID from the receive loop, used to correlate event log entries
+            skip_dedup: save even if the message was already received (journal replay)
         """
+        message_id = message_id or self.new_message_id()
+        stage_started = time.perf_counter()
         try:
             # FIX: Get device label as STRING (not dict)
             device_info = self.device_labels[device_type].get(device_identifier, {})
@@ -3656,11 +6212,29 @@ class HL7ParserGUI:
                 # Old format compatibility (already a string)
                 device_label = device_info if device_info else f"Unlabeled {device_type.capitalize()} ({device_identifier})"
             
+            # STEP 0: Drop retransmissions before parsing (already ACKed by the receive loop)
+            message_hash = None
+            if save and not skip_dedup and self.dedup_config.get('enabled', True):
+                digest = self.message_digest(raw_data)
+                if self.is_duplicate_message(digest):
+                    self.report_duplicate(device_type, device_identifier, "seen recently")
+                    self.record_event("parse", device_identifier, message_id,
+                                      (time.perf_counter() - stage_started) * 1000, "duplicate")
+                    return
+                message_hash = digest.hex()
+            
             self.log_multi_serial(f"[{device_identifier}] Starting processing...")
             
             # STEP 1: Parse data
+            stage_started = time.perf_counter()
             data_format = self.detect_data_format(raw_data)
+            detected = time.perf_counter()
+            self.record_event("detect", device_identifier, message_id, (detected - stage_started) * 1000,
+                              "ok", data_format=data_format)
             patient, results = self.parse_data_auto(raw_data)
+            self.record_event("parse", device_identifier, message_id, (time.perf_counter() - detected) * 1000,
+                              "ok", data_format=data_format, patient_id=patient.get('patient_id'),
+                              results=len(results))
             
             # Map format for display
             format_display = {
@@ -3680,23 +6254,26 @@ class HL7ParserGUI:
             
             # STEP 2: Save to database with explicit device context
             # FIX: Pass device_label as STRING (not dict)
-            self.save_to_database_with_context(
-                patient=patient,
-                results=results,
-                data_format=data_format,
-                device_type=device_type,
-                device_identifier=device_identifier,
-                device_label=device_label  # This is now a STRING
-            )
+            if save:
+                self.save_to_database_with_context(
+                    patient=patient,
+                    results=results,
+                    data_format=data_format,
+                    device_type=device_type,
+                    device_identifier=device_identifier,
+                    device_label=device_label,  # This is now a STRING
+                    message_hash=message_hash,
+                    raw_data=raw_data,
+                    message_id=message_id
+                )
+            
+            # STEP 2b: Automatic API delivery (own payload per message)
+            if save:
+                self.queue_api_delivery(patient, results, data_format, device_identifier, message_id)
             
-            # STEP 3: Update UI display (thread-safe)
+            # STEP 3: Update UI display (coalesced, rendered by the Tk loop)
             device_source = f"{device_label} ({device_identifier})"
-            self.root.after(0, lambda: self.update_results_display_with_context(
-                patient=patient,
-                results=results,
-                data_format=format_display,
-                device_source=device_source
-            ))
+            self.queue_results_display(patient, results, format_display, device_source)
             
             self.log_multi_serial(
                 f"[{device_identifier}] Processing complete | "
@@ -3706,6 +6283,9 @@ class HL7ParserGUI:
         except Exception as e:
             import traceback
             error_detail = traceback.format_exc()
+            self.record_event("parse", device_identifier, message_id,
+                              (time.perf_counter() - stage_started) * 1000, "error",
+                              error=str(e), traceback=error_detail)
             self.log_multi_serial(
                 f"[{device_identifier}] Processing error:\n{error_detail}"
             )
@@ -3793,9 +6373,8 @@ class HL7ParserGUI:
             
             self.patient_info.insert(1.0, patient_text)
             
-            # AUTO-CLEAR: Clear and populate results tree (data lama otomatis terhapus)
-            for item in self.results_tree.get_children():
-                self.results_tree.delete(item)
+            # Reuse existing rows instead of deleting and re-inserting the whole tree
+            rows = []
             
             # Only show results for HL7-based formats
             if data_format in ["HL7", "Custom HL7", "URIT-8030"]:
@@ -3813,7 +6392,7 @@ class HL7ParserGUI:
                     ref_range = ref_range if ref_range and ref_range.strip() else '-'
                     flag = flag if flag and flag.strip() else '-'
                     
-                    self.results_tree.insert('', tk.END, values=(
+                    rows.append((
                         test_name,
                         value,
                         units,
@@ -3821,11 +6400,77 @@ class HL7ParserGUI:
                         flag
                     ))
             
+            items = self.results_tree.get_children()
+            for item, values in zip(items, rows):
+                self.results_tree.item(item, values=values)
+            for values in rows[len(items):]:
+                self.results_tree.insert('', tk.END, values=values)
+            if len(items) > len(rows):
+                self.results_tree.delete(*items[len(rows):])
+            
             self.update_status(f"Results updated: {device_source} - {data_format}")
             
         except Exception as e:
             self.log_multi_serial(f"UI update error: {str(e)}")
 
+    def queue_results_display(self, patient, results, data_format, device_source):
+        """Hand a processed message to the Results tab (safe from any thread)"""
+        entry = (datetime.now().strftime("%H:%M:%S"), patient, results, data_format, device_source)
+        self.pending_results_display = entry
+        self.pending_latest_messages.append(entry)
+
+    def flush_results_display(self):
+        """Render the newest pending message and add new rows to the latest list"""
+        try:
+            entry, self.pending_results_display = self.pending_results_display, None
+            # While a row of the latest list is selected, keep showing that message
+            if entry is not None and not self.latest_tree.selection():
+                _, patient, results, data_format, device_source = entry
+                self.update_results_display_with_context(patient, results, data_format, device_source)
+            
+            new_entries = []
+            while self.pending_latest_messages:
+                new_entries.append(self.pending_latest_messages.popleft())
+            if new_entries:
+                self.add_latest_messages(new_entries)
+        except Exception as e:
+            self.log_multi_serial(f"UI update error: {str(e)}")
+        
+        self.root.after(int(self.results_display_config.get('refresh_ms', 250)), self.flush_results_display)
+
+    def add_latest_messages(self, entries):
+        """Insert new rows at the top of the latest list and drop the oldest beyond the limit"""
+        latest_count = int(self.results_display_config.get('latest_count', 50))
+        for entry in entries[-latest_count:]:
+            received, patient, results, data_format, device_source = entry
+            item = self.latest_tree.insert('', 0, values=(
+                received, device_source, patient.get('patient_id', 'N/A'), data_format, len(results)
+            ))
+            self.latest_message_details[item] = entry
+        
+        items = self.latest_tree.get_children()
+        if len(items) > latest_count:
+            expired = items[latest_count:]
+            self.latest_tree.delete(*expired)
+            for item in expired:
+                self.latest_message_details.pop(item, None)
+
+    def follow_latest_messages(self):
+        """Deselect the latest list so the results table follows new messages again"""
+        self.latest_tree.selection_remove(*self.latest_tree.selection())
+        items = self.latest_tree.get_children()
+        if items:
+            _, patient, results, data_format, device_source = self.latest_message_details[items[0]]
+            self.update_results_display_with_context(patient, results, data_format, device_source)
+
+    def show_selected_latest_message(self, event=None):
+        """Show the selected message of the latest list in the results table"""
+        selection = self.latest_tree.selection()
+        entry = self.latest_message_details.get(selection[0]) if selection else None
+        if entry is not None:
+            _, patient, results, data_format, device_source = entry
+            self.update_results_display_with_context(patient, results, data_format, device_source)
+
     def update_results_display(self):
         """Update results display in Results tab"""
         # Untuk backward compatibility, gunakan fungsi baru
@@ -3891,6 +6536,12 @@ class HL7ParserGUI:
             for item in self.results_tree.get_children():
                 self.results_tree.delete(item)
             
+            # Clear latest messages list
+            self.pending_results_display = None
+            self.pending_latest_messages.clear()
+            self.latest_message_details.clear()
+            self.latest_tree.delete(*self.latest_tree.get_children())
+            
             # Clear stored data
             if hasattr(self, 'patient'):
                 delattr(self, 'patient')
@@ -4394,6 +7045,7 @@ Developed for Monitoring System
         config = self.serial_configs[port_name]
         
         def run_serial():
+            connection_id = None
             try:
                 ser = serial.Serial(
                     port=config['port'],
@@ -4410,6 +7062,9 @@ Developed for Monitoring System
                 self.serial_connections[port_name] = ser
                 self.serial_running[port_name] = True
                 
+                connection_id = self.traffic_journal.new_connection_id()
+                self.traffic_journal.record("open", 'serial', port_name, connection_id)
+                
                 self.root.after(0, lambda: self.log_multi_serial(
                     f"{port_name} connected at {config['baudrate']} baud | Label: {device_label}"
                 ))
@@ -4431,11 +7086,16 @@ Developed for Monitoring System
                 
                 data_buffer = ""
                 last_data_time = time.time()  # NEW: Track last data received
+                message_started = None
                 
                 while self.serial_running.get(port_name, False):
                     try:
                         if ser.in_waiting > 0:
-                            chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
+                            raw_chunk = ser.read(ser.in_waiting)
+                            self.traffic_journal.record("chunk", 'serial', port_name, connection_id, raw_chunk)
+                            if not data_buffer:
+                                message_started = time.perf_counter()
+                            chunk = raw_chunk.decode('utf-8', errors='ignore')
                             data_buffer += chunk
                             last_data_time = time.time()  # Update timestamp
                             time.sleep(0.05)
@@ -4454,6 +7114,12 @@ Developed for Monitoring System
                             if is_complete or force_process:
                                 received_data = data_buffer.strip()
                                 data_buffer = ""
+                                message_id = self.new_message_id()
+                                self.record_event(
+                                    "frame", port_name, message_id,
+                                    (time.perf_counter() - message_started) * 1000 if message_started else None,
+                                    "timeout" if force_process else "complete", bytes=len(received_data)
+                                )
                                 
                                 format_name = {
                                     "URIT_8030": "URIT-8030",
@@ -4486,20 +7152,26 @@ Developed for Monitoring System
                                 threading.Thread(
                                     target=self.process_and_save_with_context,
                                     args=(received_data, 'serial', port_name),
+                                    kwargs={'message_id': message_id},
                                     daemon=True
                                 ).start()
                                 
                                 # Send ACK
+                                ack_started = time.perf_counter()
                                 try:
                                     ack = "<ACK>\n".encode('utf-8')
                                     ser.write(ack)
                                     ser.flush()
+                                    self.record_event("ack", port_name, message_id,
+                                                      (time.perf_counter() - ack_started) * 1000, "ok")
                                     self.root.after(0, lambda fmt=format_name: 
                                         self.log_multi_serial(f"ACK sent to {port_name} ({fmt})")
                                     )
                                 except Exception as e:
-                                    self.root.after(0, lambda: 
-                                        self.log_multi_serial(f"[{port_name}] Failed to send ACK: {str(e)}")
+                                    self.record_event("ack", port_name, message_id,
+                                                      (time.perf_counter() - ack_started) * 1000, "error", error=str(e))
+                                    self.root.after(0, lambda msg=str(e): 
+                                        self.log_multi_serial(f"[{port_name}] Failed to send ACK: {msg}")
                                     )
                                 
                                 # Reset timer
@@ -4515,6 +7187,12 @@ Developed for Monitoring System
                                 # Force process buffered data
                                 received_data = data_buffer.strip()
                                 data_buffer = ""
+                                message_id = self.new_message_id()
+                                self.record_event(
+                                    "frame", port_name, message_id,
+                                    (time.perf_counter() - message_started) * 1000 if message_started else None,
+                                    "timeout", bytes=len(received_data)
+                                )
                                 
                                 self.root.after(0, lambda size=len(received_data): 
                                     self.log_multi_serial(
@@ -4529,6 +7207,7 @@ Developed for Monitoring System
                                 threading.Thread(
                                     target=self.process_and_save_with_context,
                                     args=(received_data, 'serial', port_name),
+                                    kwargs={'message_id': message_id},
                                     daemon=True
                                 ).start()
                                 
@@ -4550,6 +7229,9 @@ Developed for Monitoring System
                 self.serial_running[port_name] = False
                 self.root.after(0, lambda: self.log_multi_serial(f"❌ [{port_name}] Connection failed: {str(e)}"))
                 self.root.after(0, self.update_ports_display)
+            finally:
+                if connection_id:
+                    self.traffic_journal.record("close", 'serial', port_name, connection_id)
         
         thread = threading.Thread(target=run_serial, daemon=True)
         self.serial_threads[port_name] = thread
@@ -4634,14 +7316,9 @@ Developed for Monitoring System
         self.clear_results_display()
 
     def log_multi_serial(self, message):
-        """Log message to multi serial log"""
+        """Log message to multi serial log (safe from any thread)"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n"
-        
-        self.multi_serial_log.configure(state=tk.NORMAL)
-        self.multi_serial_log.insert(tk.END, log_entry)
-        self.multi_serial_log.see(tk.END)
-        self.multi_serial_log.configure(state=tk.DISABLED)
+        self.ui_log_buffer.append(('multi_serial_log', f"[{timestamp}] {message}\n"))
 
     def clear_multi_serial_log(self):
         """Clear multi serial log"""
@@ -4870,6 +7547,7 @@ Developed for Monitoring System
                 "serial_number": serial,
                 "device_type": dev_type
             }
+            self.invalidate_device_cache("socket", ip)
             
             self.save_device_labels()
             self.refresh_socket_label_tree()
@@ -4908,6 +7586,7 @@ Developed for Monitoring System
             ip = item["values"][0]
             if ip in self.device_labels["socket"]:
                 del self.device_labels["socket"][ip]
+                self.invalidate_device_cache("socket", ip)
                 self.save_device_labels()
                 self.refresh_socket_label_tree()
 
@@ -5038,6 +7717,7 @@ Developed for Monitoring System
                 "serial_number": serial,
                 "device_type": dev_type
             }
+            self.invalidate_device_cache("serial", port)
             
             self.save_device_labels()
             self.refresh_serial_label_tree()
@@ -5076,6 +7756,7 @@ Developed for Monitoring System
             port = item["values"][0]
             if port in self.device_labels["serial"]:
                 del self.device_labels["serial"][port]
+                self.invalidate_device_cache("serial", port)
                 self.save_device_labels()
                 self.refresh_serial_label_tree()
 
@@ -5104,6 +7785,7 @@ Developed for Monitoring System
                 "serial_number": "",
                 "device_type": ""
             }
+            self.invalidate_device_cache("socket", ip)
             self.refresh_socket_label_tree()
             self.save_device_labels()
             self.update_status(f"New socket device detected: {ip}")
@@ -5116,6 +7798,7 @@ Developed for Monitoring System
                 "serial_number": "",
                 "device_type": ""
             }
+            self.invalidate_device_cache("serial", port)
             self.refresh_serial_label_tree()
             self.save_device_labels()
             self.update_status(f"New serial device detected: {port}")
@@ -5139,13 +7822,18 @@ Developed for Monitoring System
     def save_api_config(self):
         """Save API configuration"""
         try:
-            self.api_config = {
+            self.api_config.update({
                 'endpoint': self.api_endpoint_entry.get(),
                 'method': self.api_method_var.get(),
                 'api_key': self.api_key_entry.get(),
                 'timeout': int(self.api_timeout_entry.get()),
-                'enabled': self.api_enabled_var.get()
-            }
+                'enabled': self.api_enabled_var.get(),
+                'auto_send': self.api_auto_send_var.get(),
+                'gzip': self.api_gzip_var.get()
+            })
+            self.reset_api_session()
+            if self.api_config['enabled'] and self.api_config['auto_send']:
+                self.start_api_delivery()
             
             status = "enabled" if self.api_config['enabled'] else "disabled"
             self.api_status_label.configure(
@@ -5314,6 +8002,71 @@ Developed for Monitoring System
         threading.Thread(target=test_connection, daemon=True).start()
         self.log_api_response("Testing API connection...")
 
+    # One compact encoder for every payload (no indent, no ASCII escaping)
+    API_PAYLOAD_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), check_circular=False)
+    # Payloads at least this large are gzip-compressed when api_config 'gzip' is on
+    API_GZIP_MIN_BYTES = 1024
+
+    def build_api_payload(self, patient, results, data_format):
+        """Build the API payload dict of one parsed message"""
+        # Base payload
+        payload = {
+            "timestamp": datetime.now().isoformat(),
+            "source": "HL7_Parser_LIMS",
+            "data_format": data_format,
+            "patient": {
+                "patient_id": patient.get("patient_id", ""),
+                "sample_time": patient.get("sample_time", "")
+            }
+        }
+        
+        # FIX: Laboratory results ONLY for HL7 and Custom HL7
+        if data_format in ("HL7", "CUSTOM_HL7", "URIT_8030") and results:
+            payload["patient"]["total_results"] = len(results)
+            laboratory_results = payload["laboratory_results"] = []
+            append = laboratory_results.append
+            
+            for result in results:
+                # Empty values are sent as '-'
+                value = result.get('value', '-')
+                if not value or value.isspace():
+                    value = '-'
+                units = result.get('units', '-')
+                if not units or units.isspace():
+                    units = '-'
+                ref_range = result.get('reference_range', '-')
+                if not ref_range or ref_range.isspace():
+                    ref_range = '-'
+                abnormal_flag, status = self.abnormal_status(result.get('abnormal_flag'))
+                
+                append({
+                    "test_name": result.get('test_name', ''),
+                    "value": value,
+                    "units": units,
+                    "reference_range": ref_range,
+                    "abnormal_flag": abnormal_flag,
+                    "status": status
+                })
+        return payload
+
+    @staticmethod
+    def abnormal_status(abnormal_flag):
+        """(flag or None, 'normal'/'abnormal'): '-', empty, whitespace, N and NORMAL are normal"""
+        if not abnormal_flag or abnormal_flag.isspace() or abnormal_flag == '-':
+            return None, 'normal'
+        return abnormal_flag, 'normal' if abnormal_flag.upper() in ('NORMAL', 'N') else 'abnormal'
+
+    def encode_api_payload(self, patient, results, data_format):
+        """Serialize one message's payload once: compact UTF-8 JSON bytes"""
+        return self.API_PAYLOAD_ENCODER.encode(self.build_api_payload(patient, results, data_format)).encode('utf-8')
+
+    def compress_api_body(self, body, headers):
+        """gzip a request body when enabled and worth it; sets Content-Encoding"""
+        if self.api_config.get('gzip') and len(body) >= self.API_GZIP_MIN_BYTES:
+            headers['Content-Encoding'] = 'gzip'
+            return gzip.compress(body, compresslevel=5)
+        return body
+
     def generate_json_payload(self):
         """Generate JSON payload"""
         if not hasattr(self, 'patient'):
@@ -5323,63 +8076,16 @@ Developed for Monitoring System
         try:
             # Check data format
             data_format = getattr(self, 'current_data_format', 'HL7')
+            self.current_payload_body = self.encode_api_payload(
+                self.patient, getattr(self, 'results', []), data_format
+            )
             
-            # Base payload
-            payload = {
-                "timestamp": datetime.now().isoformat(),
-                "source": "HL7_Parser_LIMS",
-                "data_format": data_format,
-                "patient": {
-                    "patient_id": self.patient.get("patient_id", ""),
-                    "sample_time": self.patient.get("sample_time", "")
-                }
-            }
-            
-            # FIX: Laboratory results ONLY for HL7 and Custom HL7
-            if data_format in ["HL7", "CUSTOM_HL7", "URIT_8030"] and hasattr(self, 'results') and len(self.results) > 0:
-                payload["patient"]["total_results"] = len(self.results)
-                payload["laboratory_results"] = []
-                
-                for result in self.results:
-                    # MODIFIED: Ensure all values are '-'
-                    test_name = result.get('test_name', '')
-                    value = result.get('value', '-')
-                    units = result.get('units', '-')
-                    ref_range = result.get('reference_range', '-')
-                    abnormal_flag = result.get('abnormal_flag', '-')
-                    
-                    # Convert empty strings to '-'
-                    value = value if value and value.strip() else '-'
-                    units = units if units and units.strip() else '-'
-                    ref_range = ref_range if ref_range and ref_range.strip() else '-'
-                    abnormal_flag = abnormal_flag if abnormal_flag and abnormal_flag.strip() else '-'
-
-                    # Determine status (all '-' should be normal)
-                    if abnormal_flag == '-':
-                        status = 'normal'
-                    elif abnormal_flag.upper() in ['NORMAL', 'N', 'normal', 'n', '']:
-                        status = 'normal'
-                    else:
-                        status = 'abnormal'
-
-                    test_data = {
-                        "test_name": test_name,
-                        "value": value,
-                        "units": units,
-                        "reference_range": ref_range,
-                        "abnormal_flag": abnormal_flag if abnormal_flag != '-' else None,
-                        "status": status
-                    }
-                    payload["laboratory_results"].append(test_data)
-            
-            # Display JSON
-            json_formatted = json.dumps(payload, indent=2, ensure_ascii=False)
-            self.json_preview.delete(1.0, tk.END)
-            self.json_preview.insert(1.0, json_formatted)
+            # The same bytes are sent; the pretty preview is rendered when the tab is visible
+            self.json_preview_dirty = True
+            self.render_json_preview()
 
             # Enable send button
             self.send_api_btn.configure(state=tk.NORMAL)
-            self.current_payload = payload
 
             # FIX: Log message
             if data_format in ["ASTM", "BC5300_HL7"]:
@@ -5393,13 +8099,23 @@ Developed for Monitoring System
             messagebox.showerror("Error", f"Failed to generate JSON: {str(e)}")
             self.log_api_response(f"Error generating JSON: {str(e)}")
 
+    def render_json_preview(self, event=None):
+        """Pretty-print the current payload into the preview, only while the API tab is shown"""
+        if not getattr(self, 'json_preview_dirty', False):
+            return
+        if self.notebook.select() != str(self.api_frame):
+            return
+        self.json_preview_dirty = False
+        self.json_preview.delete(1.0, tk.END)
+        self.json_preview.insert(1.0, json.dumps(json.loads(self.current_payload_body), indent=2, ensure_ascii=False))
+
     def send_to_api(self):
         """Send data to API endpoint"""
         if not self.api_config['enabled']:
             messagebox.showwarning("Warning", "API integration is not enabled. Please enable it in API settings.")
             return
         
-        if not hasattr(self, 'current_payload'):
+        if not hasattr(self, 'current_payload_body'):
             messagebox.showwarning("Warning", "Please generate JSON payload first")
             return
         
@@ -5416,28 +8132,15 @@ Developed for Monitoring System
                     f"Sending data to {self.api_config['endpoint']}..."
                 ))
                 
-                # Send request based on method
-                if self.api_config['method'] == 'POST':
-                    response = requests.post(
-                        self.api_config['endpoint'],
-                        json=self.current_payload,
-                        headers=headers,
-                        timeout=self.api_config['timeout']
-                    )
-                elif self.api_config['method'] == 'PUT':
-                    response = requests.put(
-                        self.api_config['endpoint'],
-                        json=self.current_payload,
-                        headers=headers,
-                        timeout=self.api_config['timeout']
-                    )
-                else:  # PATCH
-                    response = requests.patch(
-                        self.api_config['endpoint'],
-                        json=self.current_payload,
-                        headers=headers,
-                        timeout=self.api_config['timeout']
-                    )
+                # Pooled keep-alive session (shared with automatic delivery)
+                body = self.compress_api_body(self.current_payload_body, headers)
+                response = self.get_api_session().request(
+                    self.api_config['method'],
+                    self.api_config['endpoint'],
+                    data=body,
+                    headers=headers,
+                    timeout=self.api_config['timeout']
+                )
                 
                 # Handle response
                 if response.status_code in [200, 201, 202]:
@@ -5474,6 +8177,402 @@ Developed for Monitoring System
         
         threading.Thread(target=send_request, daemon=True).start()
     
+    def get_api_session(self, target_name='default'):
+        """requests.Session of one delivery target, with its own bounded keep-alive pool"""
+        with self.api_session_lock:
+            session = self.api_sessions.get(target_name)
+            if session is None:
+                # One session per target: a slow target cannot hold the connections of another on the same host
+                pool_size = max(1, int(self.api_config.get('pool_size', 4)))
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.api_sessions[target_name] = session
+            return session
+
+    def reset_api_session(self):
+        """Drop the pooled sessions so the next requests use the current settings and targets"""
+        with self.api_session_lock:
+            sessions, self.api_sessions = list(self.api_sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+    def api_delivery_targets(self):
+        """Enabled delivery targets: the main endpoint ('default') plus api_config targets"""
+        targets = []
+        if self.api_config.get('endpoint'):
+            targets.append({
+                'name': 'default', 'endpoint': self.api_config['endpoint'],
+                'method': self.api_config['method'], 'api_key': self.api_config['api_key'],
+                'timeout': self.api_config['timeout'], 'data_formats': [], 'devices': [],
+                'abnormal_only': False
+            })
+        for target in self.api_config.get('targets', []):
+            if target.get('enabled', True) and target.get('name') and target.get('endpoint'):
+                targets.append(target)
+        return targets
+
+    def api_target_accepts(self, target, results, data_format, device_identifier):
+        """Apply a target's data format, device and abnormal-only filters"""
+        if target.get('data_formats') and data_format not in target['data_formats']:
+            return False
+        if target.get('devices') and device_identifier not in target['devices']:
+            return False
+        if target.get('abnormal_only') and not any(
+                self.abnormal_status(r.get('abnormal_flag'))[1] == 'abnormal' for r in results):
+            return False
+        return True
+
+    def start_api_delivery(self):
+        """Start delivery workers for every target (pool_size per target)"""
+        workers = max(1, int(self.api_config.get('pool_size', 4)))
+        for target in self.api_delivery_targets():
+            threads = [t for t in self.api_delivery_threads.get(target['name'], []) if t.is_alive()]
+            for _ in range(workers - len(threads)):
+                thread = threading.Thread(target=self.api_delivery_loop, args=(target['name'],), daemon=True)
+                thread.start()
+                threads.append(thread)
+            self.api_delivery_threads[target['name']] = threads
+
+    def queue_api_delivery(self, patient, results, data_format, device_identifier, message_id):
+        """Serialize this message's payload once and store it in the outbox for each matching target"""
+        if not (self.api_config.get('enabled') and self.api_config.get('auto_send')):
+            return
+        targets = [t for t in self.api_delivery_targets()
+                   if self.api_target_accepts(t, results, data_format, device_identifier)]
+        if not targets:
+            return
+        payload = self.encode_api_payload(patient, results, data_format)
+        for target in targets:
+            try:
+                self.api_outbox.add(target['name'], payload, device_identifier, message_id)
+            except Exception as e:
+                self.record_event("api", device_identifier, message_id, None, "dropped",
+                                  target=target['name'], error=str(e))
+                self.log_api_response(
+                    f"✗ Cannot store payload of {device_identifier} for {target['name']} in the outbox: {str(e)}"
+                )
+
+    def encode_api_batch(self, items, target):
+        """Request body and headers for a batch of outbox items"""
+        headers = {}
+        if target.get('api_key'):
+            headers['Authorization'] = f"Bearer {target['api_key']}"
+        
+        # Stored payloads are compact JSON objects; the key is spliced in without re-encoding
+        bodies = [
+            (item['payload'].encode('utf-8') if isinstance(item['payload'], str) else item['payload'])[:-1]
+            + b',"idempotency_key":"' + item['idempotency_key'].encode('ascii') + b'"}'
+            for item in items
+        ]
+        
+        if len(items) == 1 and int(self.api_config.get('batch_size', 1)) <= 1:
+            # Same body as a manual send, plus the key for server-side dedup
+            headers['Content-Type'] = 'application/json'
+            headers['Idempotency-Key'] = items[0]['idempotency_key']
+            return self.compress_api_body(bodies[0], headers), headers
+        
+        # Each item keeps its own key; the batch key is stable for the same set of items
+        headers['Idempotency-Key'] = hashlib.sha256(
+            ''.join(item['idempotency_key'] for item in items).encode('ascii')).hexdigest()
+        if self.api_config.get('batch_format') == 'ndjson':
+            headers['Content-Type'] = 'application/x-ndjson'
+            body = b'\n'.join(bodies) + b'\n'
+        else:
+            headers['Content-Type'] = 'application/json'
+            body = b'[' + b','.join(bodies) + b']'
+        return self.compress_api_body(body, headers), headers
+
+    def api_delivery_loop(self, target_name):
+        """Worker of one target: claim its due outbox items and deliver them as one request"""
+        while True:
+            target = next((t for t in self.api_delivery_targets() if t['name'] == target_name), None)
+            if target is None:
+                # Target removed or disabled; its items stay in the outbox
+                return
+            if not (self.api_config.get('enabled') and self.api_config.get('auto_send')):
+                time.sleep(1)
+                continue
+            
+            items = self.api_outbox.claim(target_name, max(1, int(self.api_config.get('batch_size', 1))))
+            if not items:
+                self.api_outbox.wait(target_name, 1)
+                continue
+            
+            endpoint = target['endpoint']
+            started = time.perf_counter()
+            error = None
+            retryable = True
+            outcome = None
+            try:
+                body, headers = self.encode_api_batch(items, target)
+                response = self.get_api_session(target_name).request(
+                    target.get('method', 'POST'), endpoint, data=body,
+                    headers=headers, timeout=target.get('timeout', 30)
+                )
+                outcome = self.read_item_statuses(items, response)
+                if outcome is None and response.status_code not in (200, 201, 202, 204):
+                    error = f"HTTP {response.status_code}: {response.text[:200]}"
+                    # Client errors other than timeout / rate limit will not succeed on retry
+                    retryable = not (400 <= response.status_code < 500) or response.status_code in (408, 409, 425, 429)
+            except Exception as e:
+                error = str(e)
+            latency_ms = (time.perf_counter() - started) * 1000
+            
+            if outcome is None:
+                # No per-item statuses: the whole request succeeded or failed
+                outcome = (items, [], []) if error is None else ([], [], items)
+            delivered, rejected, unanswered = outcome
+            
+            self.track_api_delivery(target_name, latency_ms, error is None and not rejected and not unanswered)
+            for item in items:
+                item_error = item.get('rejection') or (error if item not in delivered else None)
+                self.record_event("api", item['device'], item['message_id'], latency_ms,
+                                  "ok" if item in delivered else "error", target=target_name, endpoint=endpoint,
+                                  attempt=item['attempts'] + 1, batch_size=len(items), error=item_error)
+            
+            max_attempts = int(self.api_config.get('max_attempts', 10))
+            backoff = (float(self.api_config.get('backoff_base', 2)), float(self.api_config.get('backoff_max', 300)))
+            if delivered:
+                self.api_outbox.complete(delivered)
+                self.api_delivery_history.append((time.time(), target_name, len(delivered)))
+                self.log_api_response(
+                    f"✓ Delivered {len(delivered)} payload(s) to {target_name} ({endpoint}) in {latency_ms:.0f} ms"
+                )
+            for item in rejected:
+                # Rejected by validation: retrying the same payload cannot succeed
+                self.api_outbox.fail([item], item['rejection'], max_attempts, *backoff, retryable=False)
+            if rejected:
+                self.log_api_response(
+                    f"✗ {target_name} rejected {len(rejected)} payload(s) - moved to dead letters: "
+                    f"{rejected[0]['rejection']}"
+                )
+            if unanswered:
+                reason = error or "No status returned for this item"
+                dead = self.api_outbox.fail(unanswered, reason, max_attempts, *backoff, retryable=retryable)
+                self.log_api_response(
+                    f"✗ Delivery of {len(unanswered)} payload(s) to {target_name} ({endpoint}) failed: {reason}"
+                    + (f" - {len(dead)} moved to dead letters" if dead else " - will retry")
+                )
+
+    def read_item_statuses(self, items, response):
+        """
+        Split a batch by the per-item statuses of a batch endpoint response
+        (data.items[].index / status): (delivered, rejected, unanswered), or None without them
+        """
+        try:
+            statuses = response.json()['data']['items']
+            if not isinstance(statuses, list):
+                return None
+        except Exception:
+            return None
+        
+        by_index = {entry.get('index'): entry for entry in statuses if isinstance(entry, dict)}
+        delivered, rejected, unanswered = [], [], []
+        for index, item in enumerate(items):
+            entry = by_index.get(index)
+            if entry is None:
+                unanswered.append(item)
+            elif entry.get('status') in ('created', 'duplicate'):
+                delivered.append(item)
+            elif entry.get('status') == 'error':
+                item['rejection'] = f"Rejected: {entry.get('message', 'invalid submission')}"
+                rejected.append(item)
+            else:
+                unanswered.append(item)
+        return delivered, rejected, unanswered
+
+    def retry_dead_letters(self):
+        """Put dead-lettered payloads of every target back into the outbox"""
+        count = self.api_outbox.requeue_dead()
+        self.log_api_response(f"{count} dead-lettered payload(s) queued for delivery again")
+
+    def track_api_delivery(self, target_name, latency_ms, success):
+        """Per-target delivery counters and latency histogram"""
+        with self.api_session_lock:
+            stats = self.api_endpoint_stats.get(target_name)
+            if stats is None:
+                stats = self.api_endpoint_stats[target_name] = {
+                    'sent': 0, 'ok': 0, 'latency': RollingHistogram(300)
+                }
+            stats['sent'] += 1
+            stats['ok'] += 1 if success else 0
+            stats['latency'].add(latency_ms, not success)
+
+    def update_api_delivery_status(self):
+        """Refresh the per-target outbox and delivery statistics in the API tab"""
+        try:
+            outbox = self.api_outbox.stats()
+            cutoff = time.time() - 60
+            delivered = Counter()
+            for ts, target_name, count in list(self.api_delivery_history):
+                if ts >= cutoff:
+                    delivered[target_name] += count
+            
+            state = "ON" if self.api_config.get('auto_send') and self.api_config.get('enabled') else "OFF"
+            lines = [f"Auto delivery {state}"]
+            names = [t['name'] for t in self.api_delivery_targets()]
+            names += sorted(set(outbox) - set(names))
+            with self.api_session_lock:
+                for name in names:
+                    pending, oldest, dead = outbox.get(name, (0, None, 0))
+                    line = (
+                        f"{name}: {pending} pending"
+                        + (f", oldest {time.time() - oldest:.0f}s" if oldest else "")
+                        + f", {dead} dead, {delivered[name] / 60:.1f}/s"
+                    )
+                    stats = self.api_endpoint_stats.get(name)
+                    if stats:
+                        count, errors, p50, p95, p99 = stats['latency'].snapshot()
+                        line += (
+                            f" | {stats['sent']} sent, {stats['ok'] / stats['sent'] * 100:.1f}% ok"
+                            f" | p50 {p50 or 0:.0f} ms, p95 {p95 or 0:.0f} ms, p99 {p99 or 0:.0f} ms"
+                        )
+                    lines.append(line)
+            self.api_delivery_label.configure(text="\n".join(lines))
+        except Exception:
+            pass
+        self.root.after(1000, self.update_api_delivery_status)
+
+    def show_api_targets(self):
+        """Dialog to manage the additional delivery targets"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("API Delivery Targets")
+        dialog.geometry("760x520")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        targets = [dict(t) for t in self.api_config.get('targets', [])]
+        
+        list_frame = ttk.LabelFrame(dialog, text="Targets (the main endpoint is delivered as 'default')", padding=10)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        tree = ttk.Treeview(list_frame, columns=("name", "endpoint", "method", "filters", "enabled"),
+                            show="headings", height=6)
+        for col, text, width in (("name", "Name", 110), ("endpoint", "Endpoint", 300), ("method", "Method", 60),
+                                 ("filters", "Filters", 170), ("enabled", "Enabled", 60)):
+            tree.heading(col, text=text)
+            tree.column(col, width=width)
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        form = ttk.LabelFrame(dialog, text="Target", padding=10)
+        form.pack(fill=tk.X, padx=10, pady=5)
+        form.grid_columnconfigure(1, weight=1)
+        form.grid_columnconfigure(3, weight=1)
+        
+        name_var = tk.StringVar()
+        endpoint_var = tk.StringVar()
+        method_var = tk.StringVar(value='POST')
+        key_var = tk.StringVar()
+        timeout_var = tk.StringVar(value='30')
+        formats_var = tk.StringVar()
+        devices_var = tk.StringVar()
+        abnormal_var = tk.BooleanVar(value=False)
+        enabled_var = tk.BooleanVar(value=True)
+        
+        ttk.Label(form, text="Name:").grid(row=0, column=0, sticky='w', padx=5, pady=3)
+        ttk.Entry(form, textvariable=name_var).grid(row=0, column=1, sticky='ew', padx=5, pady=3)
+        ttk.Label(form, text="Method:").grid(row=0, column=2, sticky='w', padx=5, pady=3)
+        ttk.Combobox(form, textvariable=method_var, values=['POST', 'PUT', 'PATCH'],
+                     state='readonly', width=10).grid(row=0, column=3, sticky='w', padx=5, pady=3)
+        ttk.Label(form, text="Endpoint:").grid(row=1, column=0, sticky='w', padx=5, pady=3)
+        ttk.Entry(form, textvariable=endpoint_var).grid(row=1, column=1, columnspan=3, sticky='ew', padx=5, pady=3)
+        ttk.Label(form, text="API Key:").grid(row=2, column=0, sticky='w', padx=5, pady=3)
+        ttk.Entry(form, textvariable=key_var, show="*").grid(row=2, column=1, sticky='ew', padx=5, pady=3)
+        ttk.Label(form, text="Timeout (s):").grid(row=2, column=2, sticky='w', padx=5, pady=3)
+        ttk.Entry(form, textvariable=timeout_var, width=10).grid(row=2, column=3, sticky='w', padx=5, pady=3)
+        ttk.Label(form, text="Data formats:").grid(row=3, column=0, sticky='w', padx=5, pady=3)
+        ttk.Entry(form, textvariable=formats_var).grid(row=3, column=1, sticky='ew', padx=5, pady=3)
+        ttk.Label(form, text="Devices:").grid(row=3, column=2, sticky='w', padx=5, pady=3)
+        ttk.Entry(form, textvariable=devices_var).grid(row=3, column=3, sticky='ew', padx=5, pady=3)
+        ttk.Label(form, text="Comma separated; empty = all", foreground="#7f8c8d").grid(
+            row=4, column=1, columnspan=3, sticky='w', padx=5)
+        ttk.Checkbutton(form, text="Only messages with abnormal results",
+                        variable=abnormal_var).grid(row=5, column=1, sticky='w', padx=5, pady=3)
+        ttk.Checkbutton(form, text="Enabled", variable=enabled_var).grid(row=5, column=3, sticky='w', padx=5, pady=3)
+        
+        def split_list(text):
+            return [v.strip() for v in text.split(',') if v.strip()]
+        
+        def refresh_tree():
+            tree.delete(*tree.get_children())
+            for i, t in enumerate(targets):
+                filters = ", ".join(t.get('data_formats', []) + t.get('devices', [])
+                                    + (['abnormal only'] if t.get('abnormal_only') else [])) or "all"
+                tree.insert("", tk.END, iid=str(i), values=(
+                    t['name'], t['endpoint'], t.get('method', 'POST'), filters,
+                    "Yes" if t.get('enabled', True) else "No"
+                ))
+        
+        def on_select(event=None):
+            selected = tree.selection()
+            if not selected:
+                return
+            t = targets[int(selected[0])]
+            name_var.set(t['name'])
+            endpoint_var.set(t['endpoint'])
+            method_var.set(t.get('method', 'POST'))
+            key_var.set(t.get('api_key', ''))
+            timeout_var.set(str(t.get('timeout', 30)))
+            formats_var.set(", ".join(t.get('data_formats', [])))
+            devices_var.set(", ".join(t.get('devices', [])))
+            abnormal_var.set(t.get('abnormal_only', False))
+            enabled_var.set(t.get('enabled', True))
+        
+        def add_or_update():
+            name = name_var.get().strip()
+            if not name or not endpoint_var.get().strip():
+                messagebox.showwarning("Warning", "Name and endpoint are required", parent=dialog)
+                return
+            if name == 'default':
+                messagebox.showwarning("Warning", "'default' is reserved for the main endpoint", parent=dialog)
+                return
+            try:
+                timeout = int(timeout_var.get())
+            except ValueError:
+                messagebox.showerror("Error", "Invalid timeout value", parent=dialog)
+                return
+            target = {
+                'name': name, 'endpoint': endpoint_var.get().strip(), 'method': method_var.get(),
+                'api_key': key_var.get(), 'timeout': timeout,
+                'data_formats': split_list(formats_var.get()), 'devices': split_list(devices_var.get()),
+                'abnormal_only': abnormal_var.get(), 'enabled': enabled_var.get()
+            }
+            for i, t in enumerate(targets):
+                if t['name'] == name:
+                    targets[i] = target
+                    break
+            else:
+                targets.append(target)
+            refresh_tree()
+        
+        def remove():
+            selected = tree.selection()
+            if selected:
+                del targets[int(selected[0])]
+                refresh_tree()
+        
+        def save_and_close():
+            self.api_config['targets'] = targets
+            self.reset_api_session()
+            if self.api_config['enabled'] and self.api_config.get('auto_send'):
+                self.start_api_delivery()
+            self.log_api_response(f"{len(targets)} additional delivery target(s) saved")
+            if self.auto_startup_enabled:
+                self.save_app_configuration()
+            dialog.destroy()
+        
+        tree.bind('<<TreeviewSelect>>', on_select)
+        
+        btn_frame = ttk.Frame(dialog)
+        btn_frame.pack(fill=tk.X, padx=10, pady=5)
+        for i, (text, command) in enumerate((("Add / Update", add_or_update), ("Remove", remove),
+                                              ("Save", save_and_close), ("Cancel", dialog.destroy))):
+            btn_frame.grid_columnconfigure(i, weight=1)
+            ttk.Button(btn_frame, text=text, command=command).grid(row=0, column=i, padx=5, sticky='ew')
+        
+        refresh_tree()
+
     def copy_json_to_clipboard(self):
         """Copy JSON payload to clipboard"""
         json_text = self.json_preview.get(1.0, tk.END).strip()
@@ -5486,14 +8585,9 @@ Developed for Monitoring System
             messagebox.showwarning("Warning", "No JSON to copy. Generate payload first.")
     
     def log_api_response(self, message):
-        """Log API response message"""
+        """Log API response message (safe from any thread)"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n{'-'*60}\n"
-        
-        self.api_response_log.configure(state=tk.NORMAL)
-        self.api_response_log.insert(tk.END, log_entry)
-        self.api_response_log.see(tk.END)
-        self.api_response_log.configure(state=tk.DISABLED)
+        self.ui_log_buffer.append(('api_response_log', f"[{timestamp}] {message}\n{'-'*60}\n"))
 
     def exit_application(self):
         """Exit application"""
@@ -5513,6 +8607,14 @@ Developed for Monitoring System
         if messagebox.askyesno("Exit Confirmation", 
                             "Are you sure you want to exit the application?", 
                             icon='question'):
+            self.traffic_journal.stop()
+            self.stop_db_writer()
+            self.event_log.stop()
+            self.reset_api_session()
+            self.spool_drainer_running = False
+            self.save_spool.close()
+            self.api_outbox.close()
+            self.db_pool.close()
             self.root.quit()
             self.root.destroy()
     
@@ -5523,6 +8625,241 @@ Developed for Monitoring System
         self.status_label.configure(text=f"{auto_startup_indicator} {message}")
         self.root.update_idletasks()
 
+# 12. ===SETTING TRAFFIC JOURNAL & REPLAY===
+    def apply_journal_config(self):
+        """Apply journal settings and start/stop the writer"""
+        self.traffic_journal.directory = self.journal_config.get('directory', 'traffic_journal')
+        self.traffic_journal.devices = list(self.journal_config.get('devices', []))
+        self.traffic_journal.enabled = bool(self.journal_config.get('enabled', False))
+        if self.traffic_journal.enabled:
+            self.traffic_journal.start()
+
+    def toggle_traffic_journal(self):
+        """Enable or disable raw traffic capture"""
+        self.journal_config['enabled'] = self.journal_enabled_var.get()
+        self.apply_journal_config()
+        
+        if self.journal_config['enabled']:
+            self.log_multi_serial(
+                f"Traffic journal ENABLED - writing to {os.path.abspath(self.traffic_journal.directory)}"
+            )
+        else:
+            self.log_multi_serial("Traffic journal DISABLED")
+        
+        if self.auto_startup_enabled:
+            self.save_app_configuration()
+
+    def apply_event_log_config(self):
+        """Apply event log settings and start the writer"""
+        self.event_log.directory = self.event_log_config.get('directory', 'logs')
+        self.event_log.max_bytes = int(float(self.event_log_config.get('max_mb', 20)) * 1024 * 1024)
+        self.event_log.rotate_hours = float(self.event_log_config.get('rotate_hours', 24))
+        self.event_log.backup_count = int(self.event_log_config.get('backup_count', 30))
+        self.event_log.enabled = bool(self.event_log_config.get('enabled', True))
+        if self.event_log.enabled:
+            self.event_log.start()
+
+    def toggle_event_log(self):
+        """Enable or disable the structured event log"""
+        self.event_log_config['enabled'] = self.event_log_enabled_var.get()
+        self.apply_event_log_config()
+        
+        if self.event_log_config['enabled']:
+            self.log_multi_serial(f"Event log ENABLED - writing to {os.path.abspath(self.event_log.path)}")
+        else:
+            self.log_multi_serial("Event log DISABLED")
+        
+        if self.auto_startup_enabled:
+            self.save_app_configuration()
+
+    def new_message_id(self):
+        """Unique ID that ties together the events of one received message"""
+        return f"{self.message_id_prefix}-{next(self.message_id_counter)}"
+
+    def record_event(self, stage, device=None, message_id=None, duration_ms=None, outcome=None, **fields):
+        """Record one pipeline event (safe and non-blocking from any thread)"""
+        self.pipeline_metrics.observe(stage, device, duration_ms, outcome, fields.get('bytes'))
+        self.event_log.record(stage, device, message_id, duration_ms, outcome, **fields)
+
+    def replay_traffic_journal(self):
+        """Replay a traffic journal through the framing and parsing stack"""
+        filename = filedialog.askopenfilename(
+            title="Select Traffic Journal",
+            initialdir=self.traffic_journal.directory if os.path.isdir(self.traffic_journal.directory) else None,
+            filetypes=[("Traffic journal", "*.jsonl.gz"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        
+        speed_text = simpledialog.askstring(
+            "Replay Speed",
+            "Replay speed:\n\n"
+            "1 = real time\n"
+            "N = N times faster (e.g. 10)\n"
+            "max = as fast as possible",
+            initialvalue="max",
+            parent=self.root
+        )
+        if speed_text is None:
+            return
+        
+        speed_text = speed_text.strip().lower()
+        if speed_text in ("max", "0", ""):
+            speed = 0
+        else:
+            try:
+                speed = float(speed_text.rstrip('x'))
+                if speed <= 0:
+                    raise ValueError(speed_text)
+            except ValueError:
+                messagebox.showerror("Error", f"Invalid replay speed: {speed_text}")
+                return
+        
+        device_filter = simpledialog.askstring(
+            "Replay Device",
+            "Replay only this device (IP or port).\nLeave empty to replay all devices:",
+            parent=self.root
+        )
+        if device_filter is None:
+            return
+        
+        save = messagebox.askyesno(
+            "Replay Target",
+            "Save replayed messages to the database?\n\n"
+            "Yes = full pipeline (parse + save)\n"
+            "No = parse and display only"
+        )
+        # Journaled messages were usually saved live already and would all be dropped as duplicates
+        skip_dedup = save and messagebox.askyesno(
+            "Replay Duplicates",
+            "Bypass the duplicate check?\n\n"
+            "Yes = save every replayed message (e.g. restoring a lost database)\n"
+            "No = skip messages that were already received"
+        )
+        
+        threading.Thread(
+            target=self.run_journal_replay,
+            args=(filename, speed, device_filter.strip() or None, save, skip_dedup),
+            daemon=True
+        ).start()
+
+    def run_journal_replay(self, path, speed, device_filter=None, save=False, skip_dedup=False):
+        """Feed journal chunks through is_complete_message exactly like the receive loops"""
+        speed_label = "max speed" if not speed else f"{speed:g}x"
+        self.root.after(0, lambda: self.log_multi_serial(
+            f"Replay started: {os.path.basename(path)} ({speed_label})"
+        ))
+        
+        buffers = {}
+        last_chunk_ts = {}
+        message_count = 0
+        byte_count = 0
+        first_ts = None
+        start_time = time.time()
+        
+        # A bounded pool: at max speed the journal would otherwise start one thread per message
+        worker_count = min(8, (os.cpu_count() or 2) * 2)
+        workers = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="replay")
+        in_flight = threading.BoundedSemaphore(worker_count * 4)
+        
+        def deliver(data, device_type, device_identifier):
+            in_flight.acquire()
+            future = workers.submit(self.process_and_save_with_context, data, device_type, device_identifier, save,
+                                    skip_dedup=skip_dedup)
+            future.add_done_callback(lambda _: in_flight.release())
+        
+        def looks_like_message(data_buffer):
+            # The receive loops' fallback for devices that never send a terminator
+            return (len(data_buffer) > 100 and
+                    ("MSH" in data_buffer or "OBX" in data_buffer or "STXA" in data_buffer))
+        
+        try:
+            for entry in TrafficJournal.read_entries(path, device_filter):
+                # Pace the replay relative to the original timestamps
+                if speed:
+                    if first_ts is None:
+                        first_ts = entry["ts"]
+                    delay = (entry["ts"] - first_ts) / speed - (time.time() - start_time)
+                    if delay > 0:
+                        time.sleep(delay)
+                
+                key = (entry["device_type"], entry["device"], entry["conn"])
+                
+                if entry["event"] == "chunk":
+                    byte_count += entry["size"]
+                    data_buffer = buffers.get(key, "")
+                    # Over 2 s of silence: the live loop would already have flushed the buffer
+                    if entry["ts"] - last_chunk_ts.get(key, entry["ts"]) > 2.0 and looks_like_message(data_buffer):
+                        deliver(data_buffer.strip(), entry["device_type"], entry["device"])
+                        message_count += 1
+                        data_buffer = ""
+                    last_chunk_ts[key] = entry["ts"]
+                    data_buffer += entry["data"].decode('utf-8', errors='ignore')
+                    is_complete, _ = self.is_complete_message(data_buffer)
+                    if is_complete:
+                        deliver(data_buffer.strip(), entry["device_type"], entry["device"])
+                        message_count += 1
+                        data_buffer = ""
+                    buffers[key] = data_buffer
+                
+                elif entry["event"] == "close":
+                    data_buffer = buffers.pop(key, "")
+                    last_chunk_ts.pop(key, None)
+                    if looks_like_message(data_buffer):
+                        deliver(data_buffer.strip(), entry["device_type"], entry["device"])
+                        message_count += 1
+            
+            for (device_type, device_identifier, _), data_buffer in buffers.items():
+                if looks_like_message(data_buffer):
+                    deliver(data_buffer.strip(), device_type, device_identifier)
+                    message_count += 1
+            
+            workers.shutdown(wait=True)
+            elapsed = max(time.time() - start_time, 0.001)
+            summary = (
+                f"Replay finished: {message_count} messages, {byte_count} bytes in {elapsed:.2f}s "
+                f"({message_count / elapsed:.1f} msg/s)"
+            )
+            self.root.after(0, lambda: self.log_multi_serial(summary))
+            
+        except Exception as e:
+            error_msg = f"❌ Replay failed: {str(e)}"
+            self.root.after(0, lambda msg=error_msg: self.log_multi_serial(msg))
+        finally:
+            workers.shutdown(wait=False)
+
+# 13. ===SETTING UI LOG SINK===
+    def flush_ui_logs(self):
+        """Drain queued log lines into their widgets: one insert and at most one trim per widget"""
+        pending = {}
+        try:
+            while True:
+                widget_name, entry = self.ui_log_buffer.popleft()
+                pending.setdefault(widget_name, []).append(entry)
+        except IndexError:
+            pass
+        
+        max_lines = int(self.ui_log_config.get('max_lines', 5000))
+        for widget_name, entries in pending.items():
+            widget = getattr(self, widget_name, None)
+            if widget is None:
+                # Widget not built yet - keep the lines for the next round
+                self.ui_log_buffer.extend((widget_name, entry) for entry in entries)
+                continue
+            try:
+                widget.configure(state=tk.NORMAL)
+                widget.insert(tk.END, ''.join(entries[-max_lines:]))
+                # Trim once 10% over the cap so deletes stay rare and large
+                line_count = int(widget.index('end-1c').split('.')[0])
+                if line_count > max_lines + max_lines // 10:
+                    widget.delete('1.0', f'{line_count - max_lines + 1}.0')
+                widget.see(tk.END)
+                widget.configure(state=tk.DISABLED)
+            except tk.TclError:
+                pass
+        
+        self.root.after(int(self.ui_log_config.get('flush_ms', 100)), self.flush_ui_logs)
+
 def main():
     root = tk.Tk()
     